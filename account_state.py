@@ -0,0 +1,149 @@
+import os
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from position_book import PositionBook
+
+# Solde d'ouverture d'un compte créé à la première consultation
+INITIAL_BALANCES = {
+    'demo': float(os.environ.get('DEMO_INITIAL_BALANCE', 200)),
+    'real': 0.0,
+}
+
+
+# --- État des comptes (solde, équité, marge) ---
+class AccountState:
+    """Soldes tenus à jour dans le carnet de positions (set_balance) : le
+    P&L et la marge par compte y sont recalculés une fois par tick, la
+    lecture d'un compte est donc O(1) et cohérente avec /api/positions
+    (mêmes colonnes, même tick). Les soldes ne changent qu'en base, par
+    $inc, et la valeur retournée par Mongo est reportée dans le carnet.
+
+    Chaque $inc incrémente aussi `version` : un solde reçu d'un autre
+    worker (apply) ou une réponse arrivée en retard n'écrase jamais un
+    solde plus récent. `on_balance` est appelé après chaque variation."""
+
+    def __init__(self, book: PositionBook, collection_name: str = 'accounts'):
+        self.book = book
+        self.collection_name = collection_name
+        self.as_of: Optional[float] = None
+        self.on_balance: Optional[Callable[[dict], None]] = None
+        # (user_id, account_type) -> {'account_id', 'currency', 'version'}
+        self._accounts: Dict[Tuple[str, str], dict] = {}
+
+    def _track(self, account: dict) -> bool:
+        key = (account['user_id'], account['account_type'])
+        version = account.get('version', 0)
+        known = self._accounts.get(key)
+        if known is not None and known['version'] > version:
+            return False
+        self._accounts[key] = {
+            'account_id': account['account_id'],
+            'currency': account.get('currency', 'EUR'),
+            'version': version,
+        }
+        self.book.set_balance(key[0], key[1], account['balance'])
+        return True
+
+    def tracked(self, user_id: str, account_type: str) -> bool:
+        return (user_id, account_type) in self._accounts
+
+    def record(self, user_id: str, account_type: str) -> Optional[dict]:
+        # Compte tel que publié aux autres workers
+        account = self._accounts.get((user_id, account_type))
+        if account is None:
+            return None
+        return {'user_id': user_id, 'account_type': account_type,
+                'balance': self.book.account_totals(user_id, account_type)['balance'], **account}
+
+    def apply(self, account: dict):
+        self._track(account)
+
+    async def _read(self, db, keys):
+        user_ids = list({user_id for user_id, _ in keys})
+        for start in range(0, len(user_ids), 1000):
+            cursor = db[self.collection_name].find({'user_id': {'$in': user_ids[start:start + 1000]}}, {'_id': 0})
+            async for account in cursor:
+                if (account['user_id'], account['account_type']) in keys:
+                    self._track(account)
+
+    async def load(self, db, keys):
+        """Soldes des seuls comptes demandés (ceux qui ont des positions
+        ouvertes au démarrage) ; les autres sont enregistrés à la demande
+        par ensure(). Les comptes absents de la base sont créés."""
+        keys = set(keys)
+        await self._read(db, keys)
+        for user_id, account_type in keys - set(self._accounts):
+            await self.ensure(db, user_id, account_type)
+
+    async def refresh(self, db):
+        # Relit les soldes des comptes suivis (resynchronisation)
+        await self._read(db, set(self._accounts))
+
+    async def ensure(self, db, user_id: str, account_type: str):
+        # Création paresseuse du compte, une seule lecture par compte et par worker
+        if (user_id, account_type) in self._accounts:
+            return
+        account = await db[self.collection_name].find_one_and_update(
+            {'user_id': user_id, 'account_type': account_type},
+            {'$setOnInsert': {
+                'account_id': str(uuid.uuid4()),
+                'balance': INITIAL_BALANCES.get(account_type, 0.0),
+                'version': 0,
+                'currency': 'EUR',
+                'created_at': datetime.now(),
+            }},
+            projection={'_id': 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        self._track(account)
+
+    async def adjust_balance(self, db, user_id: str, account_type: str, amount: float) -> float:
+        """Variation de solde (P&L réalisé, dépôt, retrait) ; retourne le
+        nouveau solde."""
+        await self.ensure(db, user_id, account_type)
+        account = await db[self.collection_name].find_one_and_update(
+            {'user_id': user_id, 'account_type': account_type},
+            {'$inc': {'balance': round(amount, 2), 'version': 1}},
+            projection={'_id': 0},
+            return_document=ReturnDocument.AFTER,
+        )
+        if self._track(account) and self.on_balance is not None:
+            self.on_balance(self.record(user_id, account_type))
+        return account['balance']
+
+    async def realize(self, db, closed: Dict[Tuple[str, str], float]):
+        # P&L réalisé des positions fermées, cumulé par compte
+        for (user_id, account_type), pnl in closed.items():
+            if pnl:
+                await self.adjust_balance(db, user_id, account_type, pnl)
+
+    def on_tick(self, ts: float):
+        self.as_of = ts
+
+    def free_margin(self, user_id: str, account_type: str) -> float:
+        totals = self.book.account_totals(user_id, account_type)
+        return totals['equity'] - totals['margin']
+
+    def snapshot(self, user_id: str, account_type: str) -> dict:
+        account = self._accounts.get((user_id, account_type), {})
+        totals = self.book.account_totals(user_id, account_type)
+        free_margin = totals['equity'] - totals['margin']
+        return {
+            "user_id": user_id,
+            "account_id": account.get('account_id'),
+            "account_type": account_type,
+            "balance": round(totals['balance'], 2),
+            "equity": round(totals['equity'], 2),
+            "margin": round(totals['margin'], 2),
+            "free_margin": round(free_margin, 2),
+            "margin_level": round(100 * totals['equity'] / totals['margin'], 2) if totals['margin'] else None,
+            "profit_loss": round(totals['profit_loss'], 2),
+            "open_positions": self.book.position_count(user_id, account_type),
+            "currency": account.get('currency', 'EUR'),
+            "as_of": self.as_of,
+        }
@@ -0,0 +1,198 @@
+import asyncio
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+
+import orjson
+
+from account_state import AccountState
+from position_book import PositionBook
+
+HEARTBEAT_INTERVAL = 15
+
+
+def sse(event: str, data: dict) -> str:
+    # Même encodage que ORJSONResponse (/api/positions) : datetimes en ISO 8601
+    payload = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY, default=str)
+    return f"event: {event}\ndata: {payload.decode()}\n\n"
+
+
+# --- Abonné SSE d'un compte ---
+class AccountSubscriber:
+    """Deltas en attente d'envoi, regroupés par clé : plusieurs mises à jour
+    d'une même position entre deux envois n'en font qu'une. Un P&L n'est
+    signalé que s'il a bougé d'au moins `pnl_threshold` depuis le dernier
+    envoi."""
+
+    def __init__(self, user_id: str, account_type: str, pnl_threshold: float):
+        self.key = (user_id, account_type)
+        self.pnl_threshold = pnl_threshold
+        self.frames = 0
+        self.coalesced = 0
+        self._sent_pnl: Dict[str, float] = {}
+        self._sent_account: Optional[Tuple[float, float]] = None
+        self._opened: Dict[str, dict] = {}
+        self._closed: Dict[str, dict] = {}
+        self._updated: Dict[str, dict] = {}
+        self._account: Optional[dict] = None
+        self._alerts = []
+        self._ready = asyncio.Event()
+
+    def _queue(self, pending: dict, key, value):
+        if key in pending:
+            self.coalesced += 1
+        pending[key] = value
+        self._ready.set()
+
+    def seen(self, positions):
+        # Positions déjà transmises dans l'instantané initial
+        for position in positions:
+            self._sent_pnl[position['position_id']] = position['profit_loss']
+
+    def opened(self, position: dict):
+        self._sent_pnl[position['position_id']] = position.get('profit_loss', 0.0)
+        self._queue(self._opened, position['position_id'], position)
+
+    def closed(self, position_id: str, fields: dict):
+        self._sent_pnl.pop(position_id, None)
+        self._updated.pop(position_id, None)
+        if self._opened.pop(position_id, None) is not None:
+            # Ouverte et fermée entre deux envois : le client ne l'a jamais vue
+            return
+        self._queue(self._closed, position_id, {"position_id": position_id, **fields})
+
+    def pnl(self, position: dict):
+        position_id = position['position_id']
+        sent = self._sent_pnl.get(position_id)
+        if sent is None or abs(position['profit_loss'] - sent) < self.pnl_threshold:
+            return
+        self._sent_pnl[position_id] = position['profit_loss']
+        self._queue(self._updated, position_id, {
+            "position_id": position_id,
+            "current_price": position['current_price'],
+            "profit_loss": position['profit_loss'],
+        })
+
+    def account(self, snapshot: dict):
+        sent = self._sent_account
+        if sent is not None and sent[0] == snapshot['balance'] and abs(snapshot['equity'] - sent[1]) < self.pnl_threshold:
+            return
+        self._sent_account = (snapshot['balance'], snapshot['equity'])
+        if self._account is not None:
+            self.coalesced += 1
+        self._account = snapshot
+        self._ready.set()
+
+    def alert(self, event: dict):
+        self._alerts.append(event)
+        self._ready.set()
+
+    async def wait(self):
+        await self._ready.wait()
+
+    def take(self) -> Optional[dict]:
+        self._ready.clear()
+        delta = {}
+        for name, pending in (('opened', self._opened), ('closed', self._closed), ('updated', self._updated)):
+            if pending:
+                delta[name] = list(pending.values())
+                pending.clear()
+        if self._account is not None:
+            delta['account'], self._account = self._account, None
+        if self._alerts:
+            delta['alerts'], self._alerts = self._alerts, []
+        if delta:
+            self.frames += 1
+        return delta or None
+
+
+# --- Diffusion par compte ---
+class AccountStreamHub:
+    """Flux SSE par compte : instantané à la connexion puis uniquement des
+    deltas (ouvertures, fermetures, variations de P&L et de compte), au plus
+    `max_rate` trames par seconde et par connexion. Le travail par tick ne
+    porte que sur les comptes ayant au moins un abonné."""
+
+    def __init__(self, book: PositionBook, accounts: AccountState, max_rate: float = 2.0,
+                 pnl_threshold: float = 0.01, max_subscribers: int = 10000):
+        self.book = book
+        self.accounts = accounts
+        self.max_rate = max_rate
+        self.pnl_threshold = pnl_threshold
+        self.max_subscribers = max_subscribers
+        self._subscribers: Dict[Tuple[str, str], Set[AccountSubscriber]] = {}
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    @property
+    def full(self) -> bool:
+        return self.subscriber_count >= self.max_subscribers
+
+    def _for(self, user_id: str, account_type: str) -> Set[AccountSubscriber]:
+        return self._subscribers.get((user_id, account_type), set())
+
+    def position_opened(self, position: dict):
+        for subscriber in self._for(position['user_id'], position['account_type']):
+            subscriber.opened(dict(position))
+
+    def position_closed(self, position: dict, fields: dict):
+        for subscriber in self._for(position['user_id'], position['account_type']):
+            subscriber.closed(position['position_id'], fields)
+
+    def risk_event(self, event: dict):
+        for subscriber in self._for(event['user_id'], event['account_type']):
+            subscriber.alert(event)
+
+    def on_tick(self):
+        for (user_id, account_type), subscribers in self._subscribers.items():
+            positions = self.book.for_account(user_id, account_type)
+            snapshot = self.accounts.snapshot(user_id, account_type)
+            for subscriber in subscribers:
+                for position in positions:
+                    subscriber.pnl(position)
+                subscriber.account(snapshot)
+
+    def subscribe(self, user_id: str, account_type: str) -> AccountSubscriber:
+        subscriber = AccountSubscriber(user_id, account_type, self.pnl_threshold)
+        self._subscribers.setdefault(subscriber.key, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: AccountSubscriber):
+        subscribers = self._subscribers.get(subscriber.key)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[subscriber.key]
+
+    def stats(self) -> dict:
+        subscribers = [s for group in self._subscribers.values() for s in group]
+        return {
+            "accounts": len(self._subscribers),
+            "subscribers": len(subscribers),
+            "frames": sum(s.frames for s in subscribers),
+            "coalesced": sum(s.coalesced for s in subscribers),
+        }
+
+    async def events(self, user_id: str, account_type: str) -> AsyncIterator[str]:
+        subscriber = self.subscribe(user_id, account_type)
+        try:
+            positions = self.book.for_account(user_id, account_type)
+            subscriber.seen(positions)
+            yield sse('snapshot', {
+                "positions": positions,
+                "account": self.accounts.snapshot(user_id, account_type),
+            })
+            interval = 1 / self.max_rate
+            while True:
+                try:
+                    await asyncio.wait_for(subscriber.wait(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                delta = subscriber.take()
+                if delta:
+                    yield sse('delta', delta)
+                # Les changements s'accumulent pendant la pause : au plus max_rate trames/s
+                await asyncio.sleep(interval)
+        finally:
+            self.unsubscribe(subscriber)
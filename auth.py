@@ -1,22 +1,18 @@
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel, EmailStr
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
 import datetime
 
-load_dotenv()
+from database import db
+from password_hashing import verify_password_async
+from user_cache import decode_token, get_user_by_id
 
-# --- MongoDB client (à adapter selon ton projet) ---
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client.forex_broker
+load_dotenv()
 
 # --- Sécurité ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # --- Clé secrète JWT + algo ---
@@ -36,12 +32,6 @@ class UserInDB(BaseModel):
 
 # --- Fonctions d'authentification ---
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
 async def get_user_by_email(email: str) -> UserInDB | None:
     user = await db.users.find_one({"email": email})
     if user:
@@ -64,7 +54,7 @@ async def authenticate_user(email: str, password: str):
     user = await get_user_by_email(email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return False
     if not user.is_active:
         return False
@@ -77,7 +67,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token, SECRET_KEY, ALGORITHM)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise credentials_exception
@@ -85,8 +75,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
 
-    user_data = await db.users.find_one({"user_id": token_data.user_id})
-    if user_data is None:
+    user_data = await get_user_by_id(db, token_data.user_id)
+    if user_data is None or not user_data.get("is_active", True):
         raise credentials_exception
     return user_data
 
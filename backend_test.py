@@ -752,10 +752,10 @@ class ForexBrokerAuthTester:
             headers=self.get_auth_headers(self.user1_token)
         )
         
-        if success and isinstance(response, list):
-            print(f"   Found {len(response)} closed positions in history")
+        if success and isinstance(response, dict) and isinstance(response.get('items'), list):
+            print(f"   Found {len(response['items'])} closed positions in history")
             
-            for position in response:
+            for position in response['items']:
                 if position.get('status') == 'closed':
                     close_reason = position.get('close_reason', 'Unknown')
                     close_price = position.get('close_price')
@@ -960,7 +960,7 @@ class ForexBrokerAuthTester:
                         auto_closed = any(
                             pos.get('position_id') == position_id and 
                             pos.get('close_reason') == 'Stop Loss'
-                            for pos in history
+                            for pos in history.get('items', [])
                         )
                         if auto_closed:
                             print("   ✅ Confirmed: Position auto-closed by Stop Loss")
@@ -0,0 +1,265 @@
+import os
+import json
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+import typer
+from pydantic import BaseModel, Field
+
+from candles import TIMEFRAMES
+from position_book import pip_value
+
+MAX_PARAMETER_SETS = 20000
+# Borne jeux x points de courbe : taille du tableau des courbes et de la réponse JSON
+MAX_CURVE_VALUES = 2_000_000
+# Borne de l'historique chargé depuis la base (ticks ou bougies), ~11 jours de ticks à la seconde
+MAX_BACKTEST_TICKS = int(os.environ.get('MAX_BACKTEST_TICKS', 1_000_000))
+
+
+# --- Requête de backtest ---
+class BacktestRequest(BaseModel):
+    symbol: str
+    start: Optional[datetime] = None  # None = pas de borne
+    end: Optional[datetime] = None
+    source: str = 'ticks'  # 'ticks' ou 'candles'
+    tf: str = '1m'
+    sides: List[str] = ['buy', 'sell']
+    sl_pips: List[float] = [10.0]  # 0 = pas de Stop Loss
+    tp_pips: List[float] = [20.0]  # 0 = pas de Take Profit
+    leverage: List[float] = [100.0]
+    volume: List[float] = [0.01]
+    initial_balance: float = 200.0
+    curve_points: int = Field(200, ge=2, le=5000)
+
+
+def grid_size(request: BacktestRequest) -> int:
+    return (len(request.sides) * len(request.sl_pips) * len(request.tp_pips)
+            * len(request.leverage) * len(request.volume))
+
+
+def parameter_grid(request: BacktestRequest) -> Dict[str, np.ndarray]:
+    """Produit cartésien des paramètres, une colonne par paramètre. Les
+    limites sont vérifiées sur la taille annoncée, avant toute allocation."""
+    n_sets = grid_size(request)
+    if n_sets > MAX_PARAMETER_SETS:
+        raise ValueError(f"Trop de combinaisons (max {MAX_PARAMETER_SETS})")
+    if n_sets * request.curve_points > MAX_CURVE_VALUES:
+        raise ValueError(f"Trop de points de courbe : combinaisons x curve_points limité à {MAX_CURVE_VALUES}")
+    sides = [1.0 if side == 'buy' else -1.0 for side in request.sides]
+    mesh = np.meshgrid(sides, request.sl_pips, request.tp_pips, request.leverage, request.volume, indexing='ij')
+    names = ('side', 'sl_pips', 'tp_pips', 'leverage', 'volume')
+    return {name: values.ravel().astype(np.float64) for name, values in zip(names, mesh)}
+
+
+# --- Chargement de l'historique ---
+def time_filter(start: Optional[datetime], end: Optional[datetime], convert=lambda value: value) -> dict:
+    # Bornes absentes laissées hors de la requête
+    bounds = {}
+    if start is not None:
+        bounds["$gte"] = convert(start)
+    if end is not None:
+        bounds["$lte"] = convert(end)
+    return {"time": bounds} if bounds else {}
+
+
+async def check_history_size(collection, query: dict):
+    # Vérifié avant tout chargement ; comptage borné, sans parcourir tout l'historique
+    if await collection.count_documents(query, limit=MAX_BACKTEST_TICKS + 1) > MAX_BACKTEST_TICKS:
+        raise ValueError(f"Historique trop long (max {MAX_BACKTEST_TICKS} points), réduisez la période")
+
+
+async def load_ticks(db, symbol: str, start: Optional[datetime], end: Optional[datetime]):
+    query = {"symbol": symbol, **time_filter(start, end)}
+    await check_history_size(db.ticks, query)
+    cursor = db.ticks.find(
+        query, {"_id": 0, "time": 1, "bid": 1, "ask": 1},
+    ).sort("time", 1).limit(MAX_BACKTEST_TICKS).batch_size(10000)
+    times, bids, asks = [], [], []
+    async for tick in cursor:
+        times.append(tick['time'].replace(tzinfo=timezone.utc).timestamp())
+        bids.append(tick['bid'])
+        asks.append(tick['ask'])
+    return np.array(times), np.array(bids), np.array(asks)
+
+
+async def load_candles(db, symbol: str, tf: str, start: Optional[datetime], end: Optional[datetime]):
+    # Bougies : le cours de clôture sert de bid et d'ask (spread 0)
+    query = {"symbol": symbol, "tf": tf, **time_filter(start, end, datetime.timestamp)}
+    await check_history_size(db.candles, query)
+    cursor = db.candles.find(
+        query, {"_id": 0, "time": 1, "close": 1},
+    ).sort("time", 1).limit(MAX_BACKTEST_TICKS).batch_size(10000)
+    times, closes = [], []
+    async for bar in cursor:
+        times.append(float(bar['time']))
+        closes.append(bar['close'])
+    closes = np.array(closes)
+    return np.array(times), closes, closes
+
+
+def load_tick_files(paths: List[str], symbol: str):
+    from tick_replay import iter_tick_chunks
+
+    chunks = [chunk[chunk['symbol'] == symbol] for path in paths for chunk in iter_tick_chunks(path)]
+    if not chunks:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+    times = np.concatenate([chunk['time'].to_numpy(np.float64) for chunk in chunks])
+    bids = np.concatenate([chunk['bid'].to_numpy(np.float64) for chunk in chunks])
+    asks = np.concatenate([chunk['ask'].to_numpy(np.float64) for chunk in chunks])
+    return times, bids, asks
+
+
+# --- Moteur vectorisé ---
+def run_backtest(times: np.ndarray, bid: np.ndarray, ask: np.ndarray, grid: Dict[str, np.ndarray],
+                 pip_size: float, initial_balance: float = 200.0, curve_points: int = 200) -> dict:
+    """Rejoue l'historique pour tous les jeux de paramètres à la fois (une
+    colonne NumPy par jeu). Mêmes règles que place_order()/get_positions() :
+    entrée à l'ask (BUY) ou au bid (SELL), sortie au bid (BUY) ou à l'ask
+    (SELL), P&L = écart * volume * levier. Stratégie : toujours en position,
+    réouverture au même tick après un SL/TP, compte arrêté si l'équité
+    tombe à zéro."""
+    n_ticks, n_sets = len(bid), len(grid['side'])
+    if n_ticks < 2:
+        raise ValueError("Historique insuffisant")
+
+    side = grid['side']
+    is_buy = side > 0
+    exposure = grid['volume'] * grid['leverage']
+    sl_dist = np.where(grid['sl_pips'] > 0, grid['sl_pips'] * pip_size, np.inf)
+    tp_dist = np.where(grid['tp_pips'] > 0, grid['tp_pips'] * pip_size, np.inf)
+
+    open_price = np.where(is_buy, ask[0], bid[0])
+    alive = np.ones(n_sets, dtype=bool)
+    realized = np.zeros(n_sets)
+    trades = np.zeros(n_sets, dtype=np.int64)
+    wins = np.zeros(n_sets, dtype=np.int64)
+    gross_profit = np.zeros(n_sets)
+    gross_loss = np.zeros(n_sets)
+    peak = np.full(n_sets, initial_balance)
+    max_drawdown = np.zeros(n_sets)
+    equity = np.full(n_sets, initial_balance)
+
+    sample_at = np.unique(np.linspace(0, n_ticks - 1, min(curve_points, n_ticks)).astype(np.int64))
+    curve = np.empty((len(sample_at), n_sets))
+    curve[0] = initial_balance
+    next_sample = 1
+
+    for t in range(1, n_ticks):
+        b, a = bid[t], ask[t]
+        exit_price = np.where(is_buy, b, a)
+        move = side * (exit_price - open_price)
+        closing = alive & ((move <= -sl_dist) | (move >= tp_dist))
+        if closing.any():
+            pnl = move[closing] * exposure[closing]
+            realized[closing] += pnl
+            trades[closing] += 1
+            wins[closing] += pnl > 0
+            gross_profit[closing] += np.maximum(pnl, 0)
+            gross_loss[closing] -= np.minimum(pnl, 0)
+            open_price[closing] = np.where(is_buy[closing], a, b)
+            move[closing] = side[closing] * (exit_price[closing] - open_price[closing])
+
+        equity = np.where(alive, initial_balance + realized + move * exposure, equity)
+        blown = alive & (equity <= 0)
+        if blown.any():
+            # Liquidation : la perte flottante est réalisée, le jeu s'arrête
+            realized[blown] = equity[blown] - initial_balance
+            trades[blown] += 1
+            gross_loss[blown] -= np.minimum(move[blown] * exposure[blown], 0)
+            alive &= ~blown
+        np.maximum(peak, equity, out=peak)
+        np.maximum(max_drawdown, peak - equity, out=max_drawdown)
+
+        if next_sample < len(sample_at) and sample_at[next_sample] == t:
+            curve[next_sample] = equity
+            next_sample += 1
+
+    results = []
+    for i in range(n_sets):
+        results.append({
+            "side": 'buy' if is_buy[i] else 'sell',
+            "sl_pips": float(grid['sl_pips'][i]),
+            "tp_pips": float(grid['tp_pips'][i]),
+            "leverage": float(grid['leverage'][i]),
+            "volume": float(grid['volume'][i]),
+            "final_equity": round(float(equity[i]), 2),
+            "total_pnl": round(float(equity[i] - initial_balance), 2),
+            "trades": int(trades[i]),
+            "win_rate": round(float(wins[i] / trades[i]), 4) if trades[i] else None,
+            "profit_factor": round(float(gross_profit[i] / gross_loss[i]), 4) if gross_loss[i] else None,
+            "max_drawdown": round(float(max_drawdown[i]), 2),
+            "blown": bool(not alive[i]),
+            "equity_curve": np.round(curve[:, i], 2).tolist(),
+        })
+    return {"times": times[sample_at].tolist(), "results": results}
+
+
+async def backtest(db, request: BacktestRequest) -> dict:
+    grid = parameter_grid(request)
+    if request.source == 'candles':
+        if request.tf not in TIMEFRAMES:
+            raise ValueError("Unité de temps invalide")
+        times, bid, ask = await load_candles(db, request.symbol, request.tf, request.start, request.end)
+    else:
+        times, bid, ask = await load_ticks(db, request.symbol, request.start, request.end)
+    # Calcul NumPy hors de la boucle d'événements
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, run_backtest, times, bid, ask, grid,
+        pip_value(request.symbol), request.initial_balance, request.curve_points,
+    )
+
+
+# --- CLI ---
+cli = typer.Typer(help="Backtest SL/TP sur l'historique de ticks")
+
+
+def _floats(values: str) -> List[float]:
+    return [float(value) for value in values.split(',') if value]
+
+
+@cli.command()
+def run(
+    symbol: str = typer.Option(...),
+    start: datetime = typer.Option(None, help="Début (historique en base)"),
+    end: datetime = typer.Option(None, help="Fin (historique en base)"),
+    files: Optional[str] = typer.Option(None, help="Fichiers CSV/Parquet au lieu de la base"),
+    source: str = typer.Option('ticks', help="ticks ou candles"),
+    tf: str = typer.Option('1m'),
+    sides: str = typer.Option('buy,sell'),
+    sl_pips: str = typer.Option('10'),
+    tp_pips: str = typer.Option('20'),
+    leverage: str = typer.Option('100'),
+    volume: str = typer.Option('0.01'),
+    initial_balance: float = typer.Option(200.0),
+    top: int = typer.Option(10, help="Nombre de résultats affichés (meilleure équité finale)"),
+):
+    # Courbes non affichées : deux points suffisent
+    request = BacktestRequest(
+        symbol=symbol, start=start, end=end, source=source, tf=tf,
+        sides=sides.split(','), sl_pips=_floats(sl_pips), tp_pips=_floats(tp_pips),
+        leverage=_floats(leverage), volume=_floats(volume), initial_balance=initial_balance,
+        curve_points=2,
+    )
+    try:
+        if files:
+            times, bid, ask = load_tick_files(files.split(','), symbol)
+            report = run_backtest(times, bid, ask, parameter_grid(request), pip_value(symbol),
+                                  request.initial_balance, request.curve_points)
+        else:
+            from database import get_database
+
+            report = asyncio.run(backtest(get_database(), request))
+    except ValueError as exc:
+        typer.echo(str(exc), err=True)
+        raise typer.Exit(1)
+    ranked = sorted(report['results'], key=lambda result: result['final_equity'], reverse=True)[:top]
+    for result in ranked:
+        result.pop('equity_curve')
+    typer.echo(json.dumps(ranked, indent=2))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,83 @@
+"""Temps d'encodage de 10 000 positions : chemin par défaut de FastAPI
+(_id converti à la main, jsonable_encoder puis json.dumps) contre _id
+projeté à la requête et ORJSONResponse.
+
+    python bench_serialization.py [--positions 10000] [--repeat 20]
+"""
+import time
+import uuid
+import random
+import argparse
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+
+def make_positions(count: int, with_id: bool):
+    now = datetime.now()
+    positions = []
+    for i in range(count):
+        position = {
+            "user_id": "bench_user",
+            "account_type": "demo",
+            "symbol": random.choice(["EURUSD", "GBPUSD", "XAUUSD", "USDJPY"]),
+            "order_type": random.choice(["buy", "sell"]),
+            "volume": 0.01,
+            "open_price": 1.05 + random.random() / 100,
+            "current_price": 1.05 + random.random() / 100,
+            "leverage": 100,
+            "profit_loss": round(random.uniform(-50, 50), 2),
+            "timestamp": now - timedelta(minutes=i),
+            "status": "closed",
+            "stop_loss": None,
+            "take_profit": None,
+            "position_id": str(uuid.uuid4()),
+            "close_reason": "Fermeture manuelle",
+            "close_price": 1.05,
+            "closed_at": now - timedelta(seconds=i),
+        }
+        if with_id:
+            position["_id"] = ObjectId()
+        positions.append(position)
+    return positions
+
+
+def before(positions):
+    # Ancien chemin : mutation de _id, puis encodeur générique de FastAPI
+    for position in positions:
+        if '_id' in position:
+            position['_id'] = str(position['_id'])
+    return JSONResponse(jsonable_encoder({"items": positions})).body
+
+
+def after(positions):
+    return ORJSONResponse({"items": positions}).body
+
+
+def measure(encode, positions, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        encode(positions)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--positions', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    old = measure(before, make_positions(args.positions, with_id=True), args.repeat)
+    new = measure(after, make_positions(args.positions, with_id=False), args.repeat)
+    print(f"{args.positions} positions (meilleur de {args.repeat})")
+    print(f"  jsonable_encoder + json : {old:8.2f} ms")
+    print(f"  orjson                  : {new:8.2f} ms")
+    print(f"  gain                    : x{old / new:.1f}")
+
+
+if __name__ == "__main__":
+    main()
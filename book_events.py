@@ -0,0 +1,290 @@
+import os
+import asyncio
+import logging
+import tempfile
+from collections import OrderedDict
+from datetime import datetime
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Optional
+
+import numpy as np
+import orjson
+
+from account_state import AccountState
+from account_stream import AccountStreamHub
+from position_book import PositionBook
+from trigger_engine import TriggerEngine
+
+try:
+    import fcntl
+except ImportError:  # Windows : un seul processus, rien à répliquer
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# En-tête int64 : [octets écrits depuis la création du segment]
+WRITTEN = 0
+HEADER_SLOTS = 2
+LENGTH_BYTES = 4
+DATETIME_FIELDS = ('timestamp', 'closed_at')
+CLOSE_EVENT_SIZE = 1000
+
+
+# --- Journal partagé des événements du carnet ---
+class BookEventLog:
+    """Anneau d'octets en mémoire partagée, à côté du tableau de prix : chaque
+    worker y ajoute ses événements (longueur sur 4 octets puis JSON) sous un
+    verrou fichier, et lit sans verrou ceux des autres.
+
+    La position d'écriture est absolue (octets écrits depuis la création du
+    segment) : un lecteur distancé de plus d'un tour d'anneau le voit, et
+    read() retourne None pour qu'il recharge son état depuis la base."""
+
+    def __init__(self, name: Optional[str] = None, capacity: int = 8 << 20, origin: Optional[int] = None):
+        self.name = name or os.environ.get('BOOK_EVENTS_NAME', 'forex_book_events')
+        self.capacity = capacity
+        # Identifiant de l'émetteur : ses propres événements ne lui sont pas rejoués
+        self.origin = origin or os.getpid()
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._lock_file = None
+        self._header = np.zeros(HEADER_SLOTS, dtype=np.int64)
+        self._ring = np.zeros(0, dtype=np.uint8)
+        self.offset = 0
+        self.published = 0
+        self.received = 0
+        self.overruns = 0
+
+    @property
+    def shared(self) -> bool:
+        return self._shm is not None
+
+    def open(self):
+        if fcntl is None:
+            return
+        try:
+            self._attach()
+        except OSError as exc:
+            logger.warning("Mémoire partagée indisponible (%s), carnet local au processus", exc)
+            self._shm = None
+
+    def _attach(self):
+        size = HEADER_SLOTS * 8 + self.capacity
+        try:
+            self._shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+            created = True
+        except FileExistsError:
+            self._shm = shared_memory.SharedMemory(name=self.name)
+            created = False
+            if self._shm.size < size:
+                # Segment d'une version précédente (autre capacité) : recréé
+                self._shm.close()
+                self._shm.unlink()
+                return self._attach()
+        resource_tracker.unregister(self._shm._name, 'shared_memory')
+        self._header = np.ndarray((HEADER_SLOTS,), dtype=np.int64, buffer=self._shm.buf)
+        self._ring = np.ndarray((self.capacity,), dtype=np.uint8, buffer=self._shm.buf, offset=HEADER_SLOTS * 8)
+        if created:
+            self._header[:] = 0
+        self._lock_file = open(os.path.join(tempfile.gettempdir(), f"{self.name}.lock"), 'a')
+        # Les événements antérieurs sont déjà en base : lecture à partir d'ici
+        self.offset = int(self._header[WRITTEN])
+
+    def publish(self, kind: str, **payload):
+        if self._shm is None:
+            return
+        data = orjson.dumps({"kind": kind, "origin": self.origin, **payload}, default=str)
+        record = len(data).to_bytes(LENGTH_BYTES, 'little') + data
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            start = int(self._header[WRITTEN])
+            if len(record) > self.capacity:
+                # Trop gros pour l'anneau : tous les lecteurs se resynchronisent
+                logger.error("Événement %s de %d octets plus grand que le journal", kind, len(record))
+                self._header[WRITTEN] = start + self.capacity + 1
+                return
+            self._copy_in(start % self.capacity, record)
+            # Publié une fois les octets en place : un lecteur ne voit jamais d'enregistrement partiel
+            self._header[WRITTEN] = start + len(record)
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+        self.published += 1
+
+    def _copy_in(self, position: int, data: bytes):
+        view = np.frombuffer(data, dtype=np.uint8)
+        first = min(len(view), self.capacity - position)
+        self._ring[position:position + first] = view[:first]
+        self._ring[:len(view) - first] = view[first:]
+
+    def _copy_out(self, start: int, length: int) -> bytes:
+        position = start % self.capacity
+        first = min(length, self.capacity - position)
+        return self._ring[position:position + first].tobytes() + self._ring[:length - first].tobytes()
+
+    def read(self) -> Optional[List[dict]]:
+        """Événements des autres workers depuis la dernière lecture, dans
+        l'ordre d'écriture ; None si une partie a été recouverte."""
+        if self._shm is None:
+            return []
+        end = int(self._header[WRITTEN])
+        if end == self.offset:
+            return []
+        data = self._copy_out(self.offset, end - self.offset) if end - self.offset <= self.capacity else None
+        if data is None or int(self._header[WRITTEN]) - self.offset > self.capacity:
+            self.offset = int(self._header[WRITTEN])
+            self.overruns += 1
+            return None
+
+        events = []
+        position = 0
+        while position < len(data):
+            length = int.from_bytes(data[position:position + LENGTH_BYTES], 'little')
+            position += LENGTH_BYTES
+            event = orjson.loads(data[position:position + length])
+            position += length
+            if event['origin'] != self.origin:
+                events.append(event)
+        self.offset = end
+        self.received += len(events)
+        return events
+
+    def close(self):
+        if self._shm is not None:
+            self._header = self._header.copy()
+            self._ring = np.zeros(0, dtype=np.uint8)
+            self._shm.close()
+            self._shm = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def stats(self) -> dict:
+        return {
+            "shared": self.shared,
+            "capacity": self.capacity,
+            "published": self.published,
+            "received": self.received,
+            "overruns": self.overruns,
+        }
+
+
+def _restore_datetimes(document: dict) -> dict:
+    # orjson écrit les datetimes en ISO 8601 : on retrouve des datetime natifs
+    for field in DATETIME_FIELDS:
+        value = document.get(field)
+        if isinstance(value, str):
+            document[field] = datetime.fromisoformat(value)
+    return document
+
+
+# --- Réplication du carnet entre workers ---
+class BookSync:
+    """Chaque worker garde son carnet, ses niveaux SL/TP et ses soldes en
+    mémoire ; toute ouverture, fermeture ou variation de solde est publiée
+    dans le journal et rejouée par les autres workers. Les décisions (SL/TP,
+    stop-out) restent au seul producteur des prix.
+
+    Une fermeture peut être publiée avant l'ouverture correspondante (la
+    position a été fermée en base par un worker qui ne l'avait pas encore
+    vue) : les identifiants récemment fermés sont retenus pour ignorer
+    l'ouverture qui arrive ensuite."""
+
+    def __init__(self, log: BookEventLog, book: PositionBook, triggers: TriggerEngine,
+                 accounts: AccountState, stream: AccountStreamHub, max_tombstones: int = 100000):
+        self.log = log
+        self.book = book
+        self.triggers = triggers
+        self.accounts = accounts
+        self.stream = stream
+        self.max_tombstones = max_tombstones
+        self.resyncs = 0
+        self._tombstones: "OrderedDict[str, None]" = OrderedDict()
+
+    def _bury(self, position_id: str):
+        self._tombstones[position_id] = None
+        while len(self._tombstones) > self.max_tombstones:
+            self._tombstones.popitem(last=False)
+
+    # Publication
+    def opened(self, positions: List[dict]):
+        keys = {(position['user_id'], position['account_type']) for position in positions}
+        accounts = [self.accounts.record(*key) for key in keys]
+        self.log.publish('opened', positions=positions, accounts=[a for a in accounts if a is not None])
+
+    def closed(self, closes: List[tuple]):
+        for position, _ in closes:
+            self._bury(position['position_id'])
+        for start in range(0, len(closes), CLOSE_EVENT_SIZE):
+            self.log.publish('closed', closes=[
+                {"position_id": position['position_id'], "user_id": position['user_id'],
+                 "account_type": position['account_type'], "fields": fields}
+                for position, fields in closes[start:start + CLOSE_EVENT_SIZE]
+            ])
+
+    def balance(self, account: dict):
+        self.log.publish('balance', account=account)
+
+    def risk(self, event: dict):
+        self.log.publish('risk', event=event)
+
+    # Application
+    def apply(self, events: List[dict]):
+        for event in events:
+            kind = event['kind']
+            if kind == 'opened':
+                for account in event['accounts']:
+                    self.accounts.apply(account)
+                for position in event['positions']:
+                    if position['position_id'] in self._tombstones or position['position_id'] in self.book:
+                        continue
+                    position = _restore_datetimes(position)
+                    self.book.add(position)
+                    self.triggers.add(position)
+                    self.stream.position_opened(position)
+            elif kind == 'closed':
+                for close in event['closes']:
+                    self._bury(close['position_id'])
+                    self.triggers.discard(close['position_id'])
+                    if self.book.remove(close['position_id']) is not None:
+                        self.stream.position_closed(close, _restore_datetimes(close['fields']))
+            elif kind == 'balance':
+                self.accounts.apply(event['account'])
+            elif kind == 'risk':
+                self.stream.risk_event(event['event'])
+
+    async def resync(self, db, prices: Dict[str, dict]):
+        """Journal recouvert : carnet, niveaux SL/TP et soldes rechargés
+        depuis la base ; les flux SSE reçoivent la différence."""
+        self.resyncs += 1
+        before = {position['position_id']: position for position in self.book}
+        await self.book.load(db.positions, prices)
+        self.triggers.clear()
+        for position in self.book:
+            self.triggers.add(position)
+            if position['position_id'] not in before:
+                self.stream.position_opened(position)
+        for position_id, position in before.items():
+            if position_id not in self.book:
+                self.stream.position_closed(position, {"status": "closed"})
+        await self.accounts.refresh(db)
+        await self.accounts.load(db, self.book.account_keys())
+        logger.warning("Journal du carnet recouvert, état rechargé depuis la base (%d positions)", len(self.book))
+
+    async def follow(self, db, prices: Dict[str, dict], poll: float):
+        stale = False
+        while True:
+            await asyncio.sleep(poll)
+            try:
+                events = self.log.read()
+                if events is None or stale:
+                    # Rechargement réessayé à chaque passage tant qu'il échoue ;
+                    # les événements lus entre-temps sont déjà en base
+                    stale = True
+                    await self.resync(db, prices)
+                    stale = False
+                elif events:
+                    self.apply(events)
+            except Exception:
+                logger.exception("Réplication du carnet interrompue")
+
+    def stats(self) -> dict:
+        return {**self.log.stats(), "resyncs": self.resyncs, "tombstones": len(self._tombstones)}
@@ -0,0 +1,148 @@
+import os
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+from pymongo.errors import BulkWriteError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+TIMEFRAMES = {'1s': 1, '1m': 60, '5m': 300, '1h': 3600, '1d': 86400}
+BAR_FIELDS = ('open', 'high', 'low', 'close', 'ticks')
+
+
+# --- Tampon circulaire à base de tableaux ---
+class _Ring:
+    def __init__(self, capacity: int, columns: Dict[str, type]):
+        self.capacity = capacity
+        self.count = 0
+        self._next = 0
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in columns.items()}
+
+    def append(self, **values):
+        for name, value in values.items():
+            self.columns[name][self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def _order(self) -> np.ndarray:
+        start = (self._next - self.count) % self.capacity
+        return (start + np.arange(self.count)) % self.capacity
+
+    def oldest(self, column: str):
+        if not self.count:
+            return None
+        return self.columns[column][(self._next - self.count) % self.capacity]
+
+    def between(self, column: str, start: float, end: float) -> Dict[str, np.ndarray]:
+        # Les valeurs de `column` sont croissantes dans l'ordre d'insertion
+        order = self._order()
+        keys = self.columns[column][order]
+        lo, hi = np.searchsorted(keys, start, 'left'), np.searchsorted(keys, end, 'right')
+        order = order[lo:hi]
+        return {name: values[order] for name, values in self.columns.items()}
+
+
+class TickRing(_Ring):
+    def __init__(self, capacity: int):
+        super().__init__(capacity, {'time': np.float64, 'bid': np.float64, 'ask': np.float64})
+
+
+# --- Agrégation OHLC incrémentale ---
+class CandleSeries:
+    """Bougies d'un symbole pour une unité de temps : la bougie courante est
+    mise à jour en O(1) par tick, les bougies closes vont dans un anneau."""
+
+    def __init__(self, seconds: int, capacity: int):
+        self.seconds = seconds
+        self.current: Optional[dict] = None
+        self.closed = _Ring(capacity, {'time': np.int64, 'open': np.float64, 'high': np.float64,
+                                       'low': np.float64, 'close': np.float64, 'ticks': np.int64})
+
+    def update(self, ts: float, price: float) -> Optional[dict]:
+        bucket = int(ts // self.seconds) * self.seconds
+        current = self.current
+        if current is not None and current['time'] == bucket:
+            current['high'] = max(current['high'], price)
+            current['low'] = min(current['low'], price)
+            current['close'] = price
+            current['ticks'] += 1
+            return None
+        self.current = {'time': bucket, 'open': price, 'high': price, 'low': price, 'close': price, 'ticks': 1}
+        if current is not None:
+            self.closed.append(**current)
+        return current
+
+    def oldest_time(self) -> Optional[int]:
+        oldest = self.closed.oldest('time')
+        if oldest is not None:
+            return int(oldest)
+        return self.current['time'] if self.current is not None else None
+
+    def bars(self, start: float, end: float) -> List[dict]:
+        columns = self.closed.between('time', start, end)
+        bars = [
+            {'time': int(t), 'open': float(o), 'high': float(h), 'low': float(l), 'close': float(c), 'ticks': int(n)}
+            for t, o, h, l, c, n in zip(columns['time'], *(columns[field] for field in BAR_FIELDS))
+        ]
+        if self.current is not None and start <= self.current['time'] <= end:
+            bars.append(dict(self.current))
+        return bars
+
+
+# --- Historique des ticks et bougies de tous les symboles ---
+class CandleStore:
+    def __init__(self, symbols: List[str], tick_capacity: int = 86400, bar_capacity: int = 1440,
+                 persisted_timeframes: Optional[List[str]] = None):
+        self.ticks = {symbol: TickRing(tick_capacity) for symbol in symbols}
+        self.series = {
+            symbol: {tf: CandleSeries(seconds, bar_capacity) for tf, seconds in TIMEFRAMES.items()}
+            for symbol in symbols
+        }
+        if persisted_timeframes is None:
+            persisted_timeframes = os.environ.get('CANDLE_PERSIST_TIMEFRAMES', '1m,5m,1h,1d').split(',')
+        self.persisted_timeframes = {tf.strip() for tf in persisted_timeframes if tf.strip()}
+        self._spill: List[dict] = []
+
+    def on_tick(self, prices: Dict[str, dict], ts: float):
+        for symbol, ring in self.ticks.items():
+            price = prices.get(symbol)
+            if price is None:
+                continue
+            ring.append(time=ts, bid=price['bid'], ask=price['ask'])
+            for tf, series in self.series[symbol].items():
+                closed = series.update(ts, price['bid'])
+                if closed is not None and tf in self.persisted_timeframes:
+                    self._spill.append({'symbol': symbol, 'tf': tf, **closed})
+
+    def recent_ticks(self, symbol: str, start: float, end: float, limit: int) -> List[dict]:
+        # Derniers ticks de l'intervalle (graphiques tick par tick)
+        columns = self.ticks[symbol].between('time', start, end)
+        return [
+            {'time': float(t), 'bid': float(b), 'ask': float(a)}
+            for t, b, a in zip(columns['time'][-limit:], columns['bid'][-limit:], columns['ask'][-limit:])
+        ]
+
+    def candles(self, symbol: str, tf: str, start: float, end: float) -> List[dict]:
+        return self.series[symbol][tf].bars(start, end)
+
+    def oldest_time(self, symbol: str, tf: str) -> Optional[int]:
+        return self.series[symbol][tf].oldest_time()
+
+    def discard_spill(self):
+        self._spill = []
+
+    async def flush(self, collection) -> int:
+        """Déverse les bougies closes en base ; les doublons (index unique)
+        d'un flush rejoué sont ignorés."""
+        if not self._spill:
+            return 0
+        bars, self._spill = self._spill, []
+        try:
+            await collection.insert_many(bars, ordered=False)
+        except BulkWriteError as exc:
+            if any(error.get('code') != 11000 for error in exc.details.get('writeErrors', [])):
+                logger.error("Écriture des bougies incomplète : %s", exc.details.get('writeErrors')[:3])
+        except PyMongoError as exc:
+            logger.error("Écriture des bougies impossible (%d perdues) : %s", len(bars), exc)
+        return len(bars)
@@ -0,0 +1,59 @@
+import os
+from typing import Optional
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+
+load_dotenv()
+
+# --- MongoDB config ---
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'forex_broker')
+MONGO_OPTIONS = {
+    'maxPoolSize': int(os.environ.get('MONGO_MAX_POOL_SIZE', 100)),
+    'minPoolSize': int(os.environ.get('MONGO_MIN_POOL_SIZE', 5)),
+    'waitQueueTimeoutMS': int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000)),
+    'serverSelectionTimeoutMS': int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+    # Les compresseurs dont le module n'est pas installé sont ignorés par pymongo
+    'compressors': os.environ.get('MONGO_COMPRESSORS', 'zstd,snappy,zlib'),
+}
+
+_client: Optional[AsyncIOMotorClient] = None
+
+
+# --- Client unique partagé par tous les modules ---
+def get_client() -> AsyncIOMotorClient:
+    global _client
+    if _client is None:
+        _client = AsyncIOMotorClient(MONGO_URL, **MONGO_OPTIONS)
+    return _client
+
+
+def get_database() -> AsyncIOMotorDatabase:
+    return get_client()[DB_NAME]
+
+
+async def connect():
+    # Appelé au démarrage de l'app : crée le pool et vérifie la connexion
+    await get_client().admin.command('ping')
+
+
+def close():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+class _LazyDatabase:
+    """Référence stable à la base, résolue à chaque accès : le client n'est
+    créé qu'au premier usage et peut être fermé/recréé sans réimport."""
+
+    def __getattr__(self, name):
+        return getattr(get_database(), name)
+
+    def __getitem__(self, name):
+        return get_database()[name]
+
+
+db = _LazyDatabase()
@@ -0,0 +1,89 @@
+import os
+import logging
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', 86400))
+
+# --- Index déclarés, par collection ---
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True, name="users_email_unique"),
+        IndexModel([("user_id", ASCENDING)], unique=True, name="users_user_id_unique"),
+    ],
+    "positions": [
+        # Positions ouvertes d'un compte + historique trié (closed_at, position_id)
+        IndexModel(
+            [("user_id", ASCENDING), ("account_type", ASCENDING), ("status", ASCENDING),
+             ("closed_at", DESCENDING), ("position_id", DESCENDING)],
+            name="positions_account_status_closed_at",
+        ),
+        IndexModel([("position_id", ASCENDING)], unique=True, name="positions_position_id_unique"),
+        # Sélection des positions à archiver (voir position_archive)
+        IndexModel([("status", ASCENDING), ("closed_at", ASCENDING)], name="positions_status_closed_at"),
+    ],
+    "accounts": [
+        # Lecture paresseuse d'un compte (ensure) ; unique : pas de doublon en cas d'upserts concurrents
+        IndexModel([("user_id", ASCENDING), ("account_type", ASCENDING)], unique=True,
+                   name="accounts_user_account_type_unique"),
+    ],
+    "orders": [
+        IndexModel([("order_id", ASCENDING)], unique=True, name="orders_order_id_unique"),
+        # Export des ordres d'un compte, triés par date
+        IndexModel([("user_id", ASCENDING), ("account_type", ASCENDING), ("timestamp", ASCENDING),
+                    ("order_id", ASCENDING)], name="orders_account_timestamp"),
+    ],
+    "candles": [
+        IndexModel([("symbol", ASCENDING), ("tf", ASCENDING), ("time", ASCENDING)],
+                   unique=True, name="candles_symbol_tf_time_unique"),
+    ],
+    "position_archive": [
+        IndexModel([("user_id", ASCENDING), ("account_type", ASCENDING), ("month", DESCENDING)],
+                   unique=True, name="position_archive_account_month_unique"),
+    ],
+    "idempotency_keys": [
+        # Purge automatique des réponses enregistrées (voir idempotency)
+        IndexModel([("created_at", ASCENDING)], expireAfterSeconds=IDEMPOTENCY_TTL,
+                   name="idempotency_created_at_ttl"),
+    ],
+}
+
+
+async def ensure_indexes(db, indexes: Dict[str, List[IndexModel]] = INDEXES) -> Dict[str, List[str]]:
+    """Crée de façon idempotente les index manquants et retourne, par
+    collection, les noms des index qui manquaient dans la base."""
+    missing_report = {}
+    for collection_name, models in indexes.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        missing = [model for model in models if model.document["name"] not in existing]
+        missing_report[collection_name] = [model.document["name"] for model in missing]
+        if not missing:
+            continue
+        logger.warning("Index manquants sur %s : %s", collection_name, ", ".join(missing_report[collection_name]))
+        try:
+            await collection.create_indexes(missing)
+        except OperationFailure as exc:
+            # Ex. doublons existants empêchant un index unique : on démarre quand même
+            logger.error("Création d'index impossible sur %s : %s", collection_name, exc)
+    return missing_report
+
+
+async def index_usage(db, indexes: Dict[str, List[IndexModel]] = INDEXES) -> Dict[str, List[dict]]:
+    usage = {}
+    for collection_name in indexes:
+        stats = await db[collection_name].aggregate([{"$indexStats": {}}]).to_list(length=None)
+        usage[collection_name] = [
+            {
+                "name": stat["name"],
+                "key": dict(stat["key"]),
+                "ops": stat["accesses"]["ops"],
+                "since": stat["accesses"]["since"],
+            }
+            for stat in stats
+        ]
+    return usage
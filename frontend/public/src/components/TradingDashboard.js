@@ -13,6 +13,7 @@ import {
   LogOut, User, Settings
 } from 'lucide-react';
 import { useAuth } from '../contexts/AuthContext';
+import { readEventStream } from '../lib/sse';
 
 const TradingDashboard = () => {
   const { user, logout, apiCall } = useAuth();
@@ -150,8 +151,12 @@ const TradingDashboard = () => {
     );
   };
 
-  // Fetch current prices
+  // Stream current prices (WebSocket, snapshot HTTP au démarrage et en secours)
   useEffect(() => {
+    let socket = null;
+    let fallback = null;
+    let closed = false;
+
     const fetchPrices = async () => {
       try {
         const response = await apiCall('/api/prices');
@@ -162,67 +167,143 @@ const TradingDashboard = () => {
       }
     };
 
+    const connect = () => {
+      if (closed) return;
+      const wsUrl = `${process.env.REACT_APP_BACKEND_URL.replace(/^http/, 'ws')}/ws/prices`;
+      socket = new WebSocket(wsUrl);
+      socket.onopen = () => {
+        if (fallback) {
+          clearInterval(fallback);
+          fallback = null;
+        }
+      };
+      socket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        if (message.type === 'prices') {
+          setPrices(message.prices);
+        }
+      };
+      socket.onclose = () => {
+        if (closed) return;
+        if (!fallback) {
+          fallback = setInterval(fetchPrices, 1000);
+        }
+        setTimeout(connect, 5000);
+      };
+    };
+
     fetchPrices();
-    const interval = setInterval(fetchPrices, 1000);
-    return () => clearInterval(interval);
+    connect();
+    return () => {
+      closed = true;
+      if (socket) socket.close();
+      if (fallback) clearInterval(fallback);
+    };
   }, [apiCall]);
 
-  // Fetch current account details
+  // Positions et compte : flux SSE (instantané puis deltas), polling HTTP en secours
   useEffect(() => {
-    const fetchCurrentAccount = async () => {
-      if (!user) return;
-      
+    if (!user) return;
+    let controller = null;
+    let fallback = null;
+    let closed = false;
+
+    const fetchAccountAndPositions = async () => {
       try {
-        const response = await apiCall(`/api/accounts/${accountType}`);
-        const data = await response.json();
-        setCurrentAccount(data);
+        const [accountResponse, positionsResponse] = await Promise.all([
+          apiCall(`/api/accounts/${accountType}`),
+          apiCall(`/api/positions/${accountType}`)
+        ]);
+        setCurrentAccount(await accountResponse.json());
+        setPositions(await positionsResponse.json());
       } catch (error) {
-        console.error('Error fetching account details:', error);
+        console.error('Error fetching account and positions:', error);
       }
     };
 
-    fetchCurrentAccount();
-    const interval = setInterval(fetchCurrentAccount, 5000);
-    return () => clearInterval(interval);
-  }, [user, accountType, apiCall]);
+    const applyDelta = (delta) => {
+      if (delta.opened || delta.closed || delta.updated) {
+        setPositions((current) => {
+          const closedIds = new Set((delta.closed || []).map((position) => position.position_id));
+          const updates = new Map((delta.updated || []).map((update) => [update.position_id, update]));
+          const next = current
+            .filter((position) => !closedIds.has(position.position_id))
+            .map((position) => (updates.has(position.position_id)
+              ? { ...position, ...updates.get(position.position_id) }
+              : position));
+          return next.concat(delta.opened || []);
+        });
+      }
+      if (delta.account) {
+        setCurrentAccount(delta.account);
+      }
+    };
 
-  // Fetch positions
-  useEffect(() => {
-    const fetchPositions = async () => {
-      if (!user) return;
-      
+    const onEvent = (event, data) => {
+      if (event === 'snapshot') {
+        const snapshot = JSON.parse(data);
+        setPositions(snapshot.positions);
+        setCurrentAccount(snapshot.account);
+        if (fallback) {
+          clearInterval(fallback);
+          fallback = null;
+        }
+      } else if (event === 'delta') {
+        applyDelta(JSON.parse(data));
+      }
+    };
+
+    // fetch plutôt qu'EventSource : le flux est authentifié par l'en-tête Bearer d'apiCall
+    const connect = async () => {
+      if (closed) return;
+      controller = new AbortController();
       try {
-        const response = await apiCall(`/api/positions/${accountType}`);
-        const data = await response.json();
-        setPositions(data);
+        const response = await apiCall(`/api/stream/${accountType}`, {
+          signal: controller.signal,
+          headers: { Accept: 'text/event-stream' },
+        });
+        if (!response.ok) throw new Error(`Flux indisponible (${response.status})`);
+        await readEventStream(response, onEvent);
       } catch (error) {
-        console.error('Error fetching positions:', error);
+        if (closed) return;
+        console.error('Account stream error:', error);
       }
+      if (closed) return;
+      if (!fallback) {
+        fallback = setInterval(fetchAccountAndPositions, 5000);
+      }
+      setTimeout(connect, 5000);
     };
 
-    fetchPositions();
-    const interval = setInterval(fetchPositions, 2000);
-    return () => clearInterval(interval);
+    fetchAccountAndPositions();
+    connect();
+    return () => {
+      closed = true;
+      if (controller) controller.abort();
+      if (fallback) clearInterval(fallback);
+    };
   }, [user, accountType, apiCall]);
 
-  // Fetch trade history
+  // Fetch trade history (seulement quand l'ensemble des positions ouvertes change)
+  const openPositionIds = positions.map((position) => position.position_id).join(',');
   useEffect(() => {
     const fetchHistory = async () => {
       if (!user) return;
       
       try {
-        const response = await apiCall(`/api/history/${accountType}`);
+        const response = await apiCall(`/api/history/${accountType}?limit=50`);
         const data = await response.json();
-        setTradeHistory(data);
+        setTradeHistory(data.items);
       } catch (error) {
         console.error('Error fetching trade history:', error);
       }
     };
 
     fetchHistory();
-  }, [user, accountType, positions, apiCall]);
+  }, [user, accountType, openPositionIds, apiCall]);
 
-  // Fetch transactions
+  // Fetch transactions (seulement quand le solde change)
+  const accountBalance = currentAccount ? currentAccount.balance : null;
   useEffect(() => {
     const fetchTransactions = async () => {
       if (!user) return;
@@ -237,7 +318,7 @@ const TradingDashboard = () => {
     };
 
     fetchTransactions();
-  }, [user, accountType, currentAccount, apiCall]);
+  }, [user, accountType, accountBalance, apiCall]);
 
   const placeOrder = async () => {
     if (!user || !currentAccount) return;
@@ -627,19 +708,13 @@ const TradingDashboard = () => {
                   return (
                     <div key={price.symbol} className="flex items-center justify-between p-4 bg-gray-700/50 rounded-lg">
                       <div className="flex items-center gap-3">
-                        {price.symbol === 'EURUSD' ? (
-                          <div className="w-10 h-10 bg-blue-500 rounded-full flex items-center justify-center text-white text-xs font-bold">
-                            EUR
-                          </div>
-                        ) : (
-                          <div className="w-10 h-10 bg-yellow-500 rounded-full flex items-center justify-center text-white text-xs font-bold">
-                            XAU
-                          </div>
-                        )}
+                        <div className={`w-10 h-10 ${price.symbol.startsWith('X') || price.symbol.startsWith('WTI') ? 'bg-yellow-500' : 'bg-blue-500'} rounded-full flex items-center justify-center text-white text-xs font-bold`}>
+                          {price.symbol.slice(0, 3)}
+                        </div>
                         <div>
                           <h3 className="text-white font-semibold">{price.symbol}</h3>
                           <p className="text-gray-400 text-sm">
-                            {price.symbol === 'EURUSD' ? 'Euro / Dollar US' : 'Or / Dollar US'}
+                            {price.description}
                           </p>
                         </div>
                       </div>
@@ -871,8 +946,11 @@ const TradingDashboard = () => {
                         <SelectValue />
                       </SelectTrigger>
                       <SelectContent className="bg-gray-700 border-gray-600">
-                        <SelectItem value="EURUSD">EUR/USD</SelectItem>
-                        <SelectItem value="XAUUSD">XAU/USD</SelectItem>
+                        {prices.map((price) => (
+                          <SelectItem key={price.symbol} value={price.symbol}>
+                            {`${price.symbol.slice(0, 3)}/${price.symbol.slice(3)}`}
+                          </SelectItem>
+                        ))}
                       </SelectContent>
                     </Select>
                   </div>
@@ -0,0 +1,118 @@
+import io
+import csv
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Tuple
+
+import orjson
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+EXPORT_BATCH_SIZE = 1000
+
+# Colonnes des relevés (CSV / Parquet) ; NDJSON exporte le document complet
+HISTORY_COLUMNS: List[Tuple[str, pa.DataType]] = [
+    ('position_id', pa.string()), ('symbol', pa.string()), ('order_type', pa.string()),
+    ('volume', pa.float64()), ('leverage', pa.float64()), ('open_price', pa.float64()),
+    ('close_price', pa.float64()), ('profit_loss', pa.float64()), ('stop_loss', pa.float64()),
+    ('take_profit', pa.float64()), ('close_reason', pa.string()),
+    ('timestamp', pa.timestamp('us')), ('closed_at', pa.timestamp('us')),
+]
+ORDER_COLUMNS: List[Tuple[str, pa.DataType]] = [
+    ('order_id', pa.string()), ('symbol', pa.string()), ('order_type', pa.string()),
+    ('volume', pa.float64()), ('leverage', pa.float64()), ('open_price', pa.float64()),
+    ('stop_loss', pa.float64()), ('take_profit', pa.float64()), ('status', pa.string()),
+    ('timestamp', pa.timestamp('us')),
+]
+
+EXPORT_FORMATS: Dict[str, str] = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+async def _batches(cursor, batch_size: int) -> AsyncIterator[List[dict]]:
+    # Lots de taille fixe lus au fil du curseur (ou de tout itérable
+    # asynchrone) : mémoire constante
+    if hasattr(cursor, 'batch_size'):
+        cursor = cursor.batch_size(batch_size)
+    batch = []
+    async for document in cursor:
+        batch.append(document)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def ndjson_stream(cursor, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    async for batch in _batches(cursor, batch_size):
+        yield b''.join(orjson.dumps(document, default=str) + b'\n' for document in batch)
+
+
+async def csv_stream(cursor, columns, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    names = [name for name, _ in columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    async for batch in _batches(cursor, batch_size):
+        for document in batch:
+            writer.writerow([
+                value.isoformat() if isinstance(value, datetime) else value
+                for value in (document.get(name) for name in names)
+            ])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Fichier en écriture seule dont on vide le contenu après chaque
+    groupe de lignes Parquet."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data, self._chunks = b''.join(self._chunks), []
+        return data
+
+
+async def parquet_stream(cursor, columns, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    # Un groupe de lignes par lot ; le pied de fichier est émis à la fin
+    schema = pa.schema(columns)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        async for batch in _batches(cursor, batch_size):
+            table = pa.Table.from_pylist(
+                [{name: document.get(name) for name in schema.names} for document in batch], schema=schema
+            )
+            writer.write_table(table)
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_stream(cursor, export_format: str, columns) -> AsyncIterator[bytes]:
+    if export_format == 'csv':
+        return csv_stream(cursor, columns)
+    if export_format == 'parquet':
+        return parquet_stream(cursor, columns)
+    return ndjson_stream(cursor)
@@ -0,0 +1,166 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from db_indexes import IDEMPOTENCY_TTL
+from user_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+# Durée de réservation d'une clé pendant l'exécution de la requête
+IDEMPOTENCY_LEASE = float(os.environ.get('IDEMPOTENCY_LEASE', 30))
+RECORD_ATTEMPTS = 3
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Motor rend des datetimes naïfs (UTC)
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+# --- Clés d'idempotence (en-tête Idempotency-Key) ---
+class IdempotencyStore:
+    """Réponses déjà produites, par (utilisateur, route, clé) : une requête
+    rejouée avec la même clé reçoit la réponse enregistrée sans être
+    réexécutée. Les documents expirent via l'index TTL sur created_at (voir
+    db_indexes) ; un cache LRU en mémoire évite l'aller-retour en base pour
+    les rejeux rapprochés.
+
+    Une clé en cours de traitement est réservée pour `lease` secondes
+    (locked_until) : si le worker meurt pendant la requête, un nouvel essai
+    reprend la clé une fois le bail expiré au lieu de recevoir 409 jusqu'à
+    la purge. L'enregistrement de la réponse est réessayé ; s'il échoue
+    encore, la réponse est tout de même rendue au client."""
+
+    def __init__(self, db, collection_name: str = 'idempotency_keys',
+                 cache_size: int = 10000, ttl: float = IDEMPOTENCY_TTL, lease: float = IDEMPOTENCY_LEASE):
+        self.db = db
+        self.collection_name = collection_name
+        self.cache = TTLCache(maxsize=cache_size, ttl=ttl)
+        self.lease = lease
+        self.replayed = 0
+        self.takeovers = 0
+        self.record_failures = 0
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    @staticmethod
+    def fingerprint(payload) -> str:
+        raw = json.dumps(jsonable_encoder(payload), sort_keys=True)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _replay(self, stored: dict, fingerprint: str):
+        if stored['fingerprint'] != fingerprint:
+            raise HTTPException(status_code=422, detail="Clé d'idempotence déjà utilisée pour une autre requête")
+        self.replayed += 1
+        if stored['status_code'] >= 400:
+            raise HTTPException(status_code=stored['status_code'], detail=stored['response'])
+        return JSONResponse(content=stored['response'], status_code=stored['status_code'],
+                            headers={'Idempotent-Replayed': 'true'})
+
+    async def _record(self, key: str, fingerprint: str, status_code: int, response):
+        stored = {'fingerprint': fingerprint, 'status': 'done', 'status_code': status_code,
+                  'response': jsonable_encoder(response)}
+        # En cache d'abord : les rejeux sur ce worker sont servis même si la base refuse
+        self.cache.set(key, stored)
+        for attempt in range(RECORD_ATTEMPTS):
+            try:
+                await self.collection.update_one({'_id': key}, {'$set': stored, '$unset': {'locked_until': ''}})
+                return
+            except PyMongoError as exc:
+                error = exc
+                if attempt + 1 < RECORD_ATTEMPTS:
+                    await asyncio.sleep(0.1 * 2 ** attempt)
+        self.record_failures += 1
+        logger.error("Réponse de la clé %s non enregistrée (%s) : libérée à l'expiration du bail", key, error)
+
+    async def _release(self, key: str):
+        # Échec de la requête : la clé est libérée pour permettre un nouvel essai
+        try:
+            await self.collection.delete_one({'_id': key})
+        except PyMongoError:
+            logger.exception("Clé d'idempotence %s non libérée, reprise à l'expiration du bail", key)
+
+    async def _reserve(self, key: str, fingerprint: str) -> Optional[dict]:
+        """None si la clé est réservée pour cette requête ; sinon le document
+        de la réponse déjà enregistrée, à rejouer."""
+        for _ in range(2):
+            now = datetime.now(timezone.utc)
+            lease = {'fingerprint': fingerprint, 'status': 'pending',
+                     'locked_until': now + timedelta(seconds=self.lease)}
+            # L'_id unique arbitre les requêtes concurrentes
+            try:
+                await self.collection.insert_one({'_id': key, **lease, 'created_at': now})
+                return None
+            except DuplicateKeyError:
+                stored = await self.collection.find_one({'_id': key})
+            if stored is None:
+                # Libérée entre-temps par une requête en échec
+                continue
+            if stored['status'] != 'pending':
+                return stored
+            if stored['fingerprint'] != fingerprint:
+                raise HTTPException(status_code=422, detail="Clé d'idempotence déjà utilisée pour une autre requête")
+            locked_until = _utc(stored.get('locked_until'))
+            if locked_until is not None and locked_until > now:
+                raise HTTPException(status_code=409, detail="Requête déjà en cours de traitement")
+            # Bail expiré (worker arrêté pendant la requête) : reprise atomique
+            taken = await self.collection.find_one_and_update(
+                {'_id': key, 'status': 'pending', 'locked_until': stored.get('locked_until')},
+                {'$set': lease},
+            )
+            if taken is None:
+                raise HTTPException(status_code=409, detail="Requête déjà en cours de traitement")
+            self.takeovers += 1
+            logger.warning("Clé d'idempotence %s reprise après expiration du bail", key)
+            return None
+        raise HTTPException(status_code=409, detail="Requête déjà en cours de traitement")
+
+    async def run(self, key: Optional[str], user_id: str, scope: str, payload,
+                  handler: Callable[[], Awaitable]):
+        if not key:
+            return await handler()
+        if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise HTTPException(status_code=400, detail="Clé d'idempotence trop longue")
+        doc_id = f"{user_id}:{scope}:{key}"
+        fingerprint = self.fingerprint(payload)
+
+        stored = self.cache.get(doc_id)
+        if stored is not None:
+            return self._replay(stored, fingerprint)
+
+        stored = await self._reserve(doc_id, fingerprint)
+        if stored is not None:
+            self.cache.set(doc_id, stored)
+            return self._replay(stored, fingerprint)
+
+        try:
+            response = await handler()
+        except HTTPException as exc:
+            if exc.status_code < 500:
+                await self._record(doc_id, fingerprint, exc.status_code, exc.detail)
+            else:
+                await self._release(doc_id)
+            raise
+        except BaseException:
+            await self._release(doc_id)
+            raise
+        await self._record(doc_id, fingerprint, 200, response)
+        return response
+
+    def stats(self) -> dict:
+        return {"replayed": self.replayed, "takeovers": self.takeovers, "record_failures": self.record_failures,
+                "lease": self.lease, "cache": self.cache.stats()}
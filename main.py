@@ -1,6 +1,5 @@
 import os
 import uuid
-import random
 import asyncio
 import datetime
 from typing import Optional, Dict
@@ -9,25 +8,24 @@ from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr
-from motor.motor_asyncio import AsyncIOMotorClient
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from dotenv import load_dotenv
 
+import database
+from database import db
+from db_indexes import ensure_indexes
+from price_engine import PriceEngine
+from password_hashing import hash_password_async, hashing_pool, verify_password_async
+from user_cache import decode_token, get_user_by_id
+
 load_dotenv()
 
 # --- Configs ---
-MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
 SECRET_KEY = os.environ.get("SECRET_KEY", "changemefortsecret")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 jours
 
-# --- MongoDB ---
-client = AsyncIOMotorClient(MONGO_URL)
-db = client.forex_broker
-
 # --- Auth ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # --- FastAPI app ---
@@ -53,12 +51,6 @@ class TokenData(BaseModel):
     user_id: Optional[str] = None
 
 # --- Utilitaires ---
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
 def create_access_token(data: dict, expires_delta: Optional[datetime.timedelta] = None):
     to_encode = data.copy()
     expire = datetime.datetime.utcnow() + (expires_delta or datetime.timedelta(minutes=15))
@@ -74,7 +66,7 @@ async def authenticate_user(email: str, password: str):
     user = await get_user_by_email(email)
     if not user:
         return False
-    if not verify_password(password, user["password_hash"]):
+    if not await verify_password_async(password, user["password_hash"]):
         return False
     if not user.get("is_active", True):
         return False
@@ -87,15 +79,15 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token, SECRET_KEY, ALGORITHM)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise credentials_exception
         token_data = TokenData(user_id=user_id)
     except JWTError:
         raise credentials_exception
-    user = await db.users.find_one({"user_id": token_data.user_id})
-    if user is None:
+    user = await get_user_by_id(db, token_data.user_id)
+    if user is None or not user.get("is_active", True):
         raise credentials_exception
     return user
 
@@ -107,7 +99,7 @@ async def register(user: UserRegister):
         raise HTTPException(status_code=400, detail="Email déjà utilisé")
 
     user_id = str(uuid.uuid4())
-    hashed_password = hash_password(user.password)
+    hashed_password = await hash_password_async(user.password)
 
     user_doc = {
         "user_id": user_id,
@@ -142,32 +134,34 @@ async def read_me(current_user = Depends(get_current_user)):
     }
 
 # --- Price simulation ---
-current_prices = {
-    "EURUSD": {"bid": 1.0532, "ask": 1.0535, "base": 1.0533},
-    "XAUUSD": {"bid": 2678.45, "ask": 2678.50, "base": 2678.47},
-}
+price_engine = PriceEngine.from_env()
+current_prices = price_engine.quotes()
 
 async def simulate_prices():
     while True:
-        for symbol in current_prices:
-            base = current_prices[symbol]["base"]
-            vol = 0.0005 if symbol == "EURUSD" else 0.005
-            change = random.uniform(-vol, vol)
-            new_price = base * (1 + change)
-            current_prices[symbol]["bid"] = round(new_price, 5 if symbol == "EURUSD" else 2)
-            current_prices[symbol]["ask"] = round(new_price, 5 if symbol == "EURUSD" else 2)
-            if random.random() < 0.1:
-                current_prices[symbol]["base"] = new_price
-        await asyncio.sleep(1)
+        price_engine.step()
+        price_engine.write_quotes(current_prices)
+        await asyncio.sleep(price_engine.tick_interval)
 
 @app.on_event("startup")
 async def startup():
+    await database.connect()
+    await ensure_indexes(db)
     asyncio.create_task(simulate_prices())
 
+@app.on_event("shutdown")
+async def shutdown():
+    hashing_pool.shutdown()
+    database.close()
+
 @app.get("/")
 async def home():
     return {"message": "Bienvenue sur l'API Forex Broker"}
 
+@app.get("/metrics/password-hashing")
+async def password_hashing_metrics():
+    return hashing_pool.stats()
+
 # Exemple endpoint protégé (utilisateur connecté)
 @app.get("/protected")
 async def protected_route(current_user=Depends(get_current_user)):
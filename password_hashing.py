@@ -0,0 +1,101 @@
+import os
+import time
+import asyncio
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+# Fonctions de module (et non méthodes liées) pour rester picklables en mode process
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+# --- Pool de hachage borné ---
+class HashingPool:
+    """Exécute bcrypt hors de la boucle d'événements. bcrypt relâche le GIL,
+    un pool de threads suffit donc au parallélisme réel ; le mode process
+    reste disponible. Au-delà de workers + max_queue appels en cours, les
+    nouveaux appels sont refusés en 503 plutôt que mis en file."""
+
+    def __init__(self, workers: int, max_queue: int, executor: str = "thread"):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor_kind = executor
+        self._executor: Executor = None
+        self._pending = 0
+        self._latencies = deque(maxlen=1024)
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def run(self, fn, *args):
+        if self._pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Service momentanément surchargé, veuillez réessayer",
+                headers={"Retry-After": "1"},
+            )
+        self._pending += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self._pending -= 1
+            self._latencies.append(time.perf_counter() - started)
+            self.completed += 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2)
+
+        return {
+            "executor": self.executor_kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "latency_ms": {"p50": percentile(0.50), "p95": percentile(0.95), "max": percentile(1.0)},
+        }
+
+
+hashing_pool = HashingPool(
+    workers=int(os.environ.get("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1))),
+    max_queue=int(os.environ.get("PASSWORD_HASH_MAX_QUEUE", 64)),
+    executor=os.environ.get("PASSWORD_HASH_EXECUTOR", "thread"),
+)
+
+
+async def hash_password_async(password: str) -> str:
+    return await hashing_pool.run(_hash, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await hashing_pool.run(_verify, plain_password, hashed_password)
@@ -0,0 +1,203 @@
+import os
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pymongo import UpdateOne
+
+from history_export import EXPORT_BATCH_SIZE, HISTORY_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SCHEMA = pa.schema([('user_id', pa.string()), ('account_type', pa.string())] + HISTORY_COLUMNS)
+
+
+# --- Archive Parquet des positions fermées ---
+class PositionArchive:
+    """Les positions fermées depuis plus de `after_days` jours quittent
+    db.positions pour des fichiers Parquet partitionnés :
+
+        <root>/account_type=<type>/month=<AAAA-MM>/part-<horodatage>-<id>.parquet
+
+    Chaque passage archive tout ce qui précède sa date limite : les lignes
+    archivées sont donc toujours plus anciennes que les positions fermées
+    restées en base, et les fichiers d'un mois se lisent dans l'ordre de
+    leur nom. Un document de synthèse par (utilisateur, compte, mois) reste
+    dans db.position_archive (nombre, P&L, volume, fichiers).
+
+    Ordre des écritures : fichiers (renommage atomique), synthèses, puis
+    suppression en base ; un arrêt entre deux étapes peut laisser une
+    ligne en double, écartée par position_id dans les pages d'historique.
+
+    Les lectures partent des synthèses : seuls les fichiers où figure
+    l'utilisateur sont ouverts, et un utilisateur sans synthèse ne touche
+    pas à l'archive."""
+
+    def __init__(self, root: str, after_days: float = 90, batch_size: int = 50000):
+        self.root = root
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.archived = 0
+        self.last_run: Optional[datetime] = None
+
+    # Fichiers
+    def _write(self, positions: List[dict]) -> Dict[Tuple[str, str], str]:
+        partitions: Dict[Tuple[str, str], List[dict]] = {}
+        for position in positions:
+            key = (position['account_type'], position['closed_at'].strftime('%Y-%m'))
+            partitions.setdefault(key, []).append(position)
+
+        stamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        written = {}
+        for (account_type, month), rows in partitions.items():
+            directory = os.path.join(self.root, f"account_type={account_type}", f"month={month}")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"part-{stamp}-{uuid.uuid4().hex[:8]}.parquet")
+            rows.sort(key=lambda row: (row['closed_at'], row['position_id']))
+            table = pa.Table.from_pylist(
+                [{name: row.get(name) for name in ARCHIVE_SCHEMA.names} for row in rows], schema=ARCHIVE_SCHEMA
+            )
+            pq.write_table(table, path + '.tmp', compression='zstd')
+            os.replace(path + '.tmp', path)
+            written[(account_type, month)] = path
+        return written
+
+    # Archivage
+    async def run_once(self, db) -> int:
+        cutoff = datetime.now() - timedelta(days=self.after_days)
+        loop = asyncio.get_running_loop()
+        total = 0
+        while True:
+            positions = await db.positions.find(
+                {"status": "closed", "closed_at": {"$lt": cutoff}}, {"_id": 0}
+            ).sort("closed_at", 1).limit(self.batch_size).to_list(length=self.batch_size)
+            if not positions:
+                break
+            files = await loop.run_in_executor(None, self._write, positions)
+            await self._summarize(db, positions, files)
+            ids = [position['position_id'] for position in positions]
+            for start in range(0, len(ids), 10000):
+                await db.positions.delete_many({"position_id": {"$in": ids[start:start + 10000]}, "status": "closed"})
+            total += len(positions)
+            if len(positions) < self.batch_size:
+                break
+        self.archived += total
+        self.last_run = datetime.now()
+        if total:
+            logger.info("%d positions fermées archivées (avant %s)", total, cutoff.isoformat())
+        return total
+
+    async def _summarize(self, db, positions: List[dict], files: Dict[Tuple[str, str], str]):
+        summaries: Dict[Tuple[str, str, str], dict] = {}
+        for position in positions:
+            month = position['closed_at'].strftime('%Y-%m')
+            summary = summaries.setdefault((position['user_id'], position['account_type'], month), {
+                'positions': 0, 'profit_loss': 0.0, 'volume': 0.0,
+                'first': position['closed_at'], 'last': position['closed_at'],
+            })
+            summary['positions'] += 1
+            summary['profit_loss'] += position.get('profit_loss') or 0.0
+            summary['volume'] += position.get('volume') or 0.0
+            summary['first'] = min(summary['first'], position['closed_at'])
+            summary['last'] = max(summary['last'], position['closed_at'])
+        await db.position_archive.bulk_write([
+            UpdateOne(
+                {"user_id": user_id, "account_type": account_type, "month": month},
+                {
+                    "$inc": {"positions": s['positions'], "profit_loss": round(s['profit_loss'], 2),
+                             "volume": s['volume']},
+                    "$min": {"first_closed_at": s['first']},
+                    "$max": {"last_closed_at": s['last']},
+                    "$addToSet": {"files": files[(account_type, month)]},
+                },
+                upsert=True,
+            )
+            for (user_id, account_type, month), s in summaries.items()
+        ], ordered=False)
+
+    async def run_forever(self, db, interval: float, should_run=lambda: True):
+        while True:
+            await asyncio.sleep(interval)
+            if not should_run():
+                continue
+            try:
+                await self.run_once(db)
+            except Exception:
+                logger.exception("Archivage des positions interrompu")
+
+    # Lecture
+    async def _files(self, db, user_id: str, account_type: str, before: Optional[Tuple[datetime, str]],
+                     newest_first: bool) -> List[List[str]]:
+        # Fichiers de l'utilisateur par mois, d'après les synthèses ; les mois
+        # entièrement postérieurs au curseur sont écartés
+        query = {"user_id": user_id, "account_type": account_type}
+        if before is not None:
+            query["first_closed_at"] = {"$lte": before[0]}
+        cursor = db.position_archive.find(query, {"_id": 0, "month": 1, "files": 1}) \
+            .sort("month", -1 if newest_first else 1)
+        return [sorted(summary['files']) async for summary in cursor if summary.get('files')]
+
+    def _filter(self, user_id: str, before: Optional[Tuple[datetime, str]]):
+        expression = ds.field('user_id') == user_id
+        if before is not None:
+            closed_at, position_id = before
+            expression &= (ds.field('closed_at') < closed_at) | (
+                (ds.field('closed_at') == closed_at) & (ds.field('position_id') < position_id)
+            )
+        return expression
+
+    def read_page(self, user_id: str, months: List[List[str]], before: Optional[Tuple[datetime, str]],
+                  limit: int) -> List[dict]:
+        """Page d'historique archivé, du plus récent au plus ancien ; les
+        mois (fichiers de _files, du plus récent) sont lus un à un et la
+        lecture s'arrête dès que la page est pleine."""
+        rows: List[dict] = []
+        seen = set()
+        for parts in months:
+            table = ds.dataset(parts, schema=ARCHIVE_SCHEMA, format='parquet').to_table(
+                filter=self._filter(user_id, before)
+            )
+            table = table.sort_by([('closed_at', 'descending'), ('position_id', 'descending')])
+            for row in table.slice(0, limit).to_pylist():
+                if row['position_id'] not in seen:
+                    seen.add(row['position_id'])
+                    rows.append({**row, 'status': 'closed', 'archived': True})
+            if len(rows) >= limit:
+                break
+        return rows[:limit]
+
+    async def history_page(self, db, user_id: str, account_type: str,
+                           before: Optional[Tuple[datetime, str]], limit: int) -> List[dict]:
+        months = await self._files(db, user_id, account_type, before, newest_first=True)
+        if not months:
+            return []
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.read_page, user_id, months, before, limit)
+
+    async def iter_rows(self, db, user_id: str, account_type: str) -> AsyncIterator[dict]:
+        # Du plus ancien au plus récent, par lots : mémoire constante pour l'export
+        loop = asyncio.get_running_loop()
+        for parts in await self._files(db, user_id, account_type, None, newest_first=False):
+            for part in parts:
+                batches = ds.dataset(part, schema=ARCHIVE_SCHEMA, format='parquet').to_batches(
+                    filter=self._filter(user_id, None), batch_size=EXPORT_BATCH_SIZE
+                )
+                while True:
+                    batch = await loop.run_in_executor(None, next, batches, None)
+                    if batch is None:
+                        break
+                    for row in batch.to_pylist():
+                        yield {**row, 'status': 'closed', 'archived': True}
+
+    def stats(self) -> dict:
+        return {
+            "root": self.root,
+            "after_days": self.after_days,
+            "archived": self.archived,
+            "last_run": self.last_run,
+        }
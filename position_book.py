@@ -0,0 +1,228 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from price_engine import PIP_SIZES
+
+
+# --- Valorisation ---
+def pip_value(symbol: str) -> float:
+    return PIP_SIZES.get(symbol, 0.01)
+
+
+def profit_loss(position: dict, current_price: float) -> float:
+    if position['order_type'] == 'buy':
+        pips = current_price - position['open_price']
+    else:
+        pips = position['open_price'] - current_price
+    value = pip_value(position['symbol'])
+    return (pips / value) * position['volume'] * position['leverage'] * value
+
+
+# --- Carnet des positions ouvertes (en mémoire, stockage colonnaire) ---
+class PositionBook:
+    """Positions ouvertes résidentes en mémoire, indexées par compte
+    (user_id, account_type) et par symbole.
+
+    Les champs numériques sont stockés en colonnes NumPy (une ligne par
+    position, compactée à la suppression) : P&L, marge et équité de toutes
+    les positions sont recalculés en une seule passe vectorisée par tick."""
+
+    _COLUMNS = (
+        ('symbol_idx', np.int32), ('account_idx', np.int32), ('side', np.float64),
+        ('open_price', np.float64), ('volume', np.float64), ('leverage', np.float64),
+        ('current_price', np.float64), ('pnl', np.float64), ('margin', np.float64),
+    )
+    # Une ligne par compte enregistré (index de _accounts)
+    _ACCOUNT_COLUMNS = ('account_pnl', 'account_margin', 'account_balance', 'account_equity')
+
+    def __init__(self, capacity: int = 1024):
+        self._positions: Dict[str, dict] = {}
+        # dict plutôt que set : conserve l'ordre d'ouverture des positions
+        self._by_account: Dict[Tuple[str, str], Dict[str, None]] = {}
+        self._by_symbol: Dict[str, Dict[str, None]] = {}
+        self._symbols: Dict[str, int] = {}
+        self._accounts: Dict[Tuple[str, str], int] = {}
+        self._slots: Dict[str, int] = {}
+        self._ids: List[str] = []
+        self._size = 0
+        self._allocate(capacity)
+        self._allocate_accounts(64)
+        self.bid_prices = np.zeros(0)
+        self.ask_prices = np.zeros(0)
+
+    def _allocate(self, capacity: int):
+        for name, dtype in self._COLUMNS:
+            column = np.zeros(capacity, dtype=dtype)
+            previous = getattr(self, name, None)
+            if previous is not None:
+                column[:self._size] = previous[:self._size]
+            setattr(self, name, column)
+
+    def _allocate_accounts(self, capacity: int):
+        for name in self._ACCOUNT_COLUMNS:
+            column = np.zeros(capacity)
+            previous = getattr(self, name, None)
+            if previous is not None:
+                column[:len(previous)] = previous
+            setattr(self, name, column)
+
+    @property
+    def account_count(self) -> int:
+        return len(self._accounts)
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, position_id: str):
+        return position_id in self._positions
+
+    def __iter__(self):
+        return iter(list(self._positions.values()))
+
+    def _symbol_index(self, symbol: str) -> int:
+        index = self._symbols.get(symbol)
+        if index is None:
+            index = self._symbols[symbol] = len(self._symbols)
+        return index
+
+    def _account_index(self, account: Tuple[str, str]) -> int:
+        index = self._accounts.get(account)
+        if index is None:
+            index = self._accounts[account] = len(self._accounts)
+            if index == len(self.account_pnl):
+                # Capacité doublée : coût amorti constant par compte
+                self._allocate_accounts(2 * index)
+        return index
+
+    async def load(self, collection, prices: Dict[str, dict]):
+        for position_id in list(self._positions):
+            self.remove(position_id)
+        async for position in collection.find({"status": {"$ne": "closed"}}, {"_id": 0}):
+            self.add(position)
+        self.revalue(prices)
+
+    def add(self, position: dict):
+        # _id n'est jamais renvoyé aux clients (insert_one l'ajoute au dict)
+        position.pop('_id', None)
+        position_id = position['position_id']
+        if position_id in self._positions:
+            return
+        account = (position['user_id'], position['account_type'])
+        if self._size == len(self.side):
+            self._allocate(2 * len(self.side))
+
+        slot = self._size
+        self._size += 1
+        self._slots[position_id] = slot
+        self._ids.append(position_id)
+        self.symbol_idx[slot] = self._symbol_index(position['symbol'])
+        self.account_idx[slot] = self._account_index(account)
+        self.side[slot] = 1.0 if position['order_type'] == 'buy' else -1.0
+        self.open_price[slot] = position['open_price']
+        self.volume[slot] = position['volume']
+        self.leverage[slot] = position['leverage']
+        self.current_price[slot] = position.get('current_price', position['open_price'])
+        self.pnl[slot] = position.get('profit_loss', 0.0)
+        self.margin[slot] = position['volume'] * self.current_price[slot]
+
+        self._positions[position_id] = position
+        self._by_account.setdefault(account, {})[position_id] = None
+        self._by_symbol.setdefault(position['symbol'], {})[position_id] = None
+        self._apply_to_account(slot, 1.0)
+
+    def remove(self, position_id: str) -> Optional[dict]:
+        position = self._positions.pop(position_id, None)
+        if position is None:
+            return None
+        self._materialize(position)
+        self._apply_to_account(self._slots[position_id], -1.0)
+
+        # Compactage : la dernière ligne prend la place de la ligne supprimée
+        slot = self._slots.pop(position_id)
+        last = self._size - 1
+        last_id = self._ids.pop()
+        if slot != last:
+            self._ids[slot] = last_id
+            self._slots[last_id] = slot
+            for name, _ in self._COLUMNS:
+                column = getattr(self, name)
+                column[slot] = column[last]
+        self._size = last
+
+        account = (position['user_id'], position['account_type'])
+        self._by_account[account].pop(position_id, None)
+        if not self._by_account[account]:
+            del self._by_account[account]
+        self._by_symbol[position['symbol']].pop(position_id, None)
+        return position
+
+    def _apply_to_account(self, slot: int, sign: float):
+        # Totaux du compte ajustés tout de suite à l'ouverture/fermeture,
+        # sans attendre la revalorisation du prochain tick
+        index = self.account_idx[slot]
+        self.account_pnl[index] += sign * self.pnl[slot]
+        self.account_margin[index] += sign * self.margin[slot]
+        self.account_equity[index] += sign * self.pnl[slot]
+
+    def _materialize(self, position: dict) -> dict:
+        slot = self._slots[position['position_id']]
+        position['current_price'] = float(self.current_price[slot])
+        position['profit_loss'] = round(float(self.pnl[slot]), 2)
+        return position
+
+    def get(self, position_id: str) -> Optional[dict]:
+        position = self._positions.get(position_id)
+        return self._materialize(position) if position is not None else None
+
+    def for_account(self, user_id: str, account_type: str) -> List[dict]:
+        ids = self._by_account.get((user_id, account_type), ())
+        return [self._materialize(self._positions[position_id]) for position_id in ids]
+
+    def account_keys(self) -> List[Tuple[str, str]]:
+        # Comptes dans l'ordre de leur index dans les colonnes account_*
+        return list(self._accounts)
+
+    def ids_at(self, slots) -> List[str]:
+        return [self._ids[slot] for slot in slots]
+
+    def position_count(self, user_id: str, account_type: str) -> int:
+        return len(self._by_account.get((user_id, account_type), ()))
+
+    def set_balance(self, user_id: str, account_type: str, balance: float):
+        index = self._account_index((user_id, account_type))
+        self.account_equity[index] += balance - self.account_balance[index]
+        self.account_balance[index] = balance
+
+    def account_totals(self, user_id: str, account_type: str) -> dict:
+        index = self._accounts.get((user_id, account_type))
+        if index is None:
+            return {"balance": 0.0, "profit_loss": 0.0, "equity": 0.0, "margin": 0.0}
+        return {
+            "balance": float(self.account_balance[index]),
+            "profit_loss": float(self.account_pnl[index]),
+            "equity": float(self.account_equity[index]),
+            "margin": float(self.account_margin[index]),
+        }
+
+    def revalue(self, prices: Dict[str, dict]):
+        # Vecteurs bid/ask indexés par symbole, puis une passe sur toutes les
+        # lignes : BUY valorisé au bid, SELL à l'ask (prix de sortie réel)
+        quotes = [prices.get(symbol, {}) for symbol in self._symbols]
+        self.bid_prices = np.array([quote.get('bid', np.nan) for quote in quotes])
+        self.ask_prices = np.array([quote.get('ask', np.nan) for quote in quotes])
+        n = self._size
+        if n:
+            symbols = self.symbol_idx[:n]
+            price = np.where(self.side[:n] > 0, self.bid_prices[symbols], self.ask_prices[symbols])
+            known = ~np.isnan(price)
+            price = np.where(known, price, self.current_price[:n])
+            self.current_price[:n] = price
+            # (pips / pip_value) * volume * leverage * pip_value
+            self.pnl[:n] = self.side[:n] * (price - self.open_price[:n]) * self.volume[:n] * self.leverage[:n]
+            self.margin[:n] = self.volume[:n] * price
+
+        accounts = len(self._accounts)
+        self.account_pnl[:accounts] = np.bincount(self.account_idx[:n], weights=self.pnl[:n], minlength=accounts)
+        self.account_margin[:accounts] = np.bincount(self.account_idx[:n], weights=self.margin[:n], minlength=accounts)
+        self.account_equity[:accounts] = self.account_balance[:accounts] + self.account_pnl[:accounts]
@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import tempfile
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus, mode local
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('bid', 'ask', 'base')
+# En-tête int64 : [seq (seqlock), numéro de tick, pid du producteur]
+SEQ, TICK, PRODUCER_PID = range(3)
+HEADER_SLOTS = 4
+# Derniers ticks conservés (horodatage du producteur + prix) pour les lecteurs
+TICK_HISTORY = int(os.environ.get('PRICE_BOARD_HISTORY', 64))
+
+
+def layout_hash(symbols: List[str]) -> str:
+    # Empreinte de la disposition du segment : en-tête, colonnes, symboles dans l'ordre
+    layout = json.dumps([HEADER_SLOTS, TICK_HISTORY, FIELDS, list(symbols)])
+    return hashlib.sha1(layout.encode()).hexdigest()[:12]
+
+
+# --- Tableau de prix partagé entre workers ---
+class PriceBoard:
+    """Prix canoniques partagés entre les workers uvicorn via un segment
+    multiprocessing.shared_memory.
+
+    Un seul producteur (le détenteur d'un verrou fichier, repris
+    automatiquement si son processus meurt) écrit chaque tick sous un
+    seqlock : seq impair pendant l'écriture, pair une fois terminée. Les
+    autres workers lisent sans verrou et recommencent si seq a bougé, ce
+    qui garantit un instantané cohérent de tous les symboles.
+
+    Les TICK_HISTORY derniers ticks restent dans le segment avec
+    l'horodatage du producteur : un lecteur rejoue chacun des ticks publiés
+    depuis sa dernière lecture, à l'heure du producteur, et tous les workers
+    construisent les mêmes bougies quelle que soit la fréquence de lecture.
+
+    Le nom du segment (et du verrou) porte une empreinte de la table des
+    symboles et de la disposition des colonnes : un segment laissé par une
+    exécution avec une autre table (SYMBOLS_FILE modifié, ordre différent)
+    n'est jamais relu, ses lignes ne correspondraient plus aux symboles.
+
+    Si la mémoire partagée est indisponible, le tableau reste local et le
+    processus est son propre producteur (comportement mono-worker)."""
+
+    def __init__(self, symbols: List[str], name: Optional[str] = None):
+        self.symbols = list(symbols)
+        self.name = name or os.environ.get('PRICE_BOARD_NAME', 'forex_price_board')
+        self.segment_name = f"{self.name}_{layout_hash(self.symbols)}"
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._lock_file = None
+        self._header = np.zeros(HEADER_SLOTS, dtype=np.int64)
+        self._times = np.zeros(TICK_HISTORY, dtype=np.float64)
+        self._values = np.zeros((TICK_HISTORY, len(self.symbols), len(FIELDS)), dtype=np.float64)
+        self.is_producer = fcntl is None
+        self.last_tick = 0
+        self.last_tick_time: Optional[float] = None
+        # Ticks sortis de l'historique avant d'avoir été lus
+        self.dropped = 0
+        self._source_synced = False
+
+    @property
+    def size(self) -> int:
+        return HEADER_SLOTS * 8 + self._times.nbytes + self._values.nbytes
+
+    def open(self):
+        if fcntl is None:
+            return
+        try:
+            self._attach()
+        except OSError as exc:
+            logger.warning("Mémoire partagée indisponible (%s), prix locaux au processus", exc)
+            self._shm = None
+            self.is_producer = True
+
+    def _attach(self):
+        try:
+            self._shm = shared_memory.SharedMemory(name=self.segment_name, create=True, size=self.size)
+            created = True
+        except FileExistsError:
+            self._shm = shared_memory.SharedMemory(name=self.segment_name)
+            created = False
+            if self._shm.size < self.size:
+                # Segment tronqué (création interrompue) : recréé
+                self._shm.close()
+                self._shm.unlink()
+                return self._attach()
+        # Le segment vit tant que des workers l'utilisent : pas de nettoyage auto
+        resource_tracker.unregister(self._shm._name, 'shared_memory')
+        self._header = np.ndarray((HEADER_SLOTS,), dtype=np.int64, buffer=self._shm.buf)
+        self._times = np.ndarray((TICK_HISTORY,), dtype=np.float64, buffer=self._shm.buf, offset=HEADER_SLOTS * 8)
+        self._values = np.ndarray(
+            (TICK_HISTORY, len(self.symbols), len(FIELDS)), dtype=np.float64,
+            buffer=self._shm.buf, offset=HEADER_SLOTS * 8 + self._times.nbytes,
+        )
+        if created:
+            self._header[:] = 0
+
+    def try_become_producer(self) -> bool:
+        if self.is_producer:
+            return True
+        if self._lock_file is None:
+            path = os.path.join(tempfile.gettempdir(), f"{self.segment_name}.lock")
+            self._lock_file = open(path, 'a')
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        self.is_producer = True
+        if self._header[SEQ] & 1:
+            self._header[SEQ] += 1
+        logger.info("Worker %s devient producteur des prix", os.getpid())
+        return True
+
+    def claim_production(self, prices: Dict[str, dict], source) -> bool:
+        """Vrai si ce worker produit les prix. Au passage lecteur ->
+        producteur (et au premier tick d'un segment déjà existant), `prices`
+        et la source repartent du dernier tick publié, même si ce worker
+        l'avait déjà lu en tant que lecteur ; la source reçoit aussi
+        l'horodatage de ce tick (None si rien n'a encore été publié)."""
+        if self._source_synced:
+            return True
+        if not self.try_become_producer():
+            return False
+        self.load_into(prices)
+        source.sync(prices, self.last_tick_time)
+        self._source_synced = True
+        return True
+
+    def publish(self, prices: Dict[str, dict], tick_time: float):
+        header = self._header
+        tick = int(header[TICK]) + 1
+        slot = tick % TICK_HISTORY
+        header[SEQ] += 1
+        for i, symbol in enumerate(self.symbols):
+            price = prices[symbol]
+            self._values[slot, i] = [price[field] for field in FIELDS]
+        self._times[slot] = tick_time
+        header[TICK] = tick
+        header[PRODUCER_PID] = os.getpid()
+        header[SEQ] += 1
+        self.last_tick, self.last_tick_time = tick, tick_time
+
+    def read(self, since: int = 0) -> Optional[tuple]:
+        """(dernier tick, horodatages, prix) des ticks publiés après `since`,
+        au plus TICK_HISTORY ; None si le producteur est mort en pleine écriture."""
+        # Lecture optimiste : recommence si une écriture est en cours ou a eu lieu
+        header = self._header
+        for _ in range(1000):
+            seq = int(header[SEQ])
+            if seq & 1:
+                continue
+            tick = int(header[TICK])
+            slots = np.arange(max(since + 1, tick - TICK_HISTORY + 1, 1), tick + 1) % TICK_HISTORY
+            times, snapshot = self._times[slots], self._values[slots]
+            if int(header[SEQ]) == seq:
+                return tick, times, snapshot
+        # Producteur mort en pleine écriture : le prochain producteur corrigera seq
+        return None
+
+    def load_into(self, prices: Dict[str, dict], on_tick: Optional[Callable[[float], None]] = None) -> int:
+        """Copie dans `prices`, dans l'ordre, les ticks publiés depuis la
+        dernière lecture et appelle on_tick(horodatage du producteur) après
+        chacun ; retourne le nombre de ticks lus."""
+        result = self.read(self.last_tick)
+        if result is None:
+            return 0
+        tick, times, snapshot = result
+        if not len(times):
+            return 0
+        if self.last_tick:
+            self.dropped += tick - self.last_tick - len(times)
+        self.last_tick = tick
+        for tick_time, values in zip(times.tolist(), snapshot):
+            for i, symbol in enumerate(self.symbols):
+                prices[symbol].update(zip(FIELDS, values[i].tolist()))
+            self.last_tick_time = tick_time
+            if on_tick is not None:
+                on_tick(tick_time)
+        return len(times)
+
+    async def wait_for_tick(self, prices: Dict[str, dict], timeout: float,
+                            on_tick: Optional[Callable[[float], None]] = None, poll: float = 0.05) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.load_into(prices, on_tick):
+                return True
+            await asyncio.sleep(poll)
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "shared": self._shm is not None,
+            "producer": self.is_producer,
+            "last_tick": self.last_tick,
+            "last_tick_time": self.last_tick_time,
+            "dropped": self.dropped,
+        }
+
+    def close(self):
+        if self._shm is not None:
+            self._header = self._header.copy()
+            self._times = self._times.copy()
+            self._values = self._values.copy()
+            self._shm.close()
+            self._shm = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
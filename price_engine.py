@@ -0,0 +1,164 @@
+import os
+import json
+import math
+import time
+import asyncio
+from typing import Dict, List, Optional
+
+import numpy as np
+from pydantic import BaseModel
+
+
+# --- Table des symboles ---
+class SymbolSpec(BaseModel):
+    symbol: str
+    description: str = ''
+    price: float
+    pip_size: float
+    digits: int
+    # Écart-type et dérive du log-rendement par seconde (mouvement brownien géométrique)
+    volatility: float
+    drift: float = 0.0
+    spread_pips: float = 0.0
+
+
+# Volatilités calibrées sur l'ancien simulateur (uniforme ±vol par tick d'une seconde)
+DEFAULT_SYMBOLS = [
+    SymbolSpec(symbol='EURUSD', description='Euro / Dollar US', price=1.0532, pip_size=0.0001, digits=5, volatility=0.0003),
+    SymbolSpec(symbol='XAUUSD', description='Or / Dollar US', price=2678.45, pip_size=0.01, digits=2, volatility=0.003),
+    SymbolSpec(symbol='GBPUSD', description='Livre / Dollar US', price=1.2650, pip_size=0.0001, digits=5, volatility=0.00035),
+    SymbolSpec(symbol='USDJPY', description='Dollar US / Yen', price=149.85, pip_size=0.01, digits=3, volatility=0.0003),
+    SymbolSpec(symbol='USDCHF', description='Dollar US / Franc suisse', price=0.8820, pip_size=0.0001, digits=5, volatility=0.0003),
+    SymbolSpec(symbol='AUDUSD', description='Dollar australien / Dollar US', price=0.6550, pip_size=0.0001, digits=5, volatility=0.0004),
+    SymbolSpec(symbol='USDCAD', description='Dollar US / Dollar canadien', price=1.3580, pip_size=0.0001, digits=5, volatility=0.0003),
+    SymbolSpec(symbol='EURGBP', description='Euro / Livre', price=0.8325, pip_size=0.0001, digits=5, volatility=0.00025),
+    SymbolSpec(symbol='XAGUSD', description='Argent / Dollar US', price=31.25, pip_size=0.001, digits=3, volatility=0.004),
+    SymbolSpec(symbol='WTIUSD', description='Pétrole WTI / Dollar US', price=71.40, pip_size=0.01, digits=2, volatility=0.004),
+]
+
+DEFAULT_CORRELATIONS = {
+    ('EURUSD', 'GBPUSD'): 0.7,
+    ('EURUSD', 'USDCHF'): -0.6,
+    ('EURUSD', 'AUDUSD'): 0.5,
+    ('EURUSD', 'USDCAD'): -0.4,
+    ('EURUSD', 'XAUUSD'): 0.3,
+    ('GBPUSD', 'USDCHF'): -0.5,
+    ('GBPUSD', 'AUDUSD'): 0.4,
+    ('AUDUSD', 'USDCAD'): -0.4,
+    ('AUDUSD', 'XAUUSD'): 0.2,
+    ('USDCHF', 'USDCAD'): 0.3,
+    ('USDJPY', 'USDCHF'): 0.3,
+    ('XAUUSD', 'XAGUSD'): 0.8,
+}
+
+
+def load_symbol_table(path: Optional[str] = None):
+    """Table des symboles et corrélations ; un fichier JSON (SYMBOLS_FILE) de
+    la forme {"symbols": [...], "correlations": {"EURUSD/GBPUSD": 0.75}}
+    remplace la table par défaut."""
+    path = path or os.environ.get('SYMBOLS_FILE')
+    if not path:
+        return list(DEFAULT_SYMBOLS), dict(DEFAULT_CORRELATIONS)
+    with open(path) as f:
+        table = json.load(f)
+    symbols = [SymbolSpec(**spec) for spec in table['symbols']]
+    correlations = {tuple(pair.split('/')): rho for pair, rho in table.get('correlations', {}).items()}
+    return symbols, correlations
+
+
+def correlation_matrix(symbols: List[str], correlations: Dict[tuple, float]) -> np.ndarray:
+    index = {symbol: i for i, symbol in enumerate(symbols)}
+    matrix = np.eye(len(symbols))
+    for (a, b), rho in correlations.items():
+        if a in index and b in index:
+            matrix[index[a], index[b]] = matrix[index[b], index[a]] = rho
+    return matrix
+
+
+def cholesky_factor(matrix: np.ndarray) -> np.ndarray:
+    try:
+        return np.linalg.cholesky(matrix)
+    except np.linalg.LinAlgError:
+        # Matrice saisie non définie positive : projection sur la plus proche
+        values, vectors = np.linalg.eigh(matrix)
+        fixed = vectors @ np.diag(np.clip(values, 1e-8, None)) @ vectors.T
+        scale = np.sqrt(np.diag(fixed))
+        return np.linalg.cholesky(fixed / np.outer(scale, scale))
+
+
+# --- Moteur de prix vectorisé ---
+class PriceEngine:
+    """Mouvements browniens géométriques corrélés pour tous les symboles en
+    une seule opération NumPy par tick ; `seed` rend la série reproductible."""
+
+    def __init__(self, specs: List[SymbolSpec], correlations: Dict[tuple, float],
+                 tick_interval: float = 1.0, seed: Optional[int] = None):
+        self.specs = specs
+        self.symbols = [spec.symbol for spec in specs]
+        self.tick_interval = tick_interval
+        self.rng = np.random.default_rng(seed)
+        self.mid = np.array([spec.price for spec in specs], dtype=np.float64)
+        self.scale = 10.0 ** np.array([spec.digits for spec in specs])
+        self.half_spread = np.array([spec.spread_pips * spec.pip_size / 2 for spec in specs])
+        sigma = np.array([spec.volatility for spec in specs])
+        drift = np.array([spec.drift for spec in specs])
+        self._step_drift = (drift - 0.5 * sigma ** 2) * tick_interval
+        self._step_sigma = sigma * math.sqrt(tick_interval)
+        self._factor = cholesky_factor(correlation_matrix(self.symbols, correlations))
+
+    @classmethod
+    def from_env(cls) -> 'PriceEngine':
+        seed = os.environ.get('PRICE_SEED')
+        return cls(
+            SYMBOL_SPECS, SYMBOL_CORRELATIONS,
+            tick_interval=float(os.environ.get('PRICE_TICK_INTERVAL', 1.0)),
+            seed=int(seed) if seed is not None else None,
+        )
+
+    def step(self) -> np.ndarray:
+        shocks = self._factor @ self.rng.standard_normal(len(self.symbols))
+        self.mid *= np.exp(self._step_drift + self._step_sigma * shocks)
+        return self.mid
+
+    def sync(self, prices: Dict[str, dict]):
+        # Reprend les prix publiés par un autre producteur (relève de worker)
+        for i, symbol in enumerate(self.symbols):
+            if symbol in prices:
+                self.mid[i] = prices[symbol]['base']
+
+    def write_quotes(self, prices: Dict[str, dict]):
+        bid = (np.round((self.mid - self.half_spread) * self.scale) / self.scale).tolist()
+        ask = (np.round((self.mid + self.half_spread) * self.scale) / self.scale).tolist()
+        for i, spec in enumerate(self.specs):
+            quote = prices.setdefault(spec.symbol, {'description': spec.description})
+            quote['bid'], quote['ask'], quote['base'] = bid[i], ask[i], float(self.mid[i])
+
+    def quotes(self) -> Dict[str, dict]:
+        prices = {}
+        self.write_quotes(prices)
+        return prices
+
+
+# --- Source de ticks simulée ---
+class SimulatedTickSource:
+    """Interface commune des sources de ticks (voir tick_replay) : next_tick
+    met à jour `prices` en place et retourne l'horodatage du tick, ou None
+    quand la source est épuisée ; sync reprend après le dernier tick publié
+    par un autre producteur (prix et horodatage)."""
+
+    def __init__(self, engine: PriceEngine):
+        self.engine = engine
+        self.tick_interval = engine.tick_interval
+
+    def sync(self, prices: Dict[str, dict], tick_time: Optional[float]):
+        self.engine.sync(prices)
+
+    async def next_tick(self, prices: Dict[str, dict]) -> Optional[float]:
+        await asyncio.sleep(self.tick_interval)
+        self.engine.step()
+        self.engine.write_quotes(prices)
+        return time.time()
+
+
+SYMBOL_SPECS, SYMBOL_CORRELATIONS = load_symbol_table()
+PIP_SIZES = {spec.symbol: spec.pip_size for spec in SYMBOL_SPECS}
@@ -0,0 +1,158 @@
+import json
+import asyncio
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+
+# --- Formatage des cotations ---
+def quote_from_price(symbol: str, price: dict) -> dict:
+    return {
+        "symbol": symbol,
+        "description": price.get("description", ""),
+        "bid": price["bid"],
+        "ask": price["ask"],
+        "spread": round(price["ask"] - price["bid"], 5),
+        "timestamp": price.get("timestamp") or datetime.now().isoformat(),
+    }
+
+
+def parse_symbols(raw: Optional[Iterable[str]]) -> Optional[Set[str]]:
+    # None = tous les symboles ; accepte "EURUSD,XAUUSD" ou une liste
+    if raw is None:
+        return None
+    if isinstance(raw, str):
+        raw = raw.split(",")
+    symbols = {s.strip().upper() for s in raw if s and s.strip()}
+    return symbols or None
+
+
+# --- Abonné WebSocket ---
+class PriceSubscriber:
+    """Boîte aux lettres à une seule place : une nouvelle trame remplace
+    la précédente si le client ne l'a pas encore lue (client lent)."""
+
+    def __init__(self, symbols: Optional[Set[str]] = None):
+        self.symbols = symbols
+        self.dropped = 0
+        self._frame: Optional[str] = None
+        self._ready = asyncio.Event()
+
+    @property
+    def key(self):
+        return frozenset(self.symbols) if self.symbols is not None else None
+
+    def offer(self, frame: str):
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = frame
+        self._ready.set()
+
+    async def next_frame(self) -> str:
+        await self._ready.wait()
+        self._ready.clear()
+        frame, self._frame = self._frame, None
+        return frame
+
+
+# --- Diffusion des ticks ---
+class PriceBroadcaster:
+    def __init__(self, max_subscribers: int = 10000):
+        self.max_subscribers = max_subscribers
+        self.seq = 0
+        self._subscribers: Set[PriceSubscriber] = set()
+        self._quotes: Dict[str, dict] = {}
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def _frame(self, symbols: Optional[Set[str]]) -> str:
+        if symbols is None:
+            quotes = list(self._quotes.values())
+        else:
+            quotes = [q for s, q in self._quotes.items() if s in symbols]
+        return json.dumps({"type": "prices", "seq": self.seq, "prices": quotes})
+
+    def publish(self, prices: Dict[str, dict]):
+        """Appelé une fois par tick par le simulateur : une seule boucle de
+        diffusion, une trame sérialisée par ensemble d'abonnement distinct."""
+        self.seq += 1
+        self._quotes = {symbol: quote_from_price(symbol, p) for symbol, p in prices.items()}
+        frames: Dict[Optional[frozenset], str] = {}
+        for subscriber in self._subscribers:
+            key = subscriber.key
+            frame = frames.get(key)
+            if frame is None:
+                frame = frames[key] = self._frame(subscriber.symbols)
+            subscriber.offer(frame)
+
+    def quotes(self) -> list:
+        # Cotations formatées au dernier tick publié
+        return list(self._quotes.values())
+
+    def subscribe(self, symbols: Optional[Set[str]] = None) -> PriceSubscriber:
+        subscriber = PriceSubscriber(symbols)
+        self._subscribers.add(subscriber)
+        if self._quotes:
+            subscriber.offer(self._frame(symbols))
+        return subscriber
+
+    def unsubscribe(self, subscriber: PriceSubscriber):
+        self._subscribers.discard(subscriber)
+
+    def stats(self) -> dict:
+        return {
+            "seq": self.seq,
+            "subscribers": len(self._subscribers),
+            "dropped_frames": sum(s.dropped for s in self._subscribers),
+        }
+
+    async def _pump(self, websocket: WebSocket, subscriber: PriceSubscriber):
+        while True:
+            frame = await subscriber.next_frame()
+            await websocket.send_text(frame)
+
+    def _apply(self, subscriber: PriceSubscriber, message: dict):
+        action = message.get("action")
+        symbols = parse_symbols(message.get("symbols"))
+        if action == "subscribe":
+            if symbols is None or subscriber.symbols is None:
+                subscriber.symbols = symbols
+            else:
+                subscriber.symbols = subscriber.symbols | symbols
+        elif action == "unsubscribe" and symbols is not None:
+            current = subscriber.symbols if subscriber.symbols is not None else set(self._quotes)
+            subscriber.symbols = current - symbols
+        else:
+            return
+        subscriber.offer(self._frame(subscriber.symbols))
+
+    async def serve(self, websocket: WebSocket, symbols: Optional[Set[str]] = None):
+        if len(self._subscribers) >= self.max_subscribers:
+            await websocket.close(code=1013)
+            return
+        await websocket.accept()
+        subscriber = self.subscribe(symbols)
+        pump = asyncio.create_task(self._pump(websocket, subscriber))
+        try:
+            while True:
+                receive = asyncio.create_task(websocket.receive_json())
+                done, _ = await asyncio.wait({receive, pump}, return_when=asyncio.FIRST_COMPLETED)
+                if pump in done:
+                    receive.cancel()
+                    break
+                try:
+                    message = receive.result()
+                except (WebSocketDisconnect, RuntimeError):
+                    break
+                except ValueError:
+                    continue
+                if isinstance(message, dict):
+                    self._apply(subscriber, message)
+        finally:
+            if pump.done() and not pump.cancelled():
+                pump.exception()
+            pump.cancel()
+            self.unsubscribe(subscriber)
@@ -0,0 +1,82 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+import orjson
+from fastapi import Request, Response
+
+
+class CachedBody:
+    __slots__ = ('body', 'etag')
+
+    def __init__(self, body: bytes):
+        self.body = body
+        # ETag dérivé du contenu : un instantané inchangé garde le même ETag d'un tick à l'autre
+        self.etag = '"%s"' % hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+# --- Cache de réponses par tick ---
+class TickResponseCache:
+    """Réponses JSON déjà sérialisées, par (clé, numéro de tick). La
+    première requête d'un tick construit la réponse ; les requêtes
+    identiques concurrentes attendent le même future au lieu de refaire le
+    travail. Une entrée est périmée dès que le tick avance."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.not_modified = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    async def get(self, key: Hashable, seq: int, build: Callable[[], Awaitable[Any]]) -> CachedBody:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == seq:
+            self._entries.move_to_end(key)
+            future = entry[1]
+            if future.done():
+                self.hits += 1
+            else:
+                self.coalesced += 1
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._entries[key] = (seq, future)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        try:
+            body = CachedBody(orjson.dumps(await build(), default=str))
+        except BaseException as exc:
+            # Échec : les requêtes en attente le reçoivent, la suivante réessaie
+            if self._entries.get(key, (None, None))[1] is future:
+                del self._entries[key]
+            future.set_exception(exc)
+            future.exception()
+            raise
+        future.set_result(body)
+        return body
+
+    def respond(self, request: Request, cached: CachedBody) -> Response:
+        headers = {'ETag': cached.etag, 'Cache-Control': 'no-cache'}
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match and cached.etag in (tag.strip() for tag in if_none_match.split(',')):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=cached.body, media_type='application/json', headers=headers)
+
+    async def serve(self, request: Request, key: Hashable, seq: int,
+                    build: Callable[[], Awaitable[Any]]) -> Response:
+        return self.respond(request, await self.get(key, seq, build))
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "not_modified": self.not_modified,
+        }
@@ -0,0 +1,120 @@
+import os
+import time
+from collections import deque
+from typing import List, Tuple
+
+import numpy as np
+
+from position_book import PositionBook
+
+MARGIN_CALL_LEVEL = float(os.environ.get('MARGIN_CALL_LEVEL', 100))
+STOP_OUT_LEVEL = float(os.environ.get('STOP_OUT_LEVEL', 50))
+STOP_OUT = 'Stop Out'
+
+
+# --- Appel de marge et stop-out ---
+class RiskEngine:
+    """Niveau de marge (équité / marge, en %) de tous les comptes en une
+    passe sur les colonnes account_* du carnet, après chaque revalorisation.
+
+    Sous MARGIN_CALL_LEVEL : un événement margin_call à l'entrée dans la zone.
+    Sous STOP_OUT_LEVEL : les positions sont liquidées de la plus grande
+    perte à la plus petite jusqu'à repasser au-dessus du seuil. Fermer une
+    position ne change pas l'équité (la perte passe dans le solde) mais
+    libère sa marge ; le nombre de positions à fermer se déduit donc d'une
+    somme cumulée des marges, sans boucle par compte.
+
+    Coût par tick : O(comptes enregistrés dans le carnet) vectorisé, soit
+    ceux qui ont eu une position ou ont été consultés depuis le démarrage
+    (enregistrement paresseux) ; les positions ne sont parcourues
+    que pour les comptes en stop-out, au plus `max_liquidations` par tick
+    (le reste est repris au tick suivant)."""
+
+    def __init__(self, book: PositionBook, margin_call_level: float = MARGIN_CALL_LEVEL,
+                 stop_out_level: float = STOP_OUT_LEVEL, max_liquidations: int = 10000,
+                 history: int = 1000):
+        self.book = book
+        self.margin_call_level = margin_call_level
+        self.stop_out_level = stop_out_level
+        self.max_liquidations = max_liquidations
+        self.events = deque(maxlen=history)
+        self.margin_calls = 0
+        self.liquidations = 0
+        self._in_call = np.zeros(0, dtype=bool)
+
+    def margin_levels(self) -> np.ndarray:
+        accounts = self.book.account_count
+        margin = self.book.account_margin[:accounts]
+        equity = self.book.account_equity[:accounts]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(margin > 0, 100 * equity / margin, np.inf)
+
+    def check(self, now: float = None) -> Tuple[List[dict], List[str]]:
+        """Retourne (événements, positions à liquider)."""
+        now = time.time() if now is None else now
+        book = self.book
+        levels = self.margin_levels()
+        accounts = len(levels)
+        if len(self._in_call) < accounts:
+            grown = np.zeros(max(accounts, 2 * len(self._in_call)), dtype=bool)
+            grown[:len(self._in_call)] = self._in_call
+            self._in_call = grown
+
+        in_call = levels < self.margin_call_level
+        entering = np.flatnonzero(in_call & ~self._in_call[:accounts])
+        self._in_call[:accounts] = in_call
+        stopped = levels < self.stop_out_level
+        if not len(entering) and not stopped.any():
+            return [], []
+
+        keys = book.account_keys()
+        events = [self._event('margin_call', keys[index], index, levels, now) for index in entering]
+        self.margin_calls += len(entering)
+
+        liquidated: List[str] = []
+        n = len(book)
+        rows = np.flatnonzero(stopped[book.account_idx[:n]])
+        if len(rows):
+            account = book.account_idx[rows]
+            # Par compte, de la plus grande perte à la plus petite
+            order = np.lexsort((book.pnl[rows], account))
+            rows, account = rows[order], account[order]
+            freed = np.cumsum(book.margin[rows])
+            first = np.r_[True, account[1:] != account[:-1]]
+            group_start = np.maximum.accumulate(np.where(first, np.arange(len(rows)), 0))
+            freed_before = freed - book.margin[rows] - np.where(group_start > 0, freed[group_start - 1], 0)
+            margin_left = book.account_margin[account] - freed_before
+            equity = book.account_equity[account]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                breached = (equity <= 0) | (100 * equity / margin_left < self.stop_out_level)
+            rows, account = rows[breached][:self.max_liquidations], account[breached][:self.max_liquidations]
+            liquidated = book.ids_at(rows)
+            for index in np.unique(account):
+                event = self._event('stop_out', keys[index], index, levels, now)
+                event['positions'] = [position_id for position_id, owner in zip(liquidated, account) if owner == index]
+                events.append(event)
+            self.liquidations += len(liquidated)
+
+        self.events.extend(events)
+        return events, liquidated
+
+    def _event(self, kind: str, key: Tuple[str, str], index: int, levels: np.ndarray, now: float) -> dict:
+        return {
+            "type": kind,
+            "user_id": key[0],
+            "account_type": key[1],
+            "margin_level": round(float(levels[index]), 2),
+            "equity": round(float(self.book.account_equity[index]), 2),
+            "margin": round(float(self.book.account_margin[index]), 2),
+            "time": now,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "margin_call_level": self.margin_call_level,
+            "stop_out_level": self.stop_out_level,
+            "accounts_in_margin_call": int(self._in_call.sum()),
+            "margin_calls": self.margin_calls,
+            "liquidations": self.liquidations,
+            "recent_events": list(self.events)[-20:],
+        }
@@ -1,19 +1,47 @@
+import re
+import json
+import time
 import uuid
+import base64
 import asyncio
-import random
+import logging
 from datetime import datetime
 from typing import List, Dict, Optional
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
-from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, EmailStr, Field
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import OperationFailure, PyMongoError
 from dotenv import load_dotenv
 import os
 import stripe
 
+import database
+from database import db
+from account_state import INITIAL_BALANCES, AccountState
+from account_stream import AccountStreamHub
+from backtest import BacktestRequest, backtest
+from book_events import BookEventLog, BookSync
+from candles import TIMEFRAMES, CandleStore
+from db_indexes import ensure_indexes, index_usage
+from history_export import EXPORT_BATCH_SIZE, EXPORT_FORMATS, HISTORY_COLUMNS, ORDER_COLUMNS, export_stream
+from idempotency import IdempotencyStore
+from position_archive import PositionArchive
+from position_book import PositionBook, profit_loss
+from price_board import PriceBoard
+from price_engine import PriceEngine
+from response_cache import TickResponseCache
+from risk_engine import STOP_OUT, RiskEngine
+from price_stream import PriceBroadcaster, parse_symbols, quote_from_price
+from tick_replay import ReplayTickSource, tick_source_from_env
+from tick_store import TickWriter, ensure_tick_collection
+from trigger_engine import TriggerEngine, close_price_for
+
 # --- Load environment ---
 load_dotenv()
+logger = logging.getLogger(__name__)
 
 # --- Stripe config ---
 STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY')
@@ -21,11 +49,6 @@ if not STRIPE_API_KEY:
     raise Exception("STRIPE_API_KEY environment variable is required")
 stripe.api_key = STRIPE_API_KEY
 
-# --- MongoDB config ---
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client.forex_broker
-
 # --- FastAPI app ---
 app = FastAPI(title="Forex Broker API", version="2.0.0")
 
@@ -114,6 +137,17 @@ class Position(BaseModel):
     stop_loss: Optional[float] = None
     take_profit: Optional[float] = None
 
+class ClosePositionsRequest(BaseModel):
+    account_type: str
+    position_ids: Optional[List[str]] = None  # None = toutes les positions du compte
+
+MANUAL_CLOSE = 'Fermeture manuelle'
+ORDER_BATCH_MAX = int(os.environ.get('ORDER_BATCH_MAX', 100))
+ILLEGAL_OPERATION = 20  # code Mongo : transactions indisponibles (serveur standalone)
+
+class OrderBatch(BaseModel):
+    orders: List[Order] = Field(..., min_length=1, max_length=ORDER_BATCH_MAX)
+
 # --- Routes simples ---
 
 @app.get("/")
@@ -139,62 +173,360 @@ def list_payments():
     ]
 
 # --- Simulate prices globally ---
-current_prices = {
-    'EURUSD': {'bid': 1.0532, 'ask': 1.0532, 'base': 1.0532},
-    'XAUUSD': {'bid': 2678.45, 'ask': 2678.45, 'base': 2678.45}
-}
+price_engine = PriceEngine.from_env()
+price_source = tick_source_from_env(price_engine)
+current_prices = price_engine.quotes()
+
+price_board = PriceBoard(list(current_prices))
+PRICE_TAKEOVER_TIMEOUT = 3
+position_book = PositionBook()
+trigger_engine = TriggerEngine()
+account_state = AccountState(position_book)
+risk_engine = RiskEngine(position_book)
+account_stream = AccountStreamHub(
+    position_book, account_state,
+    max_rate=float(os.environ.get('SSE_MAX_RATE', 2)),
+    pnl_threshold=float(os.environ.get('SSE_PNL_THRESHOLD', 0.01)),
+    max_subscribers=int(os.environ.get('SSE_MAX_SUBSCRIBERS', 10000)),
+)
+# Carnet, niveaux SL/TP et soldes répliqués entre workers (voir book_events)
+book_events = BookEventLog(capacity=int(os.environ.get('BOOK_EVENTS_BYTES', 8 << 20)))
+book_sync = BookSync(book_events, position_book, trigger_engine, account_state, account_stream)
+account_state.on_balance = book_sync.balance
+BOOK_EVENTS_POLL = float(os.environ.get('BOOK_EVENTS_POLL', 0.05))
+price_broadcaster = PriceBroadcaster(max_subscribers=int(os.environ.get('WS_MAX_SUBSCRIBERS', 10000)))
+candle_store = CandleStore(list(current_prices))
+response_cache = TickResponseCache(max_entries=int(os.environ.get('RESPONSE_CACHE_SIZE', 1024)))
+CANDLE_FLUSH_INTERVAL = float(os.environ.get('CANDLE_FLUSH_INTERVAL', 5))
+CANDLE_DEFAULT_BARS = 500
+CANDLE_MAX_BARS = 5000
+TICKS_DEFAULT_COUNT = 1000
+TICKS_MAX_COUNT = 10000
+tick_writer: Optional[TickWriter] = None
+position_archive = PositionArchive(
+    os.environ.get('ARCHIVE_DIR', 'archive'),
+    after_days=float(os.environ.get('ARCHIVE_AFTER_DAYS', 90)),
+)
+ARCHIVE_INTERVAL = float(os.environ.get('ARCHIVE_INTERVAL', 3600))
+idempotency = IdempotencyStore(db, cache_size=int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 10000)))
+# Références des tâches de fermeture en cours (sinon collectables avant la fin)
+close_tasks = set()
 
 async def simulate_prices():
+    # Un seul worker produit les prix ; les autres lisent le tableau partagé
     while True:
-        for symbol in current_prices:
-            base_price = current_prices[symbol]['base']
-            volatility = 0.0005 if symbol == 'EURUSD' else 0.005
-            change = random.uniform(-volatility, volatility)
-            new_price = base_price * (1 + change)
-            current_prices[symbol]['bid'] = round(new_price, 5 if symbol == 'EURUSD' else 2)
-            current_prices[symbol]['ask'] = round(new_price, 5 if symbol == 'EURUSD' else 2)
-            if random.random() < 0.1:
-                current_prices[symbol]['base'] = new_price
-        await asyncio.sleep(1)
+        if not price_board.claim_production(current_prices, price_source):
+            # Chaque tick publié est rejoué à l'heure du producteur
+            await price_board.wait_for_tick(current_prices, PRICE_TAKEOVER_TIMEOUT, on_tick=on_price_tick)
+            continue
+        tick_time = await price_source.next_tick(current_prices)
+        if tick_time is None:
+            logger.info("Source de prix épuisée, fin du flux de ticks")
+            return
+        price_board.publish(current_prices, tick_time)
+        on_price_tick(tick_time)
+
+def on_price_tick(now: float):
+    # Les ticks rejoués sont déjà enregistrés : on ne les réécrit pas
+    if tick_writer is not None and price_board.is_producer and not isinstance(price_source, ReplayTickSource):
+        tick_writer.put(current_prices, now)
+    candle_store.on_tick(current_prices, now)
+    position_book.revalue(current_prices)
+    account_state.on_tick(now)
+    if price_board.is_producer:
+        # SL/TP et stop-out décidés par le seul producteur ; les autres
+        # workers reçoivent les fermetures et alertes par book_sync
+        check_triggers_and_risk(now)
+    account_stream.on_tick()
+    price_broadcaster.publish(current_prices)
+
+def check_triggers_and_risk(now: float):
+    triggered = trigger_engine.check(current_prices)
+    if triggered:
+        spawn_close(triggered)
+    risk_events, stop_outs = risk_engine.check(now)
+    for event in risk_events:
+        logger.warning("%s %s/%s : niveau de marge %s%%", event['type'], event['user_id'],
+                       event['account_type'], event['margin_level'])
+        account_stream.risk_event(event)
+        book_sync.risk(event)
+    if stop_outs:
+        liquidate_positions(stop_outs)
+
+def liquidate_positions(position_ids: List[str]):
+    # Même chemin que les SL/TP : retrait du carnet puis bulk_write
+    stopped = []
+    for position_id in position_ids:
+        position = position_book.get(position_id)
+        if position is None:
+            continue
+        trigger_engine.discard(position_id)
+        stopped.append((position_id, STOP_OUT, close_price_for(position['order_type'], current_prices[position['symbol']])))
+    if stopped:
+        spawn_close(stopped)
+
+def closed_fields(position: dict, reason: str, close_price: float, closed_at: datetime) -> dict:
+    return {
+        "status": "closed",
+        "close_reason": reason,
+        "close_price": close_price,
+        "current_price": close_price,
+        "profit_loss": round(profit_loss(position, close_price), 2),
+        "closed_at": closed_at
+    }
+
+async def write_closes(closes: List[tuple]) -> List[tuple]:
+    """Écrit des fermetures (position, champs) en un seul bulk_write et
+    crédite le P&L réalisé aux soldes. Seules les positions fermées par cet
+    appel (close_batch) sont créditées : une position déjà fermée par un
+    autre worker ne l'est pas deux fois. Une erreur du bulk_write remonte à
+    l'appelant, qui remet les positions au carnet (restore_positions)."""
+    # Une opération par position : un identifiant en double serait crédité deux fois
+    closes = list({position['position_id']: (position, fields) for position, fields in closes}.values())
+    if not closes:
+        return []
+    close_batch = str(uuid.uuid4())
+    operations = [
+        UpdateOne(
+            {"position_id": position['position_id'], "status": {"$ne": "closed"}},
+            {"$set": {**fields, "close_batch": close_batch}}
+        )
+        for position, fields in closes
+    ]
+    result = await db.positions.bulk_write(operations, ordered=False)
+    if result.modified_count < len(operations):
+        # Filtré sur les identifiants du lot : servi par positions_position_id_unique
+        ours = set(await db.positions.distinct("position_id", {
+            "position_id": {"$in": [position['position_id'] for position, _ in closes]},
+            "close_batch": close_batch,
+        }))
+        closes = [(position, fields) for position, fields in closes if position['position_id'] in ours]
+
+    realized = {}
+    for position, fields in closes:
+        account = (position['user_id'], position['account_type'])
+        realized[account] = realized.get(account, 0.0) + fields['profit_loss']
+    try:
+        await account_state.realize(db, realized)
+    except PyMongoError:
+        # Positions bien fermées en base : on ne les remet pas au carnet
+        logger.exception("P&L réalisé non crédité (lot %s) : %s", close_batch, realized)
+    for position, fields in closes:
+        account_stream.position_closed(position, fields)
+    book_sync.closed(closes)
+    return closes
+
+def restore_positions(closes: List[tuple]):
+    # Écriture refusée : les positions sont toujours ouvertes en base
+    for position, _ in closes:
+        position_book.add(position)
+        trigger_engine.add(position)
+
+def spawn_close(triggered):
+    task = asyncio.create_task(close_triggered_positions(triggered))
+    close_tasks.add(task)
+    task.add_done_callback(close_tasks.discard)
+
+async def close_triggered_positions(triggered):
+    # Retrait immédiat du carnet, puis une seule écriture groupée en base
+    closed_at = datetime.now()
+    closes = []
+    for position_id, reason, close_price in triggered:
+        position = position_book.remove(position_id)
+        if position is None:
+            continue
+        closes.append((position, closed_fields(position, reason, close_price, closed_at)))
+    try:
+        await write_closes(closes)
+    except Exception:
+        logger.exception("Fermeture de %d positions non enregistrée, positions remises au carnet", len(closes))
+        restore_positions(closes)
+
+async def flush_candles():
+    # Seul le producteur des prix écrit les bougies en base
+    while True:
+        await asyncio.sleep(CANDLE_FLUSH_INTERVAL)
+        if price_board.is_producer:
+            await candle_store.flush(db.candles)
+        else:
+            candle_store.discard_spill()
 
 @app.on_event("startup")
 async def startup_event():
+    global tick_writer
+    await database.connect()
+    await ensure_indexes(db)
+    await ensure_tick_collection(db)
+    tick_writer = TickWriter(
+        db.ticks,
+        batch_size=int(os.environ.get('TICK_BATCH_SIZE', 1000)),
+        flush_interval=float(os.environ.get('TICK_FLUSH_MS', 500)) / 1000,
+        max_queue=int(os.environ.get('TICK_QUEUE_MAX', 100000)),
+    )
+    tick_writer.start()
+    price_board.open()
+    # Ouvert avant le chargement : les événements publiés pendant la lecture
+    # de la base sont rejoués ensuite (sans effet s'ils y figurent déjà)
+    book_events.open()
+    price_board.load_into(current_prices)
+    await position_book.load(db.positions, current_prices)
+    # Tout compte ayant des positions a un solde (sinon stop-out immédiat) ;
+    # les autres comptes sont enregistrés à la première requête
+    await account_state.load(db, position_book.account_keys())
+    for position in position_book:
+        trigger_engine.add(position)
+    asyncio.create_task(book_sync.follow(db, current_prices, BOOK_EVENTS_POLL))
     asyncio.create_task(simulate_prices())
+    asyncio.create_task(flush_candles())
+    # Un seul archiveur : le worker producteur des prix
+    asyncio.create_task(position_archive.run_forever(db, ARCHIVE_INTERVAL, lambda: price_board.is_producer))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if tick_writer is not None:
+        await tick_writer.stop()
+    price_board.close()
+    book_events.close()
+    database.close()
+
+# --- Prix : snapshot HTTP + flux WebSocket ---
+
+@app.get("/api/prices")
+async def get_prices(request: Request):
+    # Une sérialisation par tick, partagée par toutes les requêtes ; ETag/304
+    async def build():
+        return price_broadcaster.quotes() or [quote_from_price(symbol, price) for symbol, price in current_prices.items()]
+    return await response_cache.serve(request, 'prices', price_broadcaster.seq, build)
+
+@app.websocket("/ws/prices")
+async def prices_stream(websocket: WebSocket, symbols: Optional[str] = None):
+    # ?symbols=EURUSD,XAUUSD puis {"action": "subscribe"|"unsubscribe", "symbols": [...]}
+    await price_broadcaster.serve(websocket, parse_symbols(symbols))
+
+@app.get("/api/candles/{symbol}")
+async def get_candles(
+    request: Request,
+    symbol: str,
+    tf: str = '1m',
+    from_: Optional[float] = Query(None, alias='from'),
+    to: Optional[float] = None
+):
+    if symbol not in current_prices:
+        raise HTTPException(status_code=400, detail="Symbole invalide")
+    if tf not in TIMEFRAMES:
+        raise HTTPException(status_code=400, detail="Unité de temps invalide")
+    return await response_cache.serve(
+        request, ('candles', symbol, tf, from_, to), price_broadcaster.seq,
+        lambda: candles_payload(symbol, tf, from_, to)
+    )
 
-# --- Trading endpoints ---
+async def candles_payload(symbol: str, tf: str, from_: Optional[float], to: Optional[float]) -> dict:
+    end = to if to is not None else time.time()
+    start = from_ if from_ is not None else end - TIMEFRAMES[tf] * CANDLE_DEFAULT_BARS
+
+    bars = candle_store.candles(symbol, tf, start, end)
+    # Les bougies plus anciennes que l'anneau en mémoire sont lues en base
+    oldest = candle_store.oldest_time(symbol, tf)
+    if oldest is None or start < oldest:
+        time_range = {"$gte": start, "$lte": end}
+        if oldest is not None:
+            time_range = {"$gte": start, "$lt": oldest}
+        cursor = db.candles.find(
+            {"symbol": symbol, "tf": tf, "time": time_range},
+            {"_id": 0, "symbol": 0, "tf": 0}
+        ).sort("time", 1)
+        bars = await cursor.to_list(length=CANDLE_MAX_BARS) + bars
+
+    return {"symbol": symbol, "tf": tf, "candles": bars[-CANDLE_MAX_BARS:]}
+
+@app.get("/api/ticks/{symbol}")
+async def get_recent_ticks(
+    request: Request,
+    symbol: str,
+    from_: Optional[float] = Query(None, alias='from'),
+    to: Optional[float] = None,
+    limit: int = Query(TICKS_DEFAULT_COUNT, ge=1, le=TICKS_MAX_COUNT)
+):
+    # Anneau des ticks en mémoire (24 h à un tick par seconde), sans lecture en base
+    if symbol not in current_prices:
+        raise HTTPException(status_code=400, detail="Symbole invalide")
+    return await response_cache.serve(
+        request, ('ticks', symbol, from_, to, limit), price_broadcaster.seq,
+        lambda: ticks_payload(symbol, from_, to, limit)
+    )
 
-@app.post("/api/orders")
-async def place_order(order: Order, current_user=Depends(get_current_user)):
-    # Sécurité : forcer user_id depuis token
-    order.user_id = current_user['user_id']
+async def ticks_payload(symbol: str, from_: Optional[float], to: Optional[float], limit: int) -> dict:
+    end = to if to is not None else float('inf')
+    start = from_ if from_ is not None else float('-inf')
+    return {"symbol": symbol, "ticks": candle_store.recent_ticks(symbol, start, end, limit)}
 
-    symbol_prices = current_prices.get(order.symbol)
-    if not symbol_prices:
+@app.post("/api/backtest")
+async def run_backtest(request: BacktestRequest, current_user=Depends(get_current_user)):
+    if request.symbol not in current_prices:
         raise HTTPException(status_code=400, detail="Symbole invalide")
+    try:
+        return await backtest(db, request)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
-    open_price = symbol_prices['bid'] if order.order_type == 'sell' else symbol_prices['ask']
+@app.get("/api/admin/tick-writer")
+async def get_tick_writer_stats(current_user=Depends(get_current_user)):
+    return tick_writer.stats() if tick_writer is not None else {}
+
+@app.get("/api/admin/idempotency")
+async def get_idempotency_stats(current_user=Depends(get_current_user)):
+    return idempotency.stats()
 
+@app.get("/api/admin/risk")
+async def get_risk_stats(current_user=Depends(get_current_user)):
+    return {**risk_engine.stats(), "triggers": trigger_engine.stats()}
+
+@app.get("/api/admin/streams")
+async def get_stream_stats(current_user=Depends(get_current_user)):
+    return {"prices": price_broadcaster.stats(), "board": price_board.stats(),
+            "accounts": account_stream.stats(), "book": book_sync.stats()}
+
+@app.get("/api/admin/response-cache")
+async def get_response_cache_stats(current_user=Depends(get_current_user)):
+    return response_cache.stats()
+
+@app.get("/api/admin/archive")
+async def get_archive_stats(current_user=Depends(get_current_user)):
+    return position_archive.stats()
+
+@app.get("/api/admin/indexes")
+async def get_index_usage(current_user=Depends(get_current_user)):
+    return await index_usage(db)
+
+# --- Trading endpoints ---
+
+def order_rejection(order: Order, open_price: float) -> Optional[str]:
     if order.stop_loss:
         if order.order_type == 'buy' and order.stop_loss >= open_price:
-            raise HTTPException(status_code=400, detail="Stop Loss doit être inférieur au prix actuel pour un ordre BUY")
+            return "Stop Loss doit être inférieur au prix actuel pour un ordre BUY"
         elif order.order_type == 'sell' and order.stop_loss <= open_price:
-            raise HTTPException(status_code=400, detail="Stop Loss doit être supérieur au prix actuel pour un ordre SELL")
+            return "Stop Loss doit être supérieur au prix actuel pour un ordre SELL"
 
     if order.take_profit:
         if order.order_type == 'buy' and order.take_profit <= open_price:
-            raise HTTPException(status_code=400, detail="Take Profit doit être supérieur au prix actuel pour un ordre BUY")
+            return "Take Profit doit être supérieur au prix actuel pour un ordre BUY"
         elif order.order_type == 'sell' and order.take_profit >= open_price:
-            raise HTTPException(status_code=400, detail="Take Profit doit être inférieur au prix actuel pour un ordre SELL")
+            return "Take Profit doit être inférieur au prix actuel pour un ordre SELL"
+    return None
+
+def required_margin(order: Order, open_price: float) -> float:
+    # Même formule que le carnet (colonne margin) : volume * prix
+    return order.volume * open_price
 
+def order_documents(order: Order, open_price: float):
+    now = datetime.now()
     order_dict = order.dict()
     order_dict['order_id'] = str(uuid.uuid4())
     order_dict['open_price'] = open_price
-    order_dict['timestamp'] = datetime.now()
-
-    await db.orders.insert_one(order_dict)
+    order_dict['timestamp'] = now
 
     position = Position(
-        user_id=current_user['user_id'],
+        user_id=order.user_id,
         account_type=order.account_type,
         symbol=order.symbol,
         order_type=order.order_type,
@@ -205,82 +537,374 @@ async def place_order(order: Order, current_user=Depends(get_current_user)):
         stop_loss=order.stop_loss,
         take_profit=order.take_profit,
         profit_loss=0.0,
-        timestamp=datetime.now()
+        timestamp=now
     )
 
     position_dict = position.dict()
     position_dict['position_id'] = str(uuid.uuid4())
-    await db.positions.insert_one(position_dict)
+    return order_dict, position_dict
 
-    return {"order_id": order_dict['order_id'], "position_id": position_dict['position_id'], "status": "executed"}
+def track_positions(positions: List[dict]):
+    for position_dict in positions:
+        position_book.add(position_dict)
+        trigger_engine.add(position_dict)
+        account_stream.position_opened(position_dict)
+    book_sync.opened(positions)
 
-@app.get("/api/positions/{account_type}")
-async def get_positions(account_type: str, current_user=Depends(get_current_user)):
-    positions = []
-    cursor = db.positions.find({
-        "user_id": current_user['user_id'],
-        "account_type": account_type,
-        "status": {"$ne": "closed"}
-    })
-    async for position in cursor:
-        symbol = position['symbol']
-        current_price = current_prices[symbol]['bid']
-        open_price = position['open_price']
-        volume = position['volume']
-        leverage = position['leverage']
-
-        if position['order_type'] == 'buy':
-            pips = current_price - open_price
-        else:
-            pips = open_price - current_price
+@app.post("/api/orders")
+async def place_order(order: Order, current_user=Depends(get_current_user),
+                      idempotency_key: Optional[str] = Header(None)):
+    # Sécurité : forcer user_id depuis token
+    order.user_id = current_user['user_id']
+    return await idempotency.run(idempotency_key, order.user_id, 'orders', order, lambda: execute_order(order))
 
-        pip_value = 0.0001 if symbol == 'EURUSD' else 0.01
-        profit_loss = (pips / pip_value) * volume * leverage * pip_value
+async def execute_order(order: Order):
+    symbol_prices = current_prices.get(order.symbol)
+    if not symbol_prices:
+        raise HTTPException(status_code=400, detail="Symbole invalide")
 
-        position['current_price'] = current_price
-        position['profit_loss'] = round(profit_loss, 2)
-        position['_id'] = str(position['_id'])
-        positions.append(position)
+    open_price = symbol_prices['bid'] if order.order_type == 'sell' else symbol_prices['ask']
+    rejection = order_rejection(order, open_price)
+    if rejection:
+        raise HTTPException(status_code=400, detail=rejection)
+
+    # Refusé d'emblée plutôt qu'accepté puis liquidé au tick suivant
+    await account_state.ensure(db, order.user_id, order.account_type)
+    if required_margin(order, open_price) > account_state.free_margin(order.user_id, order.account_type):
+        raise HTTPException(status_code=400, detail="Marge libre insuffisante")
+    order_dict, position_dict = order_documents(order, open_price)
+    await db.orders.insert_one(order_dict)
+    await db.positions.insert_one(position_dict)
+    track_positions([position_dict])
 
-    return positions
+    return {"order_id": order_dict['order_id'], "position_id": position_dict['position_id'], "status": "executed"}
 
-@app.delete("/api/positions/{position_id}")
-async def close_position(position_id: str, current_user=Depends(get_current_user)):
-    position = await db.positions.find_one({"position_id": position_id, "user_id": current_user['user_id']})
-    if not position:
-        raise HTTPException(status_code=404, detail="Position non trouvée")
+async def insert_order_batch(orders: List[dict], positions: List[dict]):
+    # Ordres et positions écrits ensemble ; sans replica set (pas de
+    # transactions), repli sur deux insert_many simples
+    try:
+        async with await database.get_client().start_session() as session:
+            async with session.start_transaction():
+                await db.orders.insert_many(orders, ordered=False, session=session)
+                await db.positions.insert_many(positions, ordered=False, session=session)
+        return
+    except OperationFailure as exc:
+        if exc.code != ILLEGAL_OPERATION:
+            raise
+    await db.orders.insert_many(orders, ordered=False)
+    await db.positions.insert_many(positions, ordered=False)
+
+@app.post("/api/orders/batch")
+async def place_orders(batch: OrderBatch, current_user=Depends(get_current_user),
+                       idempotency_key: Optional[str] = Header(None)):
+    for order in batch.orders:
+        order.user_id = current_user['user_id']
+    return await idempotency.run(idempotency_key, current_user['user_id'], 'orders/batch', batch,
+                                 lambda: execute_order_batch(batch))
+
+async def execute_order_batch(batch: OrderBatch):
+    # Tous les ordres du lot sont validés sur le même instantané de prix et
+    # la marge libre de chaque compte est consommée ordre par ordre
+    snapshot = {symbol: (price['bid'], price['ask']) for symbol, price in current_prices.items()}
+    user_id = batch.orders[0].user_id
+    free_margin = {}
+    for account_type in {order.account_type for order in batch.orders}:
+        await account_state.ensure(db, user_id, account_type)
+        free_margin[account_type] = account_state.free_margin(user_id, account_type)
+    results, orders, positions = [], [], []
+    for index, order in enumerate(batch.orders):
+        quote = snapshot.get(order.symbol)
+        if quote is None:
+            results.append({"index": index, "status": "rejected", "detail": "Symbole invalide"})
+            continue
+        open_price = quote[0] if order.order_type == 'sell' else quote[1]
+        rejection = order_rejection(order, open_price)
+        if rejection:
+            results.append({"index": index, "status": "rejected", "detail": rejection})
+            continue
+        margin = required_margin(order, open_price)
+        if margin > free_margin[order.account_type]:
+            results.append({"index": index, "status": "rejected", "detail": "Marge libre insuffisante"})
+            continue
+        free_margin[order.account_type] -= margin
+        order_dict, position_dict = order_documents(order, open_price)
+        orders.append(order_dict)
+        positions.append(position_dict)
+        results.append({"index": index, "status": "executed", "order_id": order_dict['order_id'],
+                        "position_id": position_dict['position_id']})
+
+    if orders:
+        try:
+            await insert_order_batch(orders, positions)
+        except PyMongoError as exc:
+            logger.error("Lot de %d ordres non enregistré : %s", len(orders), exc)
+            raise HTTPException(status_code=503, detail="Enregistrement des ordres impossible, lot annulé")
+        track_positions(positions)
+
+    return {"executed": len(orders), "rejected": len(results) - len(orders), "results": results}
+
+@app.get("/api/accounts")
+async def get_accounts(current_user=Depends(get_current_user)):
+    accounts = []
+    for account_type in INITIAL_BALANCES:
+        await account_state.ensure(db, current_user['user_id'], account_type)
+        accounts.append(account_state.snapshot(current_user['user_id'], account_type))
+    return accounts
+
+@app.get("/api/accounts/{account_type}")
+async def get_account(account_type: str, current_user=Depends(get_current_user)):
+    # Solde, équité et marge précalculés au dernier tick : lecture O(1)
+    if account_type not in INITIAL_BALANCES:
+        raise HTTPException(status_code=404, detail="Compte non trouvé")
+    await account_state.ensure(db, current_user['user_id'], account_type)
+    return account_state.snapshot(current_user['user_id'], account_type)
+
+@app.get("/api/stream/{account_type}")
+async def stream_account(account_type: str, current_user=Depends(get_current_user)):
+    # SSE : instantané puis deltas (ouvertures, fermetures, P&L, compte)
+    if account_type not in INITIAL_BALANCES:
+        raise HTTPException(status_code=404, detail="Compte non trouvé")
+    if account_stream.full:
+        raise HTTPException(status_code=503, detail="Trop de flux ouverts")
+    await account_state.ensure(db, current_user['user_id'], account_type)
+    return StreamingResponse(
+        account_stream.events(current_user['user_id'], account_type),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    current_price = current_prices[position['symbol']]['bid']
+@app.get("/api/positions/{account_type}", response_class=ORJSONResponse)
+async def get_positions(account_type: str, current_user=Depends(get_current_user)):
+    # Servi depuis le carnet en mémoire, revalorisé à chaque tick ; orjson
+    # sérialise directement (datetimes natifs) sans passer par jsonable_encoder
+    return ORJSONResponse(position_book.for_account(current_user['user_id'], account_type))
 
-    result = await db.positions.update_one(
-        {"position_id": position_id},
+@app.delete("/api/positions/{position_id}")
+async def close_position(position_id: str, current_user=Depends(get_current_user),
+                         idempotency_key: Optional[str] = Header(None)):
+    return await idempotency.run(idempotency_key, current_user['user_id'], 'positions/close',
+                                 {"position_id": position_id},
+                                 lambda: execute_close(position_id, current_user['user_id']))
+
+def close_pipeline(prices: Dict[str, dict], reason: str, closed_at: datetime,
+                   symbol: Optional[str] = None) -> List[dict]:
+    # Pipeline d'update : prix de sortie selon le sens (bid pour BUY, ask
+    # pour SELL) et P&L réalisé calculés par le serveur sur le document fermé.
+    # Symbole connu (position présente dans le livre) : un seul $cond ; sinon
+    # $switch sur tous les symboles cotés
+    is_buy = {"$eq": ["$order_type", "buy"]}
+    if symbol in prices:
+        price = prices[symbol]
+        close_price = {"$cond": [is_buy, price['bid'], price['ask']]}
+    else:
+        branches = [
+            {"case": {"$eq": ["$symbol", quoted]}, "then": {"$cond": [is_buy, price['bid'], price['ask']]}}
+            for quoted, price in prices.items()
+        ]
+        close_price = {"$switch": {"branches": branches, "default": "$current_price"}}
+    return [
+        {"$set": {"close_price": close_price}},
         {"$set": {
-            "status": "closed",
-            "close_reason": "Fermeture manuelle",
-            "close_price": current_price,
-            "closed_at": datetime.now()
+            "status": {"$literal": "closed"},
+            "close_reason": {"$literal": reason},
+            "current_price": "$close_price",
+            "profit_loss": {"$round": [{"$multiply": [
+                {"$cond": [is_buy, 1, -1]},
+                {"$subtract": ["$close_price", "$open_price"]},
+                "$volume", "$leverage"
+            ]}, 2]},
+            "closed_at": {"$literal": closed_at}
         }}
+    ]
+
+async def execute_close(position_id: str, user_id: str):
+    # Une seule opération conditionnelle : pas de fenêtre entre lecture et écriture
+    # (le symbole d'une position ne change jamais, le livre suffit à le donner)
+    booked = position_book.get(position_id)
+    symbol = booked['symbol'] if booked is not None else None
+    position = await db.positions.find_one_and_update(
+        {"position_id": position_id, "user_id": user_id, "status": "open"},
+        close_pipeline(current_prices, MANUAL_CLOSE, datetime.now(), symbol),
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
     )
+    if position is None:
+        raise HTTPException(status_code=404, detail="Position non trouvée")
 
-    if result.modified_count == 1:
-        return {"status": "closed", "close_price": current_price}
+    position_book.remove(position_id)
+    trigger_engine.discard(position_id)
+    await account_state.realize(db, {(user_id, position['account_type']): position['profit_loss']})
+    fields = {field: position[field] for field in ('status', 'close_reason', 'close_price', 'profit_loss', 'closed_at')}
+    account_stream.position_closed(position, fields)
+    book_sync.closed([(position, fields)])
+    return {"status": "closed", "close_price": position['close_price'],
+            "profit_loss": position['profit_loss'], "position": position}
+
+@app.post("/api/positions/close")
+async def close_positions(request: ClosePositionsRequest, current_user=Depends(get_current_user),
+                          idempotency_key: Optional[str] = Header(None)):
+    return await idempotency.run(idempotency_key, current_user['user_id'], 'positions/close-many', request,
+                                 lambda: execute_close_many(request, current_user['user_id']))
+
+async def execute_close_many(request: ClosePositionsRequest, user_id: str):
+    """Ferme plusieurs positions (toutes celles du compte si position_ids
+    est omis) en un seul bulk_write, au même instantané de prix."""
+    position_ids = None if request.position_ids is None else list(dict.fromkeys(request.position_ids))
+    if position_ids is None:
+        positions = position_book.for_account(user_id, request.account_type)
     else:
-        raise HTTPException(status_code=404, detail="Position non trouvée")
+        positions = [position_book.get(position_id) for position_id in position_ids]
+        # Ouvertes à l'instant par un autre worker, pas encore répliquées ici
+        missing = [position_id for position_id, position in zip(position_ids, positions) if position is None]
+        if missing:
+            positions += await db.positions.find(
+                {"position_id": {"$in": missing}, "user_id": user_id, "status": "open"}, {"_id": 0}
+            ).to_list(length=len(missing))
+    owned = [
+        position for position in positions
+        if position is not None and position['user_id'] == user_id
+        and position['account_type'] == request.account_type
+    ]
 
-@app.get("/api/history/{account_type}")
-async def get_trade_history(account_type: str, current_user=Depends(get_current_user)):
-    history = []
-    cursor = db.positions.find({
+    closed_at = datetime.now()
+    closes = []
+    for position in owned:
+        close_price = close_price_for(position['order_type'], current_prices[position['symbol']])
+        closes.append((position, closed_fields(position, MANUAL_CLOSE, close_price, closed_at)))
+    for position, _ in closes:
+        position_book.remove(position['position_id'])
+        trigger_engine.discard(position['position_id'])
+
+    try:
+        written = await write_closes(closes)
+    except PyMongoError as exc:
+        logger.error("Fermeture de %d positions non enregistrée : %s", len(closes), exc)
+        restore_positions(closes)
+        raise HTTPException(status_code=503, detail="Fermeture des positions impossible, réessayez")
+
+    results = {}
+    for position, fields in written:
+        results[position['position_id']] = {"position_id": position['position_id'], "status": "closed",
+                                            "close_price": fields['close_price'], "profit_loss": fields['profit_loss']}
+
+    for position_id in position_ids or [position['position_id'] for position in owned]:
+        results.setdefault(position_id, {"position_id": position_id, "status": "not_found"})
+    closed = [result for result in results.values() if result['status'] == 'closed']
+    return {"closed": len(closed), "profit_loss": round(sum(result['profit_loss'] for result in closed), 2),
+            "results": list(results.values())}
+
+HISTORY_PAGE_SIZE = 100
+HISTORY_MAX_PAGE_SIZE = 1000
+FIELD_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def encode_history_cursor(position: dict) -> str:
+    raw = json.dumps([position['closed_at'].isoformat(), position['position_id']])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_history_cursor(cursor: str):
+    try:
+        closed_at, position_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(closed_at), str(position_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+
+def history_projection(fields: Optional[str]) -> dict:
+    # _id exclu à la requête : rien à convertir avant la sérialisation
+    if not fields:
+        return {"_id": 0}
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    if not all(FIELD_NAME.match(name) for name in names):
+        raise HTTPException(status_code=400, detail="Champs invalides")
+    # closed_at et position_id sont toujours nécessaires au curseur
+    return {"_id": 0, **{name: 1 for name in names + ['closed_at', 'position_id']}}
+
+@app.get("/api/history/{account_type}", response_class=ORJSONResponse)
+async def get_trade_history(
+    account_type: str,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user=Depends(get_current_user)
+):
+    query = {
         "user_id": current_user['user_id'],
         "account_type": account_type,
         "status": "closed"
-    }).sort("closed_at", -1)
-
-    async for position in cursor:
-        position['_id'] = str(position['_id'])
-        history.append(position)
+    }
+    before_key = decode_history_cursor(before) if before else None
+    if before_key:
+        closed_at, position_id = before_key
+        query["$or"] = [
+            {"closed_at": {"$lt": closed_at}},
+            {"closed_at": closed_at, "position_id": {"$lt": position_id}}
+        ]
+
+    projection = history_projection(fields)
+    cursor = db.positions.find(query, projection) \
+        .sort([("closed_at", -1), ("position_id", -1)]) \
+        .limit(limit + 1)
+    history = await cursor.to_list(length=limit + 1)
+
+    # Page incomplète : la suite est dans l'archive Parquet (toujours plus ancienne)
+    if len(history) <= limit:
+        if history:
+            before_key = (history[-1]['closed_at'], history[-1]['position_id'])
+        archived = await position_archive.history_page(
+            db, current_user['user_id'], account_type, before_key, limit + 1 - len(history)
+        )
+        if len(projection) > 1:
+            archived = [{name: row.get(name) for name in projection if name != '_id'} for row in archived]
+        history += archived
+
+    next_cursor = None
+    if len(history) > limit:
+        history = history[:limit]
+        next_cursor = encode_history_cursor(history[-1])
+
+    return ORJSONResponse({"items": history, "next_cursor": next_cursor})
+
+def export_response(cursor, export_format: str, columns, filename: str) -> StreamingResponse:
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Format invalide (ndjson, csv ou parquet)")
+    # Flux direct depuis le curseur Motor, sans Content-Length : transfert par morceaux
+    return StreamingResponse(
+        export_stream(cursor, export_format, columns),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'},
+    )
 
-    return history
+@app.get("/api/history/{account_type}/export")
+async def export_trade_history(account_type: str, format: str = 'ndjson', current_user=Depends(get_current_user)):
+    cursor = db.positions.find(
+        {"user_id": current_user['user_id'], "account_type": account_type, "status": "closed"},
+        {"_id": 0}
+    ).sort([("closed_at", 1), ("position_id", 1)]).batch_size(EXPORT_BATCH_SIZE)
+
+    async def archive_then_hot():
+        # Archive Parquet d'abord (plus ancienne), puis positions fermées en base
+        async for row in position_archive.iter_rows(db, current_user['user_id'], account_type):
+            yield row
+        async for row in cursor:
+            yield row
+
+    return export_response(archive_then_hot(), format, HISTORY_COLUMNS, f"historique-{account_type}")
+
+@app.get("/api/history/{account_type}/summary")
+async def get_history_summary(account_type: str, current_user=Depends(get_current_user)):
+    # Synthèses mensuelles laissées par l'archivage
+    cursor = db.position_archive.find(
+        {"user_id": current_user['user_id'], "account_type": account_type},
+        {"_id": 0, "files": 0}
+    ).sort("month", -1)
+    return ORJSONResponse(await cursor.to_list(length=None))
+
+@app.get("/api/orders/{account_type}/export")
+async def export_orders(account_type: str, format: str = 'ndjson', current_user=Depends(get_current_user)):
+    cursor = db.orders.find(
+        {"user_id": current_user['user_id'], "account_type": account_type},
+        {"_id": 0}
+    ).sort([("timestamp", 1), ("order_id", 1)])
+    return export_response(cursor, format, ORDER_COLUMNS, f"ordres-{account_type}")
 
 # --- Lance le serveur si exécuté directement ---
 if __name__ == "__main__":
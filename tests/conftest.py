@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+# server.py exige une clé Stripe à l'import ; les tests n'appellent pas Stripe
+os.environ.setdefault('STRIPE_API_KEY', 'sk_test_placeholder')
+
+
+@pytest.fixture
+def trading_db(monkeypatch):
+    """Base en mémoire et état neuf du serveur (carnet, SL/TP, soldes,
+    flux) ; le journal entre workers n'est pas ouvert, rien n'est publié."""
+    import server
+    from account_state import AccountState
+    from account_stream import AccountStreamHub
+    from book_events import BookEventLog, BookSync
+    from position_book import PositionBook
+    from tests.fake_mongo import FakeDB
+    from trigger_engine import TriggerEngine
+
+    book = PositionBook()
+    triggers = TriggerEngine()
+    accounts = AccountState(book)
+    stream = AccountStreamHub(book, accounts)
+    database = FakeDB()
+    for name, value in (('db', database), ('position_book', book), ('trigger_engine', triggers),
+                        ('account_state', accounts), ('account_stream', stream),
+                        ('book_sync', BookSync(BookEventLog(), book, triggers, accounts, stream)),
+                        ('current_prices', {'EURUSD': {'bid': 1.2, 'ask': 1.2002}})):
+        monkeypatch.setattr(server, name, value)
+    return database
@@ -0,0 +1,174 @@
+import copy
+from types import SimpleNamespace
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+
+# --- Base Mongo minimale en mémoire (opérateurs utilisés par le serveur) ---
+def matches(document: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        if field == '$or':
+            if not any(matches(document, option) for option in condition):
+                return False
+            continue
+        value = document.get(field)
+        if isinstance(condition, dict):
+            for operator, operand in condition.items():
+                if operator == '$lt' and not (value is not None and value < operand):
+                    return False
+                if operator == '$lte' and not (value is not None and value <= operand):
+                    return False
+                if operator == '$ne' and value == operand:
+                    return False
+                if operator == '$in' and value not in operand:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def project(document: dict, projection) -> dict:
+    document = copy.deepcopy(document)
+    if not projection:
+        return document
+    included = [field for field, flag in projection.items() if flag]
+    if included:
+        return {field: document[field] for field in included if field in document}
+    return {field: value for field, value in document.items() if projection.get(field, 1)}
+
+
+def apply_update(document: dict, update: dict):
+    for field, value in update.get('$set', {}).items():
+        document[field] = value
+    for field in update.get('$unset', {}):
+        document.pop(field, None)
+    for field, amount in update.get('$inc', {}).items():
+        document[field] = document.get(field, 0) + amount
+    for field, value in update.get('$min', {}).items():
+        document[field] = min(document.get(field, value), value)
+    for field, value in update.get('$max', {}).items():
+        document[field] = max(document.get(field, value), value)
+    for field, value in update.get('$addToSet', {}).items():
+        values = document.setdefault(field, [])
+        if value not in values:
+            values.append(value)
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, key, direction=1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, order in reversed(keys):
+            self.documents.sort(key=lambda document: document[field], reverse=order < 0)
+        return self
+
+    def limit(self, count):
+        self.documents = self.documents[:count]
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    async def to_list(self, length=None):
+        return self.documents if length is None else self.documents[:length]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self.documents:
+            yield document
+
+
+class FakeCollection:
+    def __init__(self, documents=()):
+        self.documents = [dict(document) for document in documents]
+        self.finds = 0
+
+    def _first(self, query):
+        return next((document for document in self.documents if matches(document, query)), None)
+
+    def find(self, query=None, projection=None):
+        self.finds += 1
+        return FakeCursor([project(document, projection) for document in self.documents
+                           if matches(document, query or {})])
+
+    async def find_one(self, query):
+        document = self._first(query)
+        return copy.deepcopy(document) if document is not None else None
+
+    async def insert_one(self, document):
+        if '_id' in document and self._first({'_id': document['_id']}) is not None:
+            raise DuplicateKeyError(f"E11000 duplicate key: {document['_id']}")
+        document.setdefault('_id', len(self.documents) + 1)
+        self.documents.append(copy.deepcopy(document))
+
+    async def update_one(self, query, update):
+        document = self._first(query)
+        if document is not None:
+            apply_update(document, update)
+        return SimpleNamespace(modified_count=int(document is not None))
+
+    async def insert_many(self, documents, **kwargs):
+        for document in documents:
+            await self.insert_one(document)
+
+    async def find_one_and_update(self, query, update, projection=None, upsert=False,
+                                  return_document=ReturnDocument.BEFORE, **kwargs):
+        document = self._first(query)
+        if document is None:
+            if not upsert:
+                return None
+            document = {field: value for field, value in query.items() if not isinstance(value, dict)}
+            document.update(update.get('$setOnInsert', {}))
+            self.documents.append(document)
+        before = project(document, projection)
+        apply_update(document, update)
+        return project(document, projection) if return_document == ReturnDocument.AFTER else before
+
+    async def bulk_write(self, operations, ordered=True):
+        modified = 0
+        for operation in operations:
+            query, update = operation._filter, operation._doc
+            document = self._first(query)
+            if document is None:
+                if not operation._upsert:
+                    continue
+                document = dict(query)
+                self.documents.append(document)
+            else:
+                modified += 1
+            apply_update(document, update)
+        return SimpleNamespace(modified_count=modified)
+
+    async def count_documents(self, query, limit=None):
+        count = sum(1 for document in self.documents if matches(document, query))
+        return min(count, limit) if limit else count
+
+    async def distinct(self, field, query=None):
+        return list(dict.fromkeys(document[field] for document in self.documents if matches(document, query or {})))
+
+    async def delete_one(self, query):
+        document = self._first(query)
+        if document is not None:
+            self.documents.remove(document)
+
+    async def delete_many(self, query):
+        self.documents = [document for document in self.documents if not matches(document, query)]
+
+
+class FakeDB:
+    def __init__(self, **collections):
+        for name, documents in collections.items():
+            setattr(self, name, FakeCollection(documents))
+
+    def __getattr__(self, name):
+        collection = FakeCollection()
+        setattr(self, name, collection)
+        return collection
+
+    def __getitem__(self, name):
+        return getattr(self, name)
@@ -0,0 +1,30 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import backtest
+from backtest import BacktestRequest
+from tests.fake_mongo import FakeDB
+
+
+@pytest.fixture
+def db():
+    start = datetime(2026, 10, 1)
+    return FakeDB(ticks=[
+        {'symbol': 'EURUSD', 'time': start + timedelta(seconds=i), 'bid': 1.1 + i / 10000, 'ask': 1.1002 + i / 10000}
+        for i in range(50)
+    ])
+
+
+def test_history_over_the_limit_is_refused_before_loading(db, monkeypatch):
+    monkeypatch.setattr(backtest, 'MAX_BACKTEST_TICKS', 49)
+    with pytest.raises(ValueError, match="Historique trop long"):
+        asyncio.run(backtest.backtest(db, BacktestRequest(symbol='EURUSD')))
+    assert db.ticks.finds == 0
+
+
+def test_history_within_the_limit_is_replayed(db, monkeypatch):
+    monkeypatch.setattr(backtest, 'MAX_BACKTEST_TICKS', 50)
+    report = asyncio.run(backtest.backtest(db, BacktestRequest(symbol='EURUSD', sides=['buy'], curve_points=2)))
+    assert len(report['times']) == 2 and report['results'][0]['side'] == 'buy'
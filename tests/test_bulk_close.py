@@ -0,0 +1,86 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from pymongo.errors import PyMongoError
+
+import server
+
+
+def open_position(position_id):
+    return {
+        'position_id': position_id, 'user_id': 'u', 'account_type': 'demo', 'symbol': 'EURUSD',
+        'order_type': 'buy', 'volume': 1.0, 'leverage': 100.0, 'open_price': 1.1, 'stop_loss': 1.0,
+        'timestamp': datetime(2026, 10, 16, 12, 0), 'status': 'open',
+    }
+
+
+@pytest.fixture
+def db(trading_db):
+    trading_db.positions.documents = [open_position('a'), open_position('b')]
+    trading_db.accounts.documents = [
+        {'user_id': 'u', 'account_type': 'demo', 'account_id': 'acc', 'balance': 1000.0, 'version': 0},
+    ]
+    asyncio.run(server.account_state.load(trading_db, [('u', 'demo')]))
+    for position_id in ('a', 'b'):
+        server.position_book.add(open_position(position_id))
+        server.trigger_engine.add(open_position(position_id))
+    return trading_db
+
+
+def close(position_ids):
+    request = server.ClosePositionsRequest(account_type='demo', position_ids=position_ids)
+    return asyncio.run(server.execute_close_many(request, 'u'))
+
+
+def balance(db):
+    return db.accounts.documents[0]['balance']
+
+
+def test_duplicate_ids_are_closed_and_credited_once(db):
+    result = close(['a', 'a', 'b', 'a'])
+
+    # (1.2 - 1.1) * 1 * 100 par position
+    assert result['closed'] == 2 and result['profit_loss'] == pytest.approx(20.0)
+    assert [item['position_id'] for item in result['results']] == ['a', 'b']
+    assert balance(db) == pytest.approx(1020.0)
+    assert {document['status'] for document in db.positions.documents} == {'closed'}
+    assert len(server.position_book) == 0 and len(server.trigger_engine) == 0
+
+
+def test_position_closed_by_another_worker_is_not_credited(db):
+    db.positions.documents[1]['status'] = 'closed'
+    result = close(['a', 'b'])
+
+    assert result['closed'] == 1
+    assert {item['position_id']: item['status'] for item in result['results']} == {'a': 'closed',
+                                                                                 'b': 'not_found'}
+    assert balance(db) == pytest.approx(1010.0)
+
+
+def test_failed_write_puts_the_positions_back(db, monkeypatch):
+    async def failing_bulk_write(operations, ordered=True):
+        raise PyMongoError("écriture refusée")
+
+    monkeypatch.setattr(db.positions, 'bulk_write', failing_bulk_write)
+    with pytest.raises(HTTPException) as error:
+        close(['a', 'a', 'b'])
+
+    assert error.value.status_code == 503
+    assert 'a' in server.position_book and 'b' in server.position_book
+    assert len(server.trigger_engine) == 2
+    assert balance(db) == 1000.0
+
+
+def test_close_pipeline_uses_the_booked_symbol_only():
+    prices = {'EURUSD': {'bid': 1.2, 'ask': 1.3}, 'GBPUSD': {'bid': 1.5, 'ask': 1.6}}
+    closed_at = datetime(2026, 10, 16, 13, 0)
+
+    known = server.close_pipeline(prices, server.MANUAL_CLOSE, closed_at, 'EURUSD')
+    assert known[0]['$set']['close_price'] == {'$cond': [{'$eq': ['$order_type', 'buy']}, 1.2, 1.3]}
+
+    # Position absente du livre : repli sur le $switch de tous les symboles
+    unknown = server.close_pipeline(prices, server.MANUAL_CLOSE, closed_at)
+    branches = unknown[0]['$set']['close_price']['$switch']['branches']
+    assert [branch['case'] for branch in branches] == [{'$eq': ['$symbol', 'EURUSD']}, {'$eq': ['$symbol', 'GBPUSD']}]
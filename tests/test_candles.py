@@ -0,0 +1,26 @@
+from candles import CandleStore
+
+
+def feed(store, count, start=1000.0):
+    for i in range(count):
+        store.on_tick({'EURUSD': {'bid': 1.1 + i / 1000, 'ask': 1.1002 + i / 1000}}, start + i)
+
+
+def test_recent_ticks_come_from_the_ring_in_order():
+    store = CandleStore(['EURUSD'], tick_capacity=100)
+    feed(store, 150)
+
+    ticks = store.recent_ticks('EURUSD', float('-inf'), float('inf'), 1000)
+    assert len(ticks) == 100 and ticks[0]['time'] == 1050.0 and ticks[-1]['time'] == 1149.0
+    assert store.recent_ticks('EURUSD', 1100.0, 1110.0, 3) == [
+        {'time': 1108.0 + i, 'bid': 1.1 + (108 + i) / 1000, 'ask': 1.1002 + (108 + i) / 1000} for i in range(3)
+    ]
+
+
+def test_minute_bars_aggregate_the_same_ticks():
+    store = CandleStore(['EURUSD'])
+    feed(store, 120, start=60 * 100)
+
+    first, second = store.candles('EURUSD', '1m', 0, float('inf'))
+    assert (first['open'], first['close'], first['ticks']) == (1.1, 1.1 + 59 / 1000, 60)
+    assert second['high'] == 1.1 + 119 / 1000
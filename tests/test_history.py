@@ -0,0 +1,78 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import orjson
+import pytest
+
+pytest.importorskip('pyarrow')
+
+import server
+from fastapi import HTTPException
+from position_archive import PositionArchive
+from tests.fake_mongo import FakeDB
+
+USER = {'user_id': 'u'}
+
+
+def closed_position(index, closed_at):
+    return {
+        'position_id': f"p{index:03d}", 'user_id': 'u', 'account_type': 'demo', 'symbol': 'EURUSD',
+        'order_type': 'buy', 'volume': 1.0, 'leverage': 100.0, 'open_price': 1.1, 'close_price': 1.2,
+        'profit_loss': 1.0, 'status': 'closed', 'timestamp': closed_at - timedelta(hours=1),
+        'closed_at': closed_at,
+    }
+
+
+def test_cursor_round_trip_keeps_microseconds():
+    position = {'closed_at': datetime(2026, 10, 16, 23, 0, 0, 123456), 'position_id': 'p1'}
+    assert server.decode_history_cursor(server.encode_history_cursor(position)) == (position['closed_at'], 'p1')
+
+
+@pytest.mark.parametrize('cursor', ['', 'pas-un-curseur', 'WzFd', 'eyJhIjogMX0='])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        server.decode_history_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    # 12 positions archivées (plus de 90 jours), 7 restées en base, dont
+    # deux fermées à la même seconde de part et d'autre de la limite de page
+    now = datetime.now().replace(microsecond=0)
+    positions = [closed_position(i, now - timedelta(days=200 - 5 * i)) for i in range(12)]
+    positions += [closed_position(12 + i, now - timedelta(days=7 - i)) for i in range(6)]
+    positions.append(closed_position(18, positions[-1]['closed_at']))
+    db = FakeDB(positions=positions)
+    archive = PositionArchive(str(tmp_path), after_days=90)
+    assert asyncio.run(archive.run_once(db)) == 12
+    monkeypatch.setattr(server, 'db', db)
+    monkeypatch.setattr(server, 'position_archive', archive)
+    return sorted(positions, key=lambda p: (p['closed_at'], p['position_id']), reverse=True)
+
+
+def fetch_pages(limit, fields=None):
+    pages, cursor = [], None
+    while True:
+        response = asyncio.run(server.get_trade_history('demo', limit=limit, before=cursor, fields=fields,
+                                                        current_user=USER))
+        body = orjson.loads(response.body)
+        pages.append(body['items'])
+        cursor = body['next_cursor']
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize('limit', [1, 3, 7, 8, 100])
+def test_pages_run_from_the_hot_collection_into_the_archive(history, limit):
+    pages = fetch_pages(limit)
+    ids = [item['position_id'] for page in pages for item in page]
+    assert ids == [position['position_id'] for position in history]
+    assert all(len(page) == limit for page in pages[:-1])
+    assert [item.get('archived', False) for item in pages[-1]][-1] is True
+
+
+def test_projection_applies_to_archived_rows(history):
+    items = [item for page in fetch_pages(5, fields='profit_loss') for item in page]
+    assert len(items) == len(history)
+    assert all(set(item) == {'profit_loss', 'closed_at', 'position_id'} for item in items)
@@ -0,0 +1,119 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+from pymongo.errors import PyMongoError
+
+from idempotency import IdempotencyStore
+from tests.fake_mongo import FakeDB
+
+KEY = 'u:orders:k1'
+
+
+class Handler:
+    def __init__(self, response=None, error=None):
+        self.calls = 0
+        self.response = response or {'status': 'executed'}
+        self.error = error
+
+    async def __call__(self):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+
+def run(store, handler, payload=None):
+    return asyncio.run(store.run('k1', 'u', 'orders', payload or {'volume': 1}, handler))
+
+
+def fresh_store(db):
+    # Autre worker : cache vide, même base
+    return IdempotencyStore(db, lease=30)
+
+
+def test_replay_returns_the_recorded_response_without_rerunning():
+    db = FakeDB()
+    handler = Handler()
+    assert run(fresh_store(db), handler) == {'status': 'executed'}
+    replay = run(fresh_store(db), handler)
+    assert replay.headers['Idempotent-Replayed'] == 'true' and handler.calls == 1
+    assert 'locked_until' not in db.idempotency_keys.documents[0]
+
+
+def test_pending_key_within_its_lease_is_a_409():
+    db = FakeDB()
+    now = datetime.now(timezone.utc)
+    asyncio.run(db.idempotency_keys.insert_one({
+        '_id': KEY, 'fingerprint': IdempotencyStore.fingerprint({'volume': 1}), 'status': 'pending',
+        'locked_until': now + timedelta(seconds=10), 'created_at': now,
+    }))
+    handler = Handler()
+    with pytest.raises(HTTPException) as error:
+        run(fresh_store(db), handler)
+    assert error.value.status_code == 409 and handler.calls == 0
+
+
+@pytest.mark.parametrize('locked_until', [datetime.utcnow() - timedelta(seconds=1), None])
+def test_expired_lease_is_taken_over(locked_until):
+    # Worker arrêté pendant la requête (None : réservation antérieure aux baux)
+    db = FakeDB()
+    asyncio.run(db.idempotency_keys.insert_one({
+        '_id': KEY, 'fingerprint': IdempotencyStore.fingerprint({'volume': 1}), 'status': 'pending',
+        'locked_until': locked_until, 'created_at': datetime.now(timezone.utc),
+    }))
+    store, handler = fresh_store(db), Handler()
+    assert run(store, handler) == {'status': 'executed'}
+    assert handler.calls == 1 and store.takeovers == 1
+    assert db.idempotency_keys.documents[0]['status'] == 'done'
+
+
+def test_expired_lease_of_another_request_is_a_422():
+    db = FakeDB()
+    asyncio.run(db.idempotency_keys.insert_one({
+        '_id': KEY, 'fingerprint': 'autre', 'status': 'pending', 'locked_until': None,
+        'created_at': datetime.now(timezone.utc),
+    }))
+    with pytest.raises(HTTPException) as error:
+        run(fresh_store(db), Handler())
+    assert error.value.status_code == 422
+
+
+def test_failed_record_is_retried_and_the_response_returned(monkeypatch):
+    db = FakeDB()
+    store, handler = fresh_store(db), Handler()
+    update_one = db.idempotency_keys.update_one
+    failures = []
+
+    async def flaky_update_one(query, update):
+        if len(failures) < 2:
+            failures.append(query)
+            raise PyMongoError("primaire indisponible")
+        return await update_one(query, update)
+
+    monkeypatch.setattr(db.idempotency_keys, 'update_one', flaky_update_one)
+    assert run(store, handler) == {'status': 'executed'}
+    assert db.idempotency_keys.documents[0]['status'] == 'done' and store.record_failures == 0
+
+
+def test_record_that_keeps_failing_still_returns_the_response(monkeypatch):
+    db = FakeDB()
+    store, handler = fresh_store(db), Handler()
+
+    async def failing_update_one(query, update):
+        raise PyMongoError("primaire indisponible")
+
+    monkeypatch.setattr(db.idempotency_keys, 'update_one', failing_update_one)
+    assert run(store, handler) == {'status': 'executed'}
+    assert store.record_failures == 1
+    # Rejeu sur le même worker servi par le cache
+    assert run(store, handler).headers['Idempotent-Replayed'] == 'true' and handler.calls == 1
+
+
+def test_server_error_releases_the_key():
+    db = FakeDB()
+    with pytest.raises(HTTPException):
+        run(fresh_store(db), Handler(error=HTTPException(status_code=503, detail="indisponible")))
+    assert db.idempotency_keys.documents == []
+    assert run(fresh_store(db), Handler()) == {'status': 'executed'}
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from account_state import INITIAL_BALANCES
+
+ASK = 1.2002
+
+
+def order(account_type='demo', volume=1.0, **fields):
+    return server.Order(user_id='u', account_type=account_type, symbol='EURUSD', order_type='buy',
+                        volume=volume, leverage=100, **fields)
+
+
+def share_of_balance(share):
+    # Volume dont la marge (volume * ask) vaut `share` du solde démo initial
+    return share * INITIAL_BALANCES['demo'] / ASK
+
+
+@pytest.fixture
+def db(trading_db, monkeypatch):
+    async def insert_order_batch(orders, positions):
+        await trading_db.orders.insert_many(orders)
+        await trading_db.positions.insert_many(positions)
+
+    # Pas de sessions dans la base en mémoire
+    monkeypatch.setattr(server, 'insert_order_batch', insert_order_batch)
+    return trading_db
+
+
+def test_order_beyond_free_margin_is_rejected_up_front(db):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(server.execute_order(order('real')))
+
+    assert (error.value.status_code, error.value.detail) == (400, "Marge libre insuffisante")
+    assert db.positions.documents == [] and len(server.position_book) == 0
+
+
+def test_covered_order_is_executed_and_uses_free_margin(db):
+    result = asyncio.run(server.execute_order(order(volume=share_of_balance(0.6))))
+
+    assert result['status'] == 'executed' and result['position_id'] in server.position_book
+    assert server.account_state.free_margin('u', 'demo') == pytest.approx(0.4 * INITIAL_BALANCES['demo'])
+    with pytest.raises(HTTPException):
+        asyncio.run(server.execute_order(order(volume=share_of_balance(0.5))))
+
+
+def test_batch_consumes_free_margin_order_by_order(db):
+    batch = server.OrderBatch(orders=[
+        order(volume=share_of_balance(0.4)),
+        order('real'),
+        order(volume=share_of_balance(0.4)),
+        order(volume=share_of_balance(0.4)),
+        order(volume=share_of_balance(0.1)),
+    ])
+    result = asyncio.run(server.execute_order_batch(batch))
+
+    assert [item['status'] for item in result['results']] == ['executed', 'rejected', 'executed', 'rejected',
+                                                              'executed']
+    assert {item['detail'] for item in result['results'] if item['status'] == 'rejected'} == {
+        "Marge libre insuffisante"}
+    assert (result['executed'], result['rejected']) == (3, 2)
+    assert len(db.positions.documents) == len(server.position_book) == 3
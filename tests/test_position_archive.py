@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from position_archive import PositionArchive
+from tests.fake_mongo import FakeDB
+
+
+def closed_position(user_id, index, closed_at):
+    return {
+        'position_id': f"{user_id}-{index:04d}", 'user_id': user_id, 'account_type': 'demo',
+        'symbol': 'EURUSD', 'order_type': 'buy', 'volume': 1.0, 'leverage': 100.0,
+        'open_price': 1.1, 'close_price': 1.2, 'profit_loss': 1.0, 'status': 'closed',
+        'timestamp': closed_at - timedelta(hours=1), 'closed_at': closed_at,
+    }
+
+
+@pytest.fixture
+def archived(tmp_path):
+    # 30 positions de "u" réparties sur trois mois, 5 de "v" sur un seul
+    start = datetime(2026, 1, 10)
+    positions = [closed_position('u', i, start + timedelta(days=3 * i)) for i in range(30)]
+    positions += [closed_position('v', i, start + timedelta(days=i)) for i in range(5)]
+    db = FakeDB(positions=positions)
+    archive = PositionArchive(str(tmp_path), after_days=0, batch_size=7)
+    assert asyncio.run(archive.run_once(db)) == 35
+    assert db.positions.documents == []
+    return archive, db, sorted(positions, key=lambda p: (p['closed_at'], p['position_id']), reverse=True)
+
+
+def page_through(archive, db, user_id, limit):
+    pages, before = [], None
+    while True:
+        rows = asyncio.run(archive.history_page(db, user_id, 'demo', before, limit))
+        if not rows:
+            return pages
+        pages.append(rows)
+        before = (rows[-1]['closed_at'], rows[-1]['position_id'])
+
+
+def test_pages_follow_the_cursor_across_months(archived):
+    archive, db, positions = archived
+    pages = page_through(archive, db, 'u', 4)
+    ids = [row['position_id'] for page in pages for row in page]
+    assert ids == [p['position_id'] for p in positions if p['user_id'] == 'u']
+    assert all(len(page) == 4 for page in pages[:-1])
+    assert all(row['archived'] and row['status'] == 'closed' for page in pages for row in page)
+
+
+def test_months_after_the_cursor_are_skipped(archived, monkeypatch):
+    archive, db, positions = archived
+    opened = []
+    read_page = archive.read_page
+    monkeypatch.setattr(archive, 'read_page', lambda user_id, months, before, limit: (
+        opened.append(months), read_page(user_id, months, before, limit))[1])
+    oldest = [p for p in positions if p['user_id'] == 'u'][-2]
+    rows = asyncio.run(archive.history_page(db, 'u', 'demo', (oldest['closed_at'], oldest['position_id']), 10))
+    assert [row['position_id'] for row in rows] == ['u-0000']
+    assert len(opened[0]) == 1
+
+
+def test_user_without_summaries_does_not_read_the_archive(archived, monkeypatch):
+    archive, db, _ = archived
+    monkeypatch.setattr(archive, 'read_page', lambda *args: pytest.fail("archive lue"))
+    assert asyncio.run(archive.history_page(db, 'nobody', 'demo', None, 10)) == []
+
+
+def test_iter_rows_reads_only_the_user_files_oldest_first(archived):
+    archive, db, positions = archived
+
+    async def collect():
+        return [row['position_id'] async for row in archive.iter_rows(db, 'v', 'demo')]
+
+    assert asyncio.run(collect()) == [f"v-{i:04d}" for i in range(5)]
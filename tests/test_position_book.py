@@ -0,0 +1,78 @@
+from datetime import datetime
+
+import pytest
+
+from position_book import PositionBook
+
+
+def position(position_id, user_id='u', order_type='buy', symbol='EURUSD', open_price=1.1, volume=1000.0,
+             leverage=1.0, account_type='demo'):
+    return {
+        'position_id': position_id, 'user_id': user_id, 'account_type': account_type, 'symbol': symbol,
+        'order_type': order_type, 'open_price': open_price, 'volume': volume, 'leverage': leverage,
+        'timestamp': datetime(2026, 10, 16, 12, 0), 'status': 'open',
+    }
+
+
+PRICES = {'EURUSD': {'bid': 1.2, 'ask': 1.21}}
+
+
+def test_remove_moves_the_last_row_into_the_freed_slot():
+    book = PositionBook(capacity=4)
+    for position_id, price in (('a', 1.0), ('b', 1.1), ('c', 1.2)):
+        book.add(position(position_id, open_price=price))
+    removed = book.remove('a')
+
+    assert removed['position_id'] == 'a'
+    assert len(book) == 2 and 'a' not in book
+    assert book.ids_at([0, 1]) == ['c', 'b']
+    assert book.open_price[0] == 1.2
+    assert [p['position_id'] for p in book.for_account('u', 'demo')] == ['b', 'c']
+    assert book.remove('a') is None
+
+
+def test_columns_grow_past_their_capacity():
+    book = PositionBook(capacity=2)
+    for i in range(100):
+        book.add(position(f"p{i}", user_id=f"user{i}"))
+    book.revalue(PRICES)
+
+    assert len(book) == 100 and book.account_count == 100
+    assert book.account_totals('user99', 'demo')['profit_loss'] == pytest.approx(100.0)
+    assert book.account_totals('user0', 'demo')['margin'] == pytest.approx(1200.0)
+
+
+def test_account_totals_value_buy_at_bid_and_sell_at_ask():
+    book = PositionBook()
+    book.set_balance('u', 'demo', 1000.0)
+    book.add(position('buy'))
+    book.add(position('sell', order_type='sell', open_price=1.25))
+    book.revalue(PRICES)
+
+    # BUY : (1.2 - 1.1) * 1000 ; SELL : (1.25 - 1.21) * 1000
+    totals = book.account_totals('u', 'demo')
+    assert totals['profit_loss'] == pytest.approx(140.0)
+    assert totals['equity'] == pytest.approx(1140.0)
+    assert totals['margin'] == pytest.approx(1000 * 1.2 + 1000 * 1.21)
+    assert book.get('sell')['current_price'] == 1.21
+
+
+def test_totals_follow_open_and_close_before_the_next_tick():
+    book = PositionBook()
+    book.set_balance('u', 'demo', 1000.0)
+    book.add(position('a'))
+    book.revalue(PRICES)
+    book.add(position('b', open_price=1.0))
+    assert book.account_totals('u', 'demo')['margin'] == pytest.approx(1200.0 + 1000.0)
+
+    book.remove('a')
+    totals = book.account_totals('u', 'demo')
+    assert totals == pytest.approx({'balance': 1000.0, 'profit_loss': 0.0, 'equity': 1000.0, 'margin': 1000.0})
+
+
+def test_unknown_account_has_zero_totals():
+    book = PositionBook()
+    book.add(position('a'))
+    assert book.account_totals('nobody', 'demo') == {'balance': 0.0, 'profit_loss': 0.0, 'equity': 0.0,
+                                                     'margin': 0.0}
+    assert book.position_count('nobody', 'demo') == 0
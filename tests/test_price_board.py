@@ -0,0 +1,128 @@
+import os
+import tempfile
+import uuid
+from multiprocessing import resource_tracker, shared_memory
+
+import pytest
+
+from price_board import SEQ, TICK_HISTORY, PriceBoard
+
+pytest.importorskip('fcntl')
+
+SYMBOLS = ['EURUSD', 'USDJPY']
+
+
+class RecordingSource:
+    def __init__(self):
+        self.synced = []
+
+    def sync(self, prices, tick_time):
+        self.synced.append(({symbol: dict(price) for symbol, price in prices.items()}, tick_time))
+
+
+def quotes(bid):
+    return {symbol: {'bid': bid, 'ask': bid + 0.0002, 'base': bid} for symbol in SYMBOLS}
+
+
+def unlink(board):
+    segment = shared_memory.SharedMemory(name=board.segment_name)
+    resource_tracker.register(segment._name, 'shared_memory')
+    segment.close()
+    segment.unlink()
+    lock = os.path.join(tempfile.gettempdir(), f"{board.segment_name}.lock")
+    if os.path.exists(lock):
+        os.remove(lock)
+
+
+@pytest.fixture
+def board_name():
+    name = f"test_board_{uuid.uuid4().hex[:8]}"
+    yield name
+    unlink(PriceBoard(SYMBOLS, name))
+
+
+def boards(name):
+    # Deux "workers" : flock est exclusif entre descripteurs, même dans un seul processus
+    first, second = PriceBoard(SYMBOLS, name), PriceBoard(SYMBOLS, name)
+    first.open()
+    second.open()
+    return first, second
+
+
+def test_reader_takes_over_from_the_last_published_tick(board_name):
+    producer, reader = boards(board_name)
+    producer_source, reader_source = RecordingSource(), RecordingSource()
+    producer_prices, reader_prices = quotes(1.0), quotes(1.0)
+
+    assert producer.claim_production(producer_prices, producer_source)
+    assert not reader.claim_production(reader_prices, reader_source)
+    producer.publish(quotes(1.1), 1000.0)
+    assert reader.load_into(reader_prices) and reader_prices['EURUSD']['bid'] == 1.1
+    # Dernier tick du producteur, jamais lu par le lecteur
+    producer.publish(quotes(1.2), 1001.0)
+    producer.close()
+
+    assert reader.claim_production(reader_prices, reader_source)
+    assert reader.is_producer
+    assert reader_prices['USDJPY']['bid'] == 1.2
+    assert reader_source.synced == [(reader_prices, 1001.0)]
+    reader.publish(quotes(1.3), 1002.0)
+    assert reader.last_tick == 3
+
+    assert reader.claim_production(reader_prices, reader_source)
+    assert len(reader_source.synced) == 1
+    reader.close()
+
+
+def test_reader_replays_every_tick_at_the_producer_time(board_name):
+    producer, reader = boards(board_name)
+    assert producer.claim_production(quotes(1.0), RecordingSource())
+    for i in range(5):
+        producer.publish(quotes(1.0 + i / 100), 1000.0 + i)
+    seen = []
+    prices = quotes(0.0)
+    assert reader.load_into(prices, lambda tick_time: seen.append((tick_time, prices['EURUSD']['bid']))) == 5
+    assert seen == [(1000.0 + i, 1.0 + i / 100) for i in range(5)]
+    assert reader.load_into(prices, seen.append) == 0
+
+    # Lecteur distancé de plus que l'historique : les plus anciens sont perdus
+    for i in range(TICK_HISTORY + 3):
+        producer.publish(quotes(2.0), 2000.0 + i)
+    seen.clear()
+    assert reader.load_into(prices, seen.append) == TICK_HISTORY
+    assert seen[-1] == 2000.0 + TICK_HISTORY + 2 and reader.dropped == 3
+    producer.close()
+    reader.close()
+
+
+def test_takeover_after_a_torn_write_repairs_the_seqlock(board_name):
+    producer, reader = boards(board_name)
+    prices = quotes(1.0)
+    assert producer.claim_production(quotes(1.0), RecordingSource())
+    producer.publish(quotes(1.1), 1000.0)
+    # Producteur mort en pleine écriture : seq reste impair
+    producer._header[SEQ] += 1
+    producer.close()
+    assert reader.read() is None
+
+    assert reader.claim_production(prices, RecordingSource())
+    assert reader.read() is not None and prices['EURUSD']['bid'] == 1.1
+    reader.close()
+
+
+def test_segment_of_another_symbol_table_is_not_reused(board_name):
+    previous, _ = boards(board_name)
+    assert previous.claim_production(quotes(1.0), RecordingSource())
+    previous.publish({'EURUSD': {'bid': 1.05, 'ask': 1.05, 'base': 1.05},
+                      'USDJPY': {'bid': 150.0, 'ask': 150.0, 'base': 150.0}}, 1000.0)
+    previous.close()
+
+    # Même nom, symboles dans un autre ordre : segment distinct, rien à recharger
+    reordered = PriceBoard(list(reversed(SYMBOLS)), board_name)
+    reordered.open()
+    prices, source = quotes(1.0), RecordingSource()
+    assert reordered.segment_name != previous.segment_name
+    assert reordered.claim_production(prices, source)
+    assert prices['USDJPY']['bid'] == 1.0 and prices['EURUSD']['bid'] == 1.0
+    reordered.close()
+    unlink(reordered)
@@ -0,0 +1,101 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from position_book import PositionBook
+from risk_engine import RiskEngine
+
+PRICES = {'EURUSD': {'bid': 1.0, 'ask': 1.0}}
+
+
+def open_positions(book, user_id, balance, open_prices, volume=1000.0):
+    book.set_balance(user_id, 'demo', balance)
+    for i, open_price in enumerate(open_prices):
+        book.add({
+            'position_id': f"{user_id}-{i}", 'user_id': user_id, 'account_type': 'demo', 'symbol': 'EURUSD',
+            'order_type': 'buy', 'open_price': open_price, 'volume': volume, 'leverage': 1.0,
+            'timestamp': datetime(2026, 10, 16, 12, 0), 'status': 'open',
+        })
+
+
+def reference_liquidation(book, user_id, stop_out_level):
+    # Boucle naïve : fermer la plus grande perte tant que le niveau reste sous le seuil
+    totals = book.account_totals(user_id, 'demo')
+    equity, margin = totals['equity'], totals['margin']
+    positions = sorted(book.for_account(user_id, 'demo'), key=lambda p: p['profit_loss'])
+    closed = []
+    for position in positions:
+        if equity > 0 and 100 * equity / margin >= stop_out_level:
+            break
+        closed.append(position['position_id'])
+        margin -= position['volume'] * position['current_price']
+    return closed
+
+
+def test_closes_largest_losses_until_the_level_recovers():
+    book = PositionBook()
+    # P&L -100, -50, 0, +10 ; marge 4000, équité 1360 (34 %)
+    open_positions(book, 'u', 1500.0, [1.1, 1.05, 1.0, 0.99])
+    # Deuxième compte en stop-out : la somme cumulée repart de zéro par compte
+    open_positions(book, 'w', 700.0, [1.0, 1.1])
+    open_positions(book, 'ok', 10000.0, [1.1, 1.05])
+    book.revalue(PRICES)
+
+    events, liquidated = RiskEngine(book).check(now=0.0)
+
+    assert liquidated == ['u-0', 'u-1', 'w-1']
+    stop_outs = {event['user_id']: event['positions'] for event in events if event['type'] == 'stop_out'}
+    assert stop_outs == {'u': ['u-0', 'u-1'], 'w': ['w-1']}
+    assert {event['user_id'] for event in events if event['type'] == 'margin_call'} == {'u', 'w'}
+
+
+def test_non_positive_equity_liquidates_every_position():
+    book = PositionBook()
+    open_positions(book, 'u', 100.0, [1.2, 1.1, 0.95])
+    book.revalue(PRICES)
+    _, liquidated = RiskEngine(book).check(now=0.0)
+    assert liquidated == ['u-0', 'u-1', 'u-2']
+
+
+def test_matches_a_per_account_loop():
+    rng = np.random.default_rng(7)
+    book = PositionBook()
+    for account in range(50):
+        open_prices = 1.0 + rng.normal(0, 0.05, size=rng.integers(1, 12))
+        open_positions(book, f"user{account}", float(rng.uniform(0, 3000)), open_prices.tolist(),
+                       volume=float(rng.uniform(100, 2000)))
+    book.revalue(PRICES)
+
+    engine = RiskEngine(book)
+    _, liquidated = engine.check(now=0.0)
+    expected = []
+    for user_id, _ in book.account_keys():
+        expected += reference_liquidation(book, user_id, engine.stop_out_level)
+    assert liquidated == expected
+    assert expected
+
+
+def test_margin_call_is_reported_once_per_entry():
+    book = PositionBook()
+    open_positions(book, 'u', 800.0, [1.0])
+    book.revalue(PRICES)
+    engine = RiskEngine(book)
+
+    events, liquidated = engine.check(now=0.0)
+    assert [event['type'] for event in events] == ['margin_call'] and liquidated == []
+    assert events[0]['margin_level'] == pytest.approx(80.0)
+    assert engine.check(now=1.0) == ([], [])
+
+    book.set_balance('u', 'demo', 2000.0)
+    assert engine.check(now=2.0) == ([], [])
+    book.set_balance('u', 'demo', 800.0)
+    assert [event['type'] for event in engine.check(now=3.0)[0]] == ['margin_call']
+
+
+def test_max_liquidations_defers_the_rest_to_the_next_tick():
+    book = PositionBook()
+    open_positions(book, 'u', 0.0, [1.1, 1.05, 1.02])
+    book.revalue(PRICES)
+    _, liquidated = RiskEngine(book, max_liquidations=2).check(now=0.0)
+    assert liquidated == ['u-0', 'u-1']
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('pandas')
+
+from tick_replay import ReplayTickSource
+
+
+@pytest.fixture
+def recording(tmp_path):
+    path = tmp_path / 'ticks.csv'
+    rows = ['time,symbol,bid,ask']
+    for second in range(10):
+        rows.append(f"{1000 + second},EURUSD,{1.1 + second / 1000},{1.1002 + second / 1000}")
+        rows.append(f"{1000 + second},USDJPY,{150 + second},{150.02 + second}")
+    path.write_text('\n'.join(rows) + '\n')
+    return str(path)
+
+
+def replay(source, prices, count):
+    async def run():
+        return [await source.next_tick(prices) for _ in range(count)]
+    return asyncio.run(run())
+
+
+def prices():
+    return {'EURUSD': {}, 'USDJPY': {}}
+
+
+def test_takeover_resumes_after_the_last_published_tick(recording):
+    source = ReplayTickSource([recording], speed=0, chunksize=3)
+    quotes = prices()
+    source.sync(quotes, 1004.0)
+
+    assert replay(source, quotes, 6) == [1005.0, 1006.0, 1007.0, 1008.0, 1009.0, None]
+    assert quotes['USDJPY']['bid'] == 159.0
+
+
+def test_first_producer_starts_at_the_beginning(recording):
+    source = ReplayTickSource([recording], speed=0)
+    quotes = prices()
+    source.sync(quotes, None)
+
+    assert replay(source, quotes, 2) == [1000.0, 1001.0]
+    assert quotes['EURUSD']['bid'] == pytest.approx(1.101)
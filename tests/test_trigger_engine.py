@@ -0,0 +1,76 @@
+import pytest
+
+from trigger_engine import STOP_LOSS, TAKE_PROFIT, TriggerEngine
+
+
+def position(position_id, order_type, stop_loss=None, take_profit=None, symbol='EURUSD'):
+    return {'position_id': position_id, 'symbol': symbol, 'order_type': order_type,
+            'stop_loss': stop_loss, 'take_profit': take_profit}
+
+
+def quote(bid, spread=0.0002):
+    return {'EURUSD': {'bid': bid, 'ask': bid + spread}}
+
+
+@pytest.mark.parametrize('order_type, levels, bid, expected', [
+    # BUY : sortie au bid
+    ('buy', {'stop_loss': 1.10}, 1.1001, None),
+    ('buy', {'stop_loss': 1.10}, 1.10, (STOP_LOSS, 1.10)),
+    ('buy', {'take_profit': 1.20}, 1.1999, None),
+    ('buy', {'take_profit': 1.20}, 1.20, (TAKE_PROFIT, 1.20)),
+    # SELL : sortie à l'ask (bid + 0.0002)
+    ('sell', {'stop_loss': 1.20}, 1.1997, None),
+    ('sell', {'stop_loss': 1.20}, 1.1998, (STOP_LOSS, 1.20)),
+    ('sell', {'take_profit': 1.10}, 1.1, None),
+    ('sell', {'take_profit': 1.10}, 1.0998, (TAKE_PROFIT, 1.10)),
+])
+def test_crossing_rules_per_side(order_type, levels, bid, expected):
+    engine = TriggerEngine()
+    engine.add(position('p', order_type, **levels))
+    triggered = engine.check(quote(bid))
+    if expected is None:
+        assert triggered == [] and len(engine) == 1
+    else:
+        (position_id, reason, price), = triggered
+        assert (position_id, reason) == ('p', expected[0])
+        assert price == pytest.approx(expected[1])
+        assert len(engine) == 0
+
+
+def test_only_crossed_levels_are_popped_in_price_order():
+    engine = TriggerEngine()
+    for i, level in enumerate((1.05, 1.08, 1.10, 1.12)):
+        engine.add(position(f"p{i}", 'buy', stop_loss=level))
+    triggered = engine.check(quote(1.09))
+    assert [position_id for position_id, _, _ in triggered] == ['p3', 'p2']
+    assert engine.check(quote(1.09)) == []
+
+
+def test_position_fires_once_when_both_levels_sit_in_the_book():
+    engine = TriggerEngine()
+    engine.add(position('p', 'buy', stop_loss=1.10, take_profit=1.20))
+    assert [reason for _, reason, _ in engine.check(quote(1.25))] == [TAKE_PROFIT]
+    # Le SL restant est périmé : ignoré au prochain passage
+    assert engine.check(quote(1.0)) == []
+    assert engine.stats()['tracked'] == 0
+
+
+def test_discarded_positions_are_compacted_out_of_the_heaps():
+    engine = TriggerEngine()
+    for i in range(10):
+        engine.add(position(f"p{i}", 'buy', stop_loss=1.0 - i / 100))
+    for i in range(6):
+        engine.discard(f"p{i}")
+
+    stats = engine.stats()
+    assert stats['compactions'] == 1
+    assert stats['entries'] - stats['stale'] == stats['tracked'] == 4
+    assert [position_id for position_id, _, _ in engine.check(quote(0.5))] == ['p6', 'p7', 'p8', 'p9']
+
+
+def test_add_ignores_positions_without_levels_and_duplicates():
+    engine = TriggerEngine()
+    engine.add(position('none', 'buy'))
+    engine.add(position('p', 'buy', stop_loss=1.1))
+    engine.add(position('p', 'buy', stop_loss=1.1))
+    assert len(engine) == 1 and engine.stats()['entries'] == 1
@@ -0,0 +1,117 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from price_engine import PriceEngine, SimulatedTickSource
+
+logger = logging.getLogger(__name__)
+
+TICK_COLUMNS = ['time', 'symbol', 'bid', 'ask']
+
+
+# --- Lecture par morceaux des fichiers de ticks ---
+def _normalize(chunk: pd.DataFrame) -> pd.DataFrame:
+    chunk = chunk[TICK_COLUMNS]
+    times = chunk['time']
+    if pd.api.types.is_numeric_dtype(times):
+        seconds = times.astype(np.float64)
+    else:
+        seconds = (pd.to_datetime(times, utc=True) - pd.Timestamp(0, tz='UTC')).dt.total_seconds()
+    return chunk.assign(time=seconds)
+
+
+def iter_tick_chunks(path: str, chunksize: int = 100000) -> Iterator[pd.DataFrame]:
+    """Ticks (time, symbol, bid, ask) d'un fichier CSV ou Parquet, lus en
+    morceaux sur un fichier mappé en mémoire ; `time` en secondes epoch."""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(path, memory_map=True)
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=TICK_COLUMNS):
+            yield _normalize(batch.to_pandas())
+    else:
+        for chunk in pd.read_csv(path, chunksize=chunksize, memory_map=True):
+            yield _normalize(chunk)
+
+
+def iter_tick_groups(paths: List[str], chunksize: int = 100000, after: Optional[float] = None) -> Iterator[tuple]:
+    # Un groupe = tous les ticks partageant le même horodatage ; `after`
+    # écarte (par morceau, sans boucle Python) les ticks déjà rejoués
+    pending_time, pending = None, []
+    for path in paths:
+        for chunk in iter_tick_chunks(path, chunksize):
+            if after is not None:
+                chunk = chunk[chunk['time'] > after]
+            for tick_time, symbol, bid, ask in chunk.itertuples(index=False, name=None):
+                if pending and tick_time != pending_time:
+                    yield pending_time, pending
+                    pending = []
+                pending_time = tick_time
+                pending.append((symbol, bid, ask))
+    if pending:
+        yield pending_time, pending
+
+
+# --- Source de rejeu ---
+class ReplayTickSource:
+    """Rejoue des ticks enregistrés à la place du simulateur, via la même
+    interface (next_tick) : carnet de positions, SL/TP, bougies et flux
+    WebSocket reçoivent les ticks rejoués sans distinction.
+
+    speed = 1 (temps réel), 10, 100… ou 0 (aussi vite que possible)."""
+
+    def __init__(self, paths: List[str], speed: float = 1.0, chunksize: int = 100000):
+        self.paths = paths
+        self.speed = speed
+        self.chunksize = chunksize
+        self.tick_interval = 0.0
+        self._groups = iter_tick_groups(paths, chunksize)
+        self._first_tick: Optional[float] = None
+        self._started: Optional[float] = None
+        self._unknown = set()
+
+    def sync(self, prices: Dict[str, dict], tick_time: Optional[float]):
+        # Relève de producteur : le rejeu reprend après le dernier tick publié,
+        # au même rythme (le prochain tick part de cet horodatage)
+        if tick_time is None:
+            return
+        self._groups = iter_tick_groups(self.paths, self.chunksize, after=tick_time)
+        self._first_tick, self._started = tick_time, time.monotonic()
+
+    async def next_tick(self, prices: Dict[str, dict]) -> Optional[float]:
+        group = next(self._groups, None)
+        if group is None:
+            return None
+        tick_time, quotes = group
+        if self._first_tick is None:
+            self._first_tick, self._started = tick_time, time.monotonic()
+        if self.speed > 0:
+            target = self._started + (tick_time - self._first_tick) / self.speed
+            await asyncio.sleep(max(0.0, target - time.monotonic()))
+        else:
+            await asyncio.sleep(0)
+        for symbol, bid, ask in quotes:
+            price = prices.get(symbol)
+            if price is None:
+                if symbol not in self._unknown:
+                    self._unknown.add(symbol)
+                    logger.warning("Symbole %s absent de la table, ticks ignorés", symbol)
+                continue
+            price['bid'], price['ask'], price['base'] = float(bid), float(ask), (float(bid) + float(ask)) / 2
+        return float(tick_time)
+
+
+def tick_source_from_env(engine: PriceEngine):
+    """PRICE_SOURCE=simulation (défaut) ou replay:fichier1.parquet,fichier2.csv ;
+    PRICE_REPLAY_SPEED=1|10|100|max."""
+    source = os.environ.get('PRICE_SOURCE', 'simulation')
+    if not source.startswith('replay:'):
+        return SimulatedTickSource(engine)
+    paths = [path for path in source[len('replay:'):].split(',') if path]
+    speed = os.environ.get('PRICE_REPLAY_SPEED', '1')
+    return ReplayTickSource(paths, speed=0.0 if speed == 'max' else float(speed))
@@ -0,0 +1,117 @@
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+async def ensure_tick_collection(db, name: str = 'ticks'):
+    # Collection time-series : métadonnée = symbole, granularité à la seconde
+    try:
+        await db.create_collection(
+            name,
+            timeseries={'timeField': 'time', 'metaField': 'symbol', 'granularity': 'seconds'},
+        )
+    except CollectionInvalid:
+        pass
+
+
+# --- Écriture différée des ticks ---
+class TickWriter:
+    """Les ticks sont déposés sans attente dans une file bornée ; une tâche de
+    fond les écrit par insert_many, par lots de `batch_size` ou toutes les
+    `flush_interval` secondes. File pleine : le tick le plus ancien est
+    abandonné (et compté) plutôt que de ralentir la génération des prix."""
+
+    def __init__(self, collection, batch_size: int = 1000, flush_interval: float = 0.5, max_queue: int = 100000):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Optional[asyncio.Future] = None
+        self._batch: List[dict] = []
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.last_flush_ms: Optional[float] = None
+
+    def put(self, prices: Dict[str, dict], ts: float):
+        tick_time = datetime.fromtimestamp(ts, tz=timezone.utc)
+        for symbol, price in prices.items():
+            if self.queue.full():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait({'time': tick_time, 'symbol': symbol, 'bid': price['bid'], 'ask': price['ask']})
+            self.enqueued += 1
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _next_batch(self) -> List[dict]:
+        # Le lot en cours reste visible dans self._batch pour le flush final
+        self._batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(self._batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                self._batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        batch, self._batch = self._batch, []
+        return batch
+
+    async def _write(self, batch: List[dict]):
+        started = time.perf_counter()
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+            self.written += len(batch)
+        except PyMongoError as exc:
+            self.failed += len(batch)
+            logger.error("Écriture de %d ticks impossible : %s", len(batch), exc)
+        self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            # Protégé de l'annulation : un lot parti en base va jusqu'au bout
+            self._inflight = asyncio.ensure_future(self._write(batch))
+            await asyncio.shield(self._inflight)
+
+    async def stop(self):
+        """Arrêt : annule la boucle, attend le lot en vol puis vide le lot
+        partiel et la file."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._inflight is not None:
+            await self._inflight
+            self._inflight = None
+        pending, self._batch = self._batch, []
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        for start in range(0, len(pending), self.batch_size):
+            await self._write(pending[start:start + self.batch_size])
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "max_queue": self.queue.maxsize,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "last_flush_ms": self.last_flush_ms,
+        }
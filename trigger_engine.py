@@ -0,0 +1,117 @@
+import heapq
+from typing import Dict, List, Tuple
+
+
+STOP_LOSS = 'Stop Loss'
+TAKE_PROFIT = 'Take Profit'
+
+
+def close_price_for(order_type: str, price: dict) -> float:
+    # Une position BUY se ferme au bid, une position SELL à l'ask
+    return price['bid'] if order_type == 'buy' else price['ask']
+
+
+# --- Moteur de déclenchement SL/TP ---
+class TriggerEngine:
+    """Niveaux SL/TP rangés dans des tas triés par prix, par symbole et par
+    sens. À chaque tick on ne dépile que les niveaux franchis : O(k log n)
+    pour k positions déclenchées.
+
+    Sens BUY  (prix de sortie = bid) : SL déclenché si bid <= SL (tas max),
+                                       TP déclenché si bid >= TP (tas min).
+    Sens SELL (prix de sortie = ask) : SL déclenché si ask >= SL (tas min),
+                                       TP déclenché si ask <= TP (tas max).
+    Les suppressions sont paresseuses : une entrée dont la position n'est
+    plus suivie est ignorée au moment où elle remonte en tête de tas. Un tas
+    est reconstruit dès que ses entrées périmées (niveaux lointains de
+    positions fermées à la main) dépassent ses entrées vivantes."""
+
+    def __init__(self):
+        # (symbol, order_type, reason) -> tas de (clé, position_id)
+        self._heaps: Dict[Tuple[str, str, str], List[Tuple[float, str]]] = {}
+        # position_id -> tas où figurent ses niveaux
+        self._live: Dict[str, Tuple[Tuple[str, str, str], ...]] = {}
+        self._stale: Dict[Tuple[str, str, str], int] = {}
+        self.compactions = 0
+
+    def __len__(self):
+        return len(self._live)
+
+    @staticmethod
+    def _is_max_heap(order_type: str, reason: str) -> bool:
+        return (order_type == 'buy') == (reason == STOP_LOSS)
+
+    def _push(self, symbol: str, order_type: str, reason: str, level: float, position_id: str):
+        key = (symbol, order_type, reason)
+        sort_key = -level if self._is_max_heap(order_type, reason) else level
+        heapq.heappush(self._heaps.setdefault(key, []), (sort_key, position_id))
+        return key
+
+    def add(self, position: dict):
+        stop_loss, take_profit = position.get('stop_loss'), position.get('take_profit')
+        position_id = position['position_id']
+        if (not stop_loss and not take_profit) or position_id in self._live:
+            return
+        keys = []
+        if stop_loss:
+            keys.append(self._push(position['symbol'], position['order_type'], STOP_LOSS, stop_loss, position_id))
+        if take_profit:
+            keys.append(self._push(position['symbol'], position['order_type'], TAKE_PROFIT, take_profit, position_id))
+        self._live[position_id] = tuple(keys)
+
+    def clear(self):
+        self._heaps.clear()
+        self._live.clear()
+        self._stale.clear()
+
+    def discard(self, position_id: str):
+        self._retire(position_id)
+
+    def _retire(self, position_id: str, popped=None):
+        # Les entrées restées dans les autres tas deviennent périmées
+        for key in self._live.pop(position_id, ()):
+            if key != popped:
+                self._mark_stale(key)
+
+    def _mark_stale(self, key: Tuple[str, str, str]):
+        heap = self._heaps[key]
+        stale = self._stale[key] = self._stale.get(key, 0) + 1
+        if stale > len(heap) - stale:
+            heap[:] = [entry for entry in heap if entry[1] in self._live]
+            heapq.heapify(heap)
+            self._stale[key] = 0
+            self.compactions += 1
+
+    def check(self, prices: Dict[str, dict]) -> List[Tuple[str, str, float]]:
+        """Retourne [(position_id, close_reason, close_price)] pour les niveaux
+        franchis et cesse de suivre les positions concernées."""
+        triggered = []
+        for key, heap in self._heaps.items():
+            symbol, order_type, reason = key
+            price = prices.get(symbol)
+            if price is None:
+                continue
+            exit_price = close_price_for(order_type, price)
+            max_heap = self._is_max_heap(order_type, reason)
+            while heap:
+                sort_key, position_id = heap[0]
+                if position_id not in self._live:
+                    heapq.heappop(heap)
+                    self._stale[key] = max(0, self._stale.get(key, 0) - 1)
+                    continue
+                level = -sort_key if max_heap else sort_key
+                crossed = exit_price <= level if max_heap else exit_price >= level
+                if not crossed:
+                    break
+                heapq.heappop(heap)
+                self._retire(position_id, popped=key)
+                triggered.append((position_id, reason, exit_price))
+        return triggered
+
+    def stats(self) -> dict:
+        return {
+            "tracked": len(self._live),
+            "entries": sum(len(heap) for heap in self._heaps.values()),
+            "stale": sum(self._stale.values()),
+            "compactions": self.compactions,
+        }
@@ -0,0 +1,90 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from jose import jwt
+
+
+# --- Cache LRU borné avec expiration ---
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at = entry
+        if expires_at <= self.clock():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        self._data[key] = (value, self.clock() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+# --- Utilisateurs et jetons authentifiés ---
+# Cache propre à chaque processus (un par worker uvicorn), sans invalidation :
+# USER_CACHE_TTL est la seule borne du délai avant qu'une modification du
+# document utilisateur (ex. is_active à False) soit vue par tous les workers.
+user_cache = TTLCache(
+    maxsize=int(os.environ.get("USER_CACHE_SIZE", 10000)),
+    ttl=float(os.environ.get("USER_CACHE_TTL", 30)),
+)
+token_cache = TTLCache(
+    maxsize=int(os.environ.get("TOKEN_CACHE_SIZE", 10000)),
+    ttl=float(os.environ.get("TOKEN_CACHE_TTL", 300)),
+)
+
+
+def decode_token(token: str, secret_key: str, algorithm: str) -> dict:
+    """Décode un JWT en réutilisant les claims déjà vérifiés ; l'entrée
+    n'est jamais conservée au-delà de l'expiration (exp) du jeton.
+    Lève JWTError comme jwt.decode."""
+    claims = token_cache.get(token)
+    if claims is not None:
+        return claims
+    claims = jwt.decode(token, secret_key, algorithms=[algorithm])
+    ttl = None
+    if claims.get("exp") is not None:
+        ttl = claims["exp"] - time.time()
+    token_cache.set(token, claims, ttl)
+    return claims
+
+
+async def get_user_by_id(db, user_id: str) -> Optional[dict]:
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await db.users.find_one({"user_id": user_id})
+        if user is not None:
+            user_cache.set(user_id, user)
+    return user